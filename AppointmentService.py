@@ -1,43 +1,79 @@
 from flask import Flask, jsonify, request
 import logging
-import mysql.connector
 from mysql.connector import Error
+from db import get_db_connection, pooled_cursor, pool_stats, fk_not_found, duplicate_key
+from entity_cache import get_customer, get_trainer, cache_stats
+from validation import APPOINTMENT_FIELDS, APPOINTMENT_FOREIGN_KEYS, missing_fields, validate_batch, coerce_ids, appointment_filters
+from bulk import read_batch, fetch_existing, insert_rows
+import availability
+import revenue_rollups
+from group_commit import GroupCommitBuffer, GROUP_COMMIT_ENABLED
+from availability import get_index, parse_date, slot_taken_message
+from pagination import parse_page_args, wants_stream, keyset_query, keyset_page, stream_ndjson
+import serialization
+import metrics
+import logging_setup
+import slow_queries
+from coalesce import SingleFlight
+from etag import entity_etag, list_etag, is_fresh, not_modified, bump_versions
 from datetime import datetime
 
 app = Flask(__name__)
+serialization.init_app(app)
+metrics.init_app(app, "appointment")
 
-logging.basicConfig(level=logging.DEBUG)
+logging_setup.init_app(app, "appointment")
 logger = logging.getLogger(__name__)
 
-def get_db_connection():
-    return mysql.connector.connect(
-        host="localhost",
-        user="root",
-        password="",
-        database="gym"
-    )
+# Used by POST /appointments when GROUP_COMMIT is set
+appointment_buffer = GroupCommitBuffer("appointments", APPOINTMENT_FIELDS, after_insert=revenue_rollups.add_sessions)
+
+customer_appointment_reads = SingleFlight("customer_appointments")
+trainer_appointment_reads = SingleFlight("trainer_appointments")
+
+APPOINTMENTS_QUERY = """
+    SELECT a.*, c.name as customer_name, t.name as trainer_name 
+    FROM appointments a
+    LEFT JOIN customer c ON a.customer_id = c.customer_id
+    LEFT JOIN trainer t ON a.trainer_id = t.trainer_id
+"""
 
 @app.route('/appointments', methods=['GET'])
 def get_appointments():
-    """Get all appointments"""
+    """Get all appointments, optionally filtered, paginated or streamed"""
+    try:
+        limit, after = parse_page_args(request.args)
+        conditions, params = appointment_filters(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    if wants_stream(request.args):
+        return stream_ndjson(*keyset_query(APPOINTMENTS_QUERY, "a.appointment_id", after, conditions=conditions, params=params))
+    
+    conn = None
+    cursor = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
-        cursor.execute("""
-            SELECT a.*, c.name as customer_name, t.name as trainer_name 
-            FROM appointments a
-            LEFT JOIN customer c ON a.customer_id = c.customer_id
-            LEFT JOIN trainer t ON a.trainer_id = t.trainer_id
-        """)
-        appointments = cursor.fetchall()
-        
-        for appointment in appointments:
-            if 'booking_date' in appointment and appointment['booking_date']:
-                appointment['booking_date'] = appointment['booking_date'].isoformat()
         
-        return jsonify(appointments)
+        etag = list_etag(cursor, "appointment")
+        if is_fresh(request, etag):
+            return not_modified(etag)
+        
+        if limit is not None:
+            page = keyset_page(
+                cursor, APPOINTMENTS_QUERY, "a.appointment_id", "appointment_id", limit, after, conditions, params
+            )
+        elif conditions:
+            cursor.execute(*keyset_query(APPOINTMENTS_QUERY, "a.appointment_id", conditions=conditions, params=params))
+            page = cursor.fetchall()
+        else:
+            cursor.execute(APPOINTMENTS_QUERY)
+            page = cursor.fetchall()
+        
+        return jsonify(page), 200, {"ETag": etag}
     except Error as e:
-        logger.error(f"Database error: {e}")
+        logger.error("Database error: %s", e)
         return jsonify({"error": str(e)}), 500
     finally:
         if cursor:
@@ -48,9 +84,19 @@ def get_appointments():
 @app.route('/appointments/<int:id>', methods=['GET'])
 def get_appointment(id):
     """Get appointment by ID with customer and trainer details"""
+    conn = None
+    cursor = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
+        
+        # A version lookup by primary key decides 304 before the full query
+        etag = entity_etag(cursor, "appointment", id)
+        if etag is None:
+            return jsonify({"error": f"Appointment with ID {id} not found"}), 404
+        if is_fresh(request, etag):
+            return not_modified(etag)
+        
         cursor.execute("""
             SELECT a.*, c.name as customer_name, t.name as trainer_name 
             FROM appointments a
@@ -61,15 +107,12 @@ def get_appointment(id):
         appointment = cursor.fetchone()
         
         if not appointment:
-            logger.warning(f"Appointment with ID {id} not found")
+            logger.warning("Appointment with ID %s not found", id)
             return jsonify({"error": f"Appointment with ID {id} not found"}), 404
         
-        if 'booking_date' in appointment and appointment['booking_date']:
-            appointment['booking_date'] = appointment['booking_date'].isoformat()
-        
-        return jsonify(appointment)
+        return jsonify(appointment), 200, {"ETag": etag}
     except Error as e:
-        logger.error(f"Database error: {e}")
+        logger.error("Database error: %s", e)
         return jsonify({"error": str(e)}), 500
     finally:
         if cursor:
@@ -81,33 +124,27 @@ def get_appointment(id):
 def create_appointment():
     """Create a new appointment"""
     data = request.json
-    logger.debug(f"Received POST data: {data}")
 
-    required_fields = ['customer_id', 'trainer_id', 'booking_date', 'status']
-    missing_fields = [field for field in required_fields if field not in data]
+    missing = missing_fields(data, APPOINTMENT_FIELDS) if data else []
     
-    if not data or missing_fields:
-        error_message = f"Missing required fields: {', '.join(missing_fields)}" if missing_fields else "No data provided"
+    if not data or missing:
+        error_message = f"Missing required fields: {', '.join(missing)}" if missing else "No data provided"
         logger.error(error_message)
         return jsonify({"error": error_message}), 400
 
+    conn = None
+    cursor = None
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT customer_id FROM customer WHERE customer_id = %s", (data['customer_id'],))
-        if not cursor.fetchone():
-            return jsonify({"error": f"Customer with ID {data['customer_id']} not found"}), 404
-        
-        cursor.execute("SELECT trainer_id FROM trainer WHERE trainer_id = %s", (data['trainer_id'],))
-        if not cursor.fetchone():
-            return jsonify({"error": f"Trainer with ID {data['trainer_id']} not found"}), 404
-        
-        insert_query = """
-        INSERT INTO appointments (
-            customer_id, trainer_id, booking_date, status
-        ) VALUES (%s, %s, %s, %s)
-        """
+        # O(1) clash check against the in-memory slot index; a hit may be
+        # stale, so it is confirmed on the unique slot key, and concurrent
+        # bookings that both pass are stopped by that key
+        slot = (data['trainer_id'], data['booking_date'])
+        if availability.is_active(data['status']) and get_index().booking_for(*slot):
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            if availability.taken_slots(cursor, [slot]):
+                availability.index.count_conflict()
+                return jsonify({"error": slot_taken_message(*slot)}), 409
         
         values = (
             data['customer_id'],
@@ -116,29 +153,156 @@ def create_appointment():
             data['status']
         )
         
-        cursor.execute(insert_query, values)
-        conn.commit()
-        appointment_id = cursor.lastrowid
-        logger.info(f"Created appointment ID: {appointment_id}")
+        if GROUP_COMMIT_ENABLED:
+            # Written together with concurrent bookings by the group-commit
+            # flusher; no pooled connection is held while waiting, since the
+            # flusher needs one too
+            if conn is not None:
+                cursor.close()
+                conn.close()
+                cursor = conn = None
+            appointment_id = appointment_buffer.submit(values)
+        else:
+            if conn is None:
+                conn = get_db_connection()
+                cursor = conn.cursor()
+            
+            insert_query = """
+            INSERT INTO appointments (
+                customer_id, trainer_id, booking_date, status
+            ) VALUES (%s, %s, %s, %s)
+            """
+            
+            # The FK constraints replace the customer and trainer existence SELECTs
+            cursor.execute(insert_query, values)
+            appointment_id = cursor.lastrowid
+            revenue_rollups.add_sessions(cursor, [appointment_id])
+            bump_versions(cursor, "appointments")
+            conn.commit()
+        
+        availability.index.record(appointment_id, data['trainer_id'], data['booking_date'], data['status'])
+        logger.info("Created appointment ID: %s", appointment_id)
+        
+        # Build the response from the request plus cached names instead of
+        # re-selecting the three-table join
+        customer = get_customer(data['customer_id'], conn)
+        trainer = get_trainer(data['trainer_id'], conn)
+        
+        new_appointment = {
+            "appointment_id": appointment_id,
+            "customer_id": data['customer_id'],
+            "trainer_id": data['trainer_id'],
+            "booking_date": data['booking_date'],
+            "billing_id": None,
+            "status": data['status'],
+            "customer_name": customer['name'] if customer else None,
+            "trainer_name": trainer['name'] if trainer else None
+        }
         
+        return jsonify(new_appointment), 201
+    
+    except Error as e:
+        not_found = fk_not_found(e, data, APPOINTMENT_FOREIGN_KEYS)
+        if not_found:
+            return jsonify({"error": not_found}), 404
+        if duplicate_key(e) == availability.SLOT_KEY:
+            availability.index.count_conflict()
+            return jsonify({"error": slot_taken_message(data.get('trainer_id'), data.get('booking_date'))}), 409
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+@app.route('/appointments/bulk', methods=['POST'])
+def create_appointments_bulk():
+    """Create many appointments in one transaction"""
+    items, error = read_batch(request.json)
+    if error:
+        return jsonify({"error": error}), 400
+    
+    errors = validate_batch(items, APPOINTMENT_FIELDS)
+    if errors:
+        return jsonify({"error": f"Batch rejected: {len(errors)} invalid item(s)", "errors": errors}), 400
+    
+    # IDs are compared with the int keys of the lookups below, and dates are
+    # normalized so an unparseable one is a 400 rather than a failed INSERT
+    errors = coerce_ids(items, ['customer_id', 'trainer_id'])
+    for index, item in enumerate(items):
+        booking_date = parse_date(item['booking_date'])
+        if booking_date is None:
+            errors.append({"index": index, "error": "booking_date must be a date in YYYY-MM-DD format"})
+        else:
+            item['booking_date'] = booking_date.isoformat()
+    if errors:
+        errors.sort(key=lambda error: error["index"])
+        return jsonify({"error": f"Batch rejected: {len(errors)} invalid item(s)", "errors": errors}), 400
+    
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
-        cursor.execute("""
-            SELECT a.*, c.name as customer_name, t.name as trainer_name 
-            FROM appointments a
-            LEFT JOIN customer c ON a.customer_id = c.customer_id
-            LEFT JOIN trainer t ON a.trainer_id = t.trainer_id
-            WHERE a.appointment_id = %s
-        """, (appointment_id,))
-        
-        new_appointment = cursor.fetchone()
         
-        if 'booking_date' in new_appointment and new_appointment['booking_date']:
-            new_appointment['booking_date'] = new_appointment['booking_date'].isoformat()
+        # One IN query per referenced table instead of two SELECTs per item
+        customers = fetch_existing(cursor, "customer", "customer_id", [item['customer_id'] for item in items], ["name"])
+        trainers = fetch_existing(cursor, "trainer", "trainer_id", [item['trainer_id'] for item in items], ["name"])
         
-        return jsonify(new_appointment), 201
+        # Slots are checked against the index (hits confirmed on the unique
+        # slot key) and against earlier items of the batch
+        get_index(conn)
+        taken = availability.taken_slots(
+            cursor, [(item['trainer_id'], item['booking_date']) for item in items if availability.is_active(item['status'])]
+        )
+        batch_slots = set()
+        
+        for index, item in enumerate(items):
+            slot = (item['trainer_id'], parse_date(item['booking_date']))
+            if item['customer_id'] not in customers:
+                errors.append({"index": index, "error": f"Customer with ID {item['customer_id']} not found"})
+            elif item['trainer_id'] not in trainers:
+                errors.append({"index": index, "error": f"Trainer with ID {item['trainer_id']} not found"})
+            elif availability.is_active(item['status']) and (slot in batch_slots or slot in taken):
+                errors.append({"index": index, "error": slot_taken_message(item['trainer_id'], item['booking_date'])})
+            elif availability.is_active(item['status']):
+                batch_slots.add(slot)
+        
+        if errors:
+            return jsonify({"error": f"Batch rejected: {len(errors)} invalid item(s)", "errors": errors}), 400
+        
+        rows = [tuple(item[field] for field in APPOINTMENT_FIELDS) for item in items]
+        appointment_ids = insert_rows(cursor, "appointments", APPOINTMENT_FIELDS, rows)
+        revenue_rollups.add_sessions(cursor, appointment_ids)
+        bump_versions(cursor, "appointments")
+        conn.commit()
+        for item, appointment_id in zip(items, appointment_ids):
+            availability.index.record(appointment_id, item['trainer_id'], item['booking_date'], item['status'])
+        
+        logger.info("Created %s appointments in bulk", len(appointment_ids))
+        
+        results = [
+            {
+                "index": index,
+                "appointment_id": appointment_id,
+                "customer_id": item['customer_id'],
+                "customer_name": customers[item['customer_id']]['name'],
+                "trainer_id": item['trainer_id'],
+                "trainer_name": trainers[item['trainer_id']]['name'],
+                "booking_date": item['booking_date'],
+                "billing_id": None,
+                "status": item['status']
+            }
+            for index, (item, appointment_id) in enumerate(zip(items, appointment_ids))
+        ]
+        return jsonify({"created": len(results), "results": results}), 201
     
     except Error as e:
-        logger.error(f"Database error: {e}")
+        if duplicate_key(e) == availability.SLOT_KEY:
+            availability.index.count_conflict()
+            return jsonify({"error": "Batch rejected: a trainer slot was booked concurrently"}), 409
+        logger.error("Database error: %s", e)
         return jsonify({"error": str(e)}), 500
     finally:
         if cursor:
@@ -153,13 +317,11 @@ def update_appointment(id):
     if not data:
         return jsonify({"error": "No data provided"}), 400
     
+    conn = None
+    cursor = None
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT appointment_id FROM appointments WHERE appointment_id = %s", (id,))
-        if not cursor.fetchone():
-            return jsonify({"error": f"Appointment with ID {id} not found"}), 404
+        cursor = conn.cursor(dictionary=True)
         
         update_fields = []
         values = []
@@ -182,28 +344,36 @@ def update_appointment(id):
         
         values.append(id)
         
+        # The matched-row count doubles as the existence check
         update_query = f"UPDATE appointments SET {', '.join(update_fields)} WHERE appointment_id = %s"
+        # Session counts depend on the status and on who is booked
+        counted = any(field in data for field in revenue_rollups.SESSION_FIELDS)
+        if counted:
+            revenue_rollups.apply(cursor, revenue_rollups.session_statement([id], -1))
         cursor.execute(update_query, values)
-        conn.commit()
-        
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("""
-            SELECT a.*, c.name as customer_name, t.name as trainer_name 
-            FROM appointments a
-            LEFT JOIN customer c ON a.customer_id = c.customer_id
-            LEFT JOIN trainer t ON a.trainer_id = t.trainer_id
-            WHERE a.appointment_id = %s
-        """, (id,))
+        if cursor.rowcount == 0:
+            return jsonify({"error": f"Appointment with ID {id} not found"}), 404
+        if counted:
+            revenue_rollups.apply(cursor, revenue_rollups.session_statement([id], 1))
         
+        cursor.execute(APPOINTMENTS_QUERY + " WHERE a.appointment_id = %s", (id,))
         updated_appointment = cursor.fetchone()
-        
-        if 'booking_date' in updated_appointment and updated_appointment['booking_date']:
-            updated_appointment['booking_date'] = updated_appointment['booking_date'].isoformat()
+        bump_versions(cursor, "appointments")
+        conn.commit()
+        availability.index.record(
+            id, updated_appointment['trainer_id'], updated_appointment['booking_date'], updated_appointment['status']
+        )
         
         return jsonify(updated_appointment)
     
     except Error as e:
-        logger.error(f"Database error: {e}")
+        not_found = fk_not_found(e, data, APPOINTMENT_FOREIGN_KEYS)
+        if not_found:
+            return jsonify({"error": not_found}), 404
+        if duplicate_key(e) == availability.SLOT_KEY:
+            availability.index.count_conflict()
+            return jsonify({"error": slot_taken_message(data.get('trainer_id'), data.get('booking_date'))}), 409
+        logger.error("Database error: %s", e)
         return jsonify({"error": str(e)}), 500
     finally:
         if cursor:
@@ -214,21 +384,25 @@ def update_appointment(id):
 @app.route('/appointments/<int:id>', methods=['DELETE'])
 def delete_appointment(id):
     """Delete an appointment by ID"""
+    conn = None
+    cursor = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        cursor.execute("SELECT appointment_id FROM appointments WHERE appointment_id = %s", (id,))
-        if not cursor.fetchone():
+        revenue_rollups.apply(cursor, revenue_rollups.session_statement([id], -1))
+        cursor.execute("DELETE FROM appointments WHERE appointment_id = %s", (id,))
+        if cursor.rowcount == 0:
             return jsonify({"error": f"Appointment with ID {id} not found"}), 404
         
-        cursor.execute("DELETE FROM appointments WHERE appointment_id = %s", (id,))
+        bump_versions(cursor, "appointments")
         conn.commit()
+        availability.index.discard(id)
         
         return jsonify({"message": f"Appointment with ID {id} successfully deleted"})
     
     except Error as e:
-        logger.error(f"Database error: {e}")
+        logger.error("Database error: %s", e)
         return jsonify({"error": str(e)}), 500
     finally:
         if cursor:
@@ -238,71 +412,108 @@ def delete_appointment(id):
 
 @app.route('/appointments/customer/<int:customer_id>', methods=['GET'])
 def get_customer_appointments(customer_id):
-    """Get all appointments for a specific customer"""
+    """Get appointments for a specific customer, optionally filtered by date range and status"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
-        cursor.execute("SELECT customer_id FROM customer WHERE customer_id = %s", (customer_id,))
-        if not cursor.fetchone():
+        conditions, params = appointment_filters(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    # Served by the (customer_id, booking_date) index as a range scan
+    conditions = ["a.customer_id = %s", *conditions]
+    
+    def fetch():
+        # Only the request running the query holds a connection
+        with pooled_cursor(dictionary=True) as cursor:
+            cursor.execute("SELECT customer_id FROM customer WHERE customer_id = %s", (customer_id,))
+            if not cursor.fetchone():
+                return None
+            cursor.execute(f"""
+                SELECT a.*, t.name as trainer_name 
+                FROM appointments a
+                LEFT JOIN trainer t ON a.trainer_id = t.trainer_id
+                WHERE {' AND '.join(conditions)}
+                ORDER BY a.booking_date, a.appointment_id
+            """, (customer_id, *params))
+            return cursor.fetchall()
+    
+    try:
+        # The table versions are part of the key, so a shared or cached
+        # result never predates a committed write
+        with pooled_cursor(dictionary=True) as cursor:
+            version = list_etag(cursor, "appointment")
+        
+        # Clients polling the same schedule at once share one query
+        appointments = customer_appointment_reads.do((version, customer_id, tuple(conditions), tuple(params)), fetch)
+        if appointments is None:
             return jsonify({"error": f"Customer with ID {customer_id} not found"}), 404
         
-        cursor.execute("""
-            SELECT a.*, t.name as trainer_name 
-            FROM appointments a
-            LEFT JOIN trainer t ON a.trainer_id = t.trainer_id
-            WHERE a.customer_id = %s
-        """, (customer_id,))
-        
-        appointments = cursor.fetchall()
-        
-        for appointment in appointments:
-            if 'booking_date' in appointment and appointment['booking_date']:
-                appointment['booking_date'] = appointment['booking_date'].isoformat()
-        
         return jsonify(appointments)
     except Error as e:
-        logger.error(f"Database error: {e}")
+        logger.error("Database error: %s", e)
         return jsonify({"error": str(e)}), 500
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
 
 @app.route('/appointments/trainer/<int:trainer_id>', methods=['GET'])
 def get_trainer_appointments(trainer_id):
-    """Get all appointments for a specific trainer"""
+    """Get appointments for a specific trainer, optionally filtered by date range and status"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
-        cursor.execute("SELECT trainer_id FROM trainer WHERE trainer_id = %s", (trainer_id,))
-        if not cursor.fetchone():
+        conditions, params = appointment_filters(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    # Served by the (trainer_id, booking_date) index as a range scan
+    conditions = ["a.trainer_id = %s", *conditions]
+    
+    def fetch():
+        # Only the request running the query holds a connection
+        with pooled_cursor(dictionary=True) as cursor:
+            cursor.execute("SELECT trainer_id FROM trainer WHERE trainer_id = %s", (trainer_id,))
+            if not cursor.fetchone():
+                return None
+            cursor.execute(f"""
+                SELECT a.*, c.name as customer_name 
+                FROM appointments a
+                LEFT JOIN customer c ON a.customer_id = c.customer_id
+                WHERE {' AND '.join(conditions)}
+                ORDER BY a.booking_date, a.appointment_id
+            """, (trainer_id, *params))
+            return cursor.fetchall()
+    
+    try:
+        # The table versions are part of the key, so a shared or cached
+        # result never predates a committed write
+        with pooled_cursor(dictionary=True) as cursor:
+            version = list_etag(cursor, "appointment")
+        
+        # Clients polling the same schedule at once share one query
+        appointments = trainer_appointment_reads.do((version, trainer_id, tuple(conditions), tuple(params)), fetch)
+        if appointments is None:
             return jsonify({"error": f"Trainer with ID {trainer_id} not found"}), 404
         
-        cursor.execute("""
-            SELECT a.*, c.name as customer_name 
-            FROM appointments a
-            LEFT JOIN customer c ON a.customer_id = c.customer_id
-            WHERE a.trainer_id = %s
-        """, (trainer_id,))
-        
-        appointments = cursor.fetchall()
-        
-        for appointment in appointments:
-            if 'booking_date' in appointment and appointment['booking_date']:
-                appointment['booking_date'] = appointment['booking_date'].isoformat()
-        
         return jsonify(appointments)
     except Error as e:
-        logger.error(f"Database error: {e}")
+        logger.error("Database error: %s", e)
         return jsonify({"error": str(e)}), 500
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
+
+@app.route('/appointments/group-commit/stats', methods=['GET'])
+def get_group_commit_stats():
+    """Get group-commit batch sizes and flush/wait latency for this process"""
+    return jsonify(appointment_buffer.stats())
+
+@app.route('/pool/stats', methods=['GET'])
+def get_pool_stats():
+    """Get database connection pool statistics for this process"""
+    return jsonify(pool_stats())
+
+@app.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """Get entity cache hit/miss counters for this process"""
+    return jsonify(cache_stats())
+
+@app.route('/slow-queries', methods=['GET'])
+def get_slow_queries():
+    """Get the most recent slow queries logged by this process"""
+    limit = request.args.get('limit', type=int)
+    return jsonify(slow_queries.recent(limit))
 
 if __name__ == '__main__':
     app.run(port=5002, debug=True)
\ No newline at end of file
@@ -0,0 +1,474 @@
+from quart import Quart, Response, jsonify, request
+import logging
+from async_db import Error, DictCursor, get_db_connection, release, pooled_cursor, pool_stats, ndjson_lines, get_customer, get_trainer, get_availability, taken_slots, entity_etag, list_etag, bump_versions, fetch_existing, insert_rows, AsyncGroupCommitBuffer
+from entity_cache import cache_stats
+from validation import APPOINTMENT_FIELDS, APPOINTMENT_FOREIGN_KEYS, missing_fields, validate_batch, coerce_ids, appointment_filters
+from bulk import read_batch
+from db import fk_not_found, duplicate_key
+import availability
+import revenue_rollups
+from group_commit import GROUP_COMMIT_ENABLED
+from availability import parse_date, slot_taken_message
+from pagination import parse_page_args, wants_stream, keyset_query, build_page
+import serialization
+import metrics
+import logging_setup
+import slow_queries
+from coalesce import AsyncSingleFlight
+from etag import is_fresh, not_modified
+
+app = Quart(__name__)
+serialization.init_app(app)
+metrics.init_app(app, "appointment")
+
+logging_setup.init_app(app, "appointment")
+logger = logging.getLogger(__name__)
+
+async def add_sessions(cursor, appointment_ids):
+    await cursor.execute(*revenue_rollups.session_statement(appointment_ids, 1))
+
+# Used by POST /appointments when GROUP_COMMIT is set
+appointment_buffer = AsyncGroupCommitBuffer("appointments", APPOINTMENT_FIELDS, after_insert=add_sessions)
+
+customer_appointment_reads = AsyncSingleFlight("customer_appointments")
+trainer_appointment_reads = AsyncSingleFlight("trainer_appointments")
+
+APPOINTMENTS_QUERY = """
+    SELECT a.*, c.name as customer_name, t.name as trainer_name
+    FROM appointments a
+    LEFT JOIN customer c ON a.customer_id = c.customer_id
+    LEFT JOIN trainer t ON a.trainer_id = t.trainer_id
+"""
+
+@app.route('/appointments', methods=['GET'])
+async def get_appointments():
+    """Get all appointments, optionally filtered, paginated or streamed"""
+    try:
+        limit, after = parse_page_args(request.args)
+        conditions, params = appointment_filters(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if wants_stream(request.args):
+        query, params = keyset_query(APPOINTMENTS_QUERY, "a.appointment_id", after, conditions=conditions, params=params)
+        return Response(ndjson_lines(query, params), mimetype='application/x-ndjson')
+
+    conn = None
+    try:
+        conn = await get_db_connection()
+        async with conn.cursor(DictCursor) as cursor:
+            etag = await list_etag(cursor, "appointment")
+            if is_fresh(request, etag):
+                return not_modified(etag)
+
+            if limit is not None:
+                query, params = keyset_query(APPOINTMENTS_QUERY, "a.appointment_id", after, limit + 1, conditions, params)
+                await cursor.execute(query, params)
+                return jsonify(build_page(await cursor.fetchall(), "appointment_id", limit)), 200, {"ETag": etag}
+
+            if conditions:
+                await cursor.execute(*keyset_query(APPOINTMENTS_QUERY, "a.appointment_id", conditions=conditions, params=params))
+                return jsonify(await cursor.fetchall()), 200, {"ETag": etag}
+
+            await cursor.execute(APPOINTMENTS_QUERY)
+            appointments = await cursor.fetchall()
+            return jsonify(appointments), 200, {"ETag": etag}
+    except Error as e:
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn:
+            await release(conn)
+
+@app.route('/appointments/<int:id>', methods=['GET'])
+async def get_appointment(id):
+    """Get appointment by ID with customer and trainer details"""
+    conn = None
+    try:
+        conn = await get_db_connection()
+        async with conn.cursor(DictCursor) as cursor:
+            # A version lookup by primary key decides 304 before the full query
+            etag = await entity_etag(cursor, "appointment", id)
+            if etag is None:
+                return jsonify({"error": f"Appointment with ID {id} not found"}), 404
+            if is_fresh(request, etag):
+                return not_modified(etag)
+
+            await cursor.execute(APPOINTMENTS_QUERY + " WHERE a.appointment_id = %s", (id,))
+            appointment = await cursor.fetchone()
+
+        if not appointment:
+            logger.warning("Appointment with ID %s not found", id)
+            return jsonify({"error": f"Appointment with ID {id} not found"}), 404
+
+        return jsonify(appointment), 200, {"ETag": etag}
+    except Error as e:
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn:
+            await release(conn)
+
+@app.route('/appointments', methods=['POST'])
+async def create_appointment():
+    """Create a new appointment"""
+    data = await request.get_json()
+
+    missing = missing_fields(data, APPOINTMENT_FIELDS) if data else []
+
+    if not data or missing:
+        error_message = f"Missing required fields: {', '.join(missing)}" if missing else "No data provided"
+        logger.error(error_message)
+        return jsonify({"error": error_message}), 400
+
+    conn = None
+    try:
+        conn = await get_db_connection()
+
+        # O(1) clash check against the in-memory slot index; a hit may be
+        # stale, so it is confirmed on the unique slot key, and concurrent
+        # bookings that both pass are stopped by that key
+        slots = await get_availability(conn)
+        slot = (data['trainer_id'], data['booking_date'])
+        if availability.is_active(data['status']) and slots.booking_for(*slot):
+            async with conn.cursor(DictCursor) as cursor:
+                taken = await taken_slots(cursor, [slot])
+            if taken:
+                slots.count_conflict()
+                return jsonify({"error": slot_taken_message(*slot)}), 409
+
+        values = tuple(data[field] for field in APPOINTMENT_FIELDS)
+
+        if GROUP_COMMIT_ENABLED:
+            # Written together with concurrent bookings by the group-commit
+            # flusher; the connection goes back to the pool first, since the
+            # flusher needs one too
+            await release(conn)
+            conn = None
+            appointment_id = await appointment_buffer.submit(values)
+        else:
+            async with conn.cursor(DictCursor) as cursor:
+                insert_query = """
+                INSERT INTO appointments (
+                    customer_id, trainer_id, booking_date, status
+                ) VALUES (%s, %s, %s, %s)
+                """
+
+                # The FK constraints replace the customer and trainer existence SELECTs
+                await cursor.execute(insert_query, values)
+                appointment_id = cursor.lastrowid
+                await add_sessions(cursor, [appointment_id])
+                await bump_versions(cursor, "appointments")
+                await conn.commit()
+        availability.index.record(appointment_id, data['trainer_id'], data['booking_date'], data['status'])
+        logger.info("Created appointment ID: %s", appointment_id)
+
+        # Build the response from the request plus cached names
+        customer = await get_customer(data['customer_id'], conn)
+        trainer = await get_trainer(data['trainer_id'], conn)
+
+        return jsonify({
+            "appointment_id": appointment_id,
+            "customer_id": data['customer_id'],
+            "trainer_id": data['trainer_id'],
+            "booking_date": data['booking_date'],
+            "billing_id": None,
+            "status": data['status'],
+            "customer_name": customer['name'] if customer else None,
+            "trainer_name": trainer['name'] if trainer else None
+        }), 201
+
+    except Error as e:
+        not_found = fk_not_found(e, data, APPOINTMENT_FOREIGN_KEYS)
+        if not_found:
+            return jsonify({"error": not_found}), 404
+        if duplicate_key(e) == availability.SLOT_KEY:
+            availability.index.count_conflict()
+            return jsonify({"error": slot_taken_message(data.get('trainer_id'), data.get('booking_date'))}), 409
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn:
+            await release(conn)
+
+@app.route('/appointments/bulk', methods=['POST'])
+async def create_appointments_bulk():
+    """Create many appointments in one transaction"""
+    items, error = read_batch(await request.get_json())
+    if error:
+        return jsonify({"error": error}), 400
+
+    errors = validate_batch(items, APPOINTMENT_FIELDS)
+    if errors:
+        return jsonify({"error": f"Batch rejected: {len(errors)} invalid item(s)", "errors": errors}), 400
+
+    # IDs are compared with the int keys of the lookups below, and dates are
+    # normalized so an unparseable one is a 400 rather than a failed INSERT
+    errors = coerce_ids(items, ['customer_id', 'trainer_id'])
+    for index, item in enumerate(items):
+        booking_date = parse_date(item['booking_date'])
+        if booking_date is None:
+            errors.append({"index": index, "error": "booking_date must be a date in YYYY-MM-DD format"})
+        else:
+            item['booking_date'] = booking_date.isoformat()
+    if errors:
+        errors.sort(key=lambda error: error["index"])
+        return jsonify({"error": f"Batch rejected: {len(errors)} invalid item(s)", "errors": errors}), 400
+
+    conn = None
+    try:
+        conn = await get_db_connection()
+        await get_availability(conn)
+        async with conn.cursor(DictCursor) as cursor:
+            # One IN query per referenced table instead of two SELECTs per item
+            customers = await fetch_existing(cursor, "customer", "customer_id", [item['customer_id'] for item in items], ["name"])
+            trainers = await fetch_existing(cursor, "trainer", "trainer_id", [item['trainer_id'] for item in items], ["name"])
+
+            # Slots are checked against the index (hits confirmed on the unique
+            # slot key) and against earlier items of the batch
+            taken = await taken_slots(
+                cursor, [(item['trainer_id'], item['booking_date']) for item in items if availability.is_active(item['status'])]
+            )
+            batch_slots = set()
+
+            for index, item in enumerate(items):
+                slot = (item['trainer_id'], parse_date(item['booking_date']))
+                if item['customer_id'] not in customers:
+                    errors.append({"index": index, "error": f"Customer with ID {item['customer_id']} not found"})
+                elif item['trainer_id'] not in trainers:
+                    errors.append({"index": index, "error": f"Trainer with ID {item['trainer_id']} not found"})
+                elif availability.is_active(item['status']) and (slot in batch_slots or slot in taken):
+                    errors.append({"index": index, "error": slot_taken_message(item['trainer_id'], item['booking_date'])})
+                elif availability.is_active(item['status']):
+                    batch_slots.add(slot)
+
+            if errors:
+                return jsonify({"error": f"Batch rejected: {len(errors)} invalid item(s)", "errors": errors}), 400
+
+            rows = [tuple(item[field] for field in APPOINTMENT_FIELDS) for item in items]
+            appointment_ids = await insert_rows(cursor, "appointments", APPOINTMENT_FIELDS, rows)
+            await add_sessions(cursor, appointment_ids)
+            await bump_versions(cursor, "appointments")
+            await conn.commit()
+            for item, appointment_id in zip(items, appointment_ids):
+                availability.index.record(appointment_id, item['trainer_id'], item['booking_date'], item['status'])
+
+        logger.info("Created %s appointments in bulk", len(appointment_ids))
+
+        results = [
+            {
+                "index": index,
+                "appointment_id": appointment_id,
+                "customer_id": item['customer_id'],
+                "customer_name": customers[item['customer_id']]['name'],
+                "trainer_id": item['trainer_id'],
+                "trainer_name": trainers[item['trainer_id']]['name'],
+                "booking_date": item['booking_date'],
+                "billing_id": None,
+                "status": item['status']
+            }
+            for index, (item, appointment_id) in enumerate(zip(items, appointment_ids))
+        ]
+        return jsonify({"created": len(results), "results": results}), 201
+
+    except Error as e:
+        if duplicate_key(e) == availability.SLOT_KEY:
+            availability.index.count_conflict()
+            return jsonify({"error": "Batch rejected: a trainer slot was booked concurrently"}), 409
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn:
+            await release(conn)
+
+@app.route('/appointments/<int:id>', methods=['PUT'])
+async def update_appointment(id):
+    """Update an appointment by ID"""
+    data = await request.get_json()
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
+
+    conn = None
+    try:
+        conn = await get_db_connection()
+        async with conn.cursor(DictCursor) as cursor:
+            update_fields = []
+            values = []
+
+            for field in ['customer_id', 'trainer_id', 'booking_date', 'billing_id', 'status']:
+                if field in data:
+                    update_fields.append(f"{field} = %s")
+                    values.append(data[field])
+
+            if not update_fields:
+                return jsonify({"error": "No valid fields to update"}), 400
+
+            values.append(id)
+
+            # The matched-row count doubles as the existence check
+            update_query = f"UPDATE appointments SET {', '.join(update_fields)} WHERE appointment_id = %s"
+            # Session counts depend on the status and on who is booked
+            counted = any(field in data for field in revenue_rollups.SESSION_FIELDS)
+            if counted:
+                await cursor.execute(*revenue_rollups.session_statement([id], -1))
+            await cursor.execute(update_query, values)
+            if cursor.rowcount == 0:
+                return jsonify({"error": f"Appointment with ID {id} not found"}), 404
+            if counted:
+                await cursor.execute(*revenue_rollups.session_statement([id], 1))
+
+            await cursor.execute(APPOINTMENTS_QUERY + " WHERE a.appointment_id = %s", (id,))
+            updated_appointment = await cursor.fetchone()
+            await bump_versions(cursor, "appointments")
+            await conn.commit()
+            availability.index.record(
+                id, updated_appointment['trainer_id'], updated_appointment['booking_date'], updated_appointment['status']
+            )
+
+        return jsonify(updated_appointment)
+
+    except Error as e:
+        not_found = fk_not_found(e, data, APPOINTMENT_FOREIGN_KEYS)
+        if not_found:
+            return jsonify({"error": not_found}), 404
+        if duplicate_key(e) == availability.SLOT_KEY:
+            availability.index.count_conflict()
+            return jsonify({"error": slot_taken_message(data.get('trainer_id'), data.get('booking_date'))}), 409
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn:
+            await release(conn)
+
+@app.route('/appointments/<int:id>', methods=['DELETE'])
+async def delete_appointment(id):
+    """Delete an appointment by ID"""
+    conn = None
+    try:
+        conn = await get_db_connection()
+        async with conn.cursor() as cursor:
+            await cursor.execute(*revenue_rollups.session_statement([id], -1))
+            await cursor.execute("DELETE FROM appointments WHERE appointment_id = %s", (id,))
+            if cursor.rowcount == 0:
+                return jsonify({"error": f"Appointment with ID {id} not found"}), 404
+
+            await bump_versions(cursor, "appointments")
+            await conn.commit()
+            availability.index.discard(id)
+
+        return jsonify({"message": f"Appointment with ID {id} successfully deleted"})
+
+    except Error as e:
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn:
+            await release(conn)
+
+@app.route('/appointments/customer/<int:customer_id>', methods=['GET'])
+async def get_customer_appointments(customer_id):
+    """Get appointments for a specific customer, optionally filtered by date range and status"""
+    try:
+        conditions, params = appointment_filters(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Served by the (customer_id, booking_date) index as a range scan
+    conditions = ["a.customer_id = %s", *conditions]
+
+    async def fetch():
+        # Only the request running the query holds a connection
+        async with pooled_cursor() as cursor:
+            await cursor.execute("SELECT customer_id FROM customer WHERE customer_id = %s", (customer_id,))
+            if not await cursor.fetchone():
+                return None
+            await cursor.execute(f"""
+                SELECT a.*, t.name as trainer_name
+                FROM appointments a
+                LEFT JOIN trainer t ON a.trainer_id = t.trainer_id
+                WHERE {' AND '.join(conditions)}
+                ORDER BY a.booking_date, a.appointment_id
+            """, (customer_id, *params))
+            return await cursor.fetchall()
+
+    try:
+        # The table versions are part of the key, so a shared or cached
+        # result never predates a committed write
+        async with pooled_cursor() as cursor:
+            version = await list_etag(cursor, "appointment")
+
+        # Clients polling the same schedule at once share one query
+        appointments = await customer_appointment_reads.do((version, customer_id, tuple(conditions), tuple(params)), fetch)
+        if appointments is None:
+            return jsonify({"error": f"Customer with ID {customer_id} not found"}), 404
+
+        return jsonify(appointments)
+    except Error as e:
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/appointments/trainer/<int:trainer_id>', methods=['GET'])
+async def get_trainer_appointments(trainer_id):
+    """Get appointments for a specific trainer, optionally filtered by date range and status"""
+    try:
+        conditions, params = appointment_filters(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Served by the (trainer_id, booking_date) index as a range scan
+    conditions = ["a.trainer_id = %s", *conditions]
+
+    async def fetch():
+        # Only the request running the query holds a connection
+        async with pooled_cursor() as cursor:
+            await cursor.execute("SELECT trainer_id FROM trainer WHERE trainer_id = %s", (trainer_id,))
+            if not await cursor.fetchone():
+                return None
+            await cursor.execute(f"""
+                SELECT a.*, c.name as customer_name
+                FROM appointments a
+                LEFT JOIN customer c ON a.customer_id = c.customer_id
+                WHERE {' AND '.join(conditions)}
+                ORDER BY a.booking_date, a.appointment_id
+            """, (trainer_id, *params))
+            return await cursor.fetchall()
+
+    try:
+        # The table versions are part of the key, so a shared or cached
+        # result never predates a committed write
+        async with pooled_cursor() as cursor:
+            version = await list_etag(cursor, "appointment")
+
+        # Clients polling the same schedule at once share one query
+        appointments = await trainer_appointment_reads.do((version, trainer_id, tuple(conditions), tuple(params)), fetch)
+        if appointments is None:
+            return jsonify({"error": f"Trainer with ID {trainer_id} not found"}), 404
+
+        return jsonify(appointments)
+    except Error as e:
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/appointments/group-commit/stats', methods=['GET'])
+async def get_group_commit_stats():
+    """Get group-commit batch sizes and flush/wait latency for this process"""
+    return jsonify(appointment_buffer.stats())
+
+@app.route('/pool/stats', methods=['GET'])
+async def get_pool_stats():
+    """Get database connection pool statistics for this process"""
+    return jsonify(await pool_stats())
+
+@app.route('/cache/stats', methods=['GET'])
+async def get_cache_stats():
+    """Get entity cache hit/miss counters for this process"""
+    return jsonify(cache_stats())
+
+@app.route('/slow-queries', methods=['GET'])
+async def get_slow_queries():
+    """Get the most recent slow queries logged by this process"""
+    limit = request.args.get('limit', type=int)
+    return jsonify(slow_queries.recent(limit))
+
+if __name__ == '__main__':
+    app.run(port=5002, debug=True)
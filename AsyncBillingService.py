@@ -0,0 +1,584 @@
+from quart import Quart, Response, jsonify, request
+import logging
+from async_db import Error, DictCursor, get_db_connection, release, pool_stats, ndjson_lines, export_lines, get_customer, get_trainer, entity_etag, list_etag, bump_versions, fetch_existing, rebuild_billing_stats, rebuild_revenue_rollups
+import billing_stats
+import billing_links
+import revenue_rollups
+import export
+from entity_cache import cache_stats
+import pricing
+from pricing import calculate_fees, quote_pairs
+from bulk import read_batch
+from db import fk_not_found
+from validation import BILLING_FOREIGN_KEYS, coerce_ids
+from decimal import Decimal
+from pagination import parse_page_args, wants_stream, keyset_query, build_page
+import serialization
+import metrics
+import logging_setup
+import slow_queries
+from etag import is_fresh, not_modified, DELETE_CASCADES
+
+app = Quart(__name__)
+serialization.init_app(app)
+metrics.init_app(app, "billing")
+
+# Logging setup
+logging_setup.init_app(app, "billing")
+logger = logging.getLogger(__name__)
+
+# Batch quotes with more pairs than this are streamed
+QUOTE_STREAM_THRESHOLD = 500
+
+BILLINGS_QUERY = """
+    SELECT b.*, c.name as customer_name
+    FROM billings b
+    LEFT JOIN customer c ON b.customer_id = c.customer_id
+"""
+
+async def billing_response(billing_id, customer_id, amount, conn):
+    """Build a billing response without re-selecting the billings/customer join"""
+    customer = await get_customer(customer_id, conn)
+    return {
+        "billing_id": billing_id,
+        "customer_id": customer_id,
+        "amount": Decimal(str(amount)).quantize(Decimal("0.01")),
+        "customer_name": customer['name'] if customer else None
+    }
+
+async def apply_statements(cursor, statements):
+    for query, params in statements:
+        await cursor.execute(query, params)
+
+@app.route('/billings', methods=['GET'])
+async def get_billings():
+    """Get all billing records, optionally paginated or streamed"""
+    try:
+        limit, after = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if wants_stream(request.args):
+        query, params = keyset_query(BILLINGS_QUERY, "b.billing_id", after)
+        return Response(ndjson_lines(query, params), mimetype='application/x-ndjson')
+
+    conn = None
+    try:
+        conn = await get_db_connection()
+        async with conn.cursor(DictCursor) as cursor:
+            etag = await list_etag(cursor, "billing")
+            if is_fresh(request, etag):
+                return not_modified(etag)
+
+            if limit is not None:
+                query, params = keyset_query(BILLINGS_QUERY, "b.billing_id", after, limit + 1)
+                await cursor.execute(query, params)
+                return jsonify(build_page(await cursor.fetchall(), "billing_id", limit)), 200, {"ETag": etag}
+
+            await cursor.execute(BILLINGS_QUERY)
+            billings = await cursor.fetchall()
+            return jsonify(billings), 200, {"ETag": etag}
+    except Error as e:
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn:
+            await release(conn)
+
+@app.route('/billings/export', methods=['GET'])
+async def export_billings():
+    """Stream every billing with its customer and appointments as CSV or NDJSON"""
+    try:
+        fmt, after = export.export_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Resumable: pass the last complete billing_id received as `after`
+    return Response(export_lines(fmt, after), mimetype=export.MIMETYPES[fmt], headers=export.download_headers(fmt, after))
+
+@app.route('/billings/<int:id>', methods=['GET'])
+async def get_billing(id):
+    """Get billing record by ID"""
+    conn = None
+    try:
+        conn = await get_db_connection()
+        async with conn.cursor(DictCursor) as cursor:
+            # A version lookup by primary key decides 304 before the full query
+            etag = await entity_etag(cursor, "billing", id)
+            if etag is None:
+                return jsonify({"error": f"Billing record with ID {id} not found"}), 404
+            if is_fresh(request, etag):
+                return not_modified(etag)
+
+            await cursor.execute(BILLINGS_QUERY + " WHERE b.billing_id = %s", (id,))
+            billing = await cursor.fetchone()
+
+            if not billing:
+                return jsonify({"error": f"Billing record with ID {id} not found"}), 404
+
+            # Get related appointments for this billing
+            await cursor.execute("""
+                SELECT appointment_id, customer_id, trainer_id, booking_date, status
+                FROM appointments
+                WHERE billing_id = %s
+            """, (id,))
+            appointments = await cursor.fetchall()
+
+        billing['appointments'] = appointments
+
+        return jsonify(billing), 200, {"ETag": etag}
+    except Error as e:
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn:
+            await release(conn)
+
+@app.route('/billings/customer/<int:customer_id>', methods=['GET'])
+async def get_customer_billings(customer_id):
+    """Get all billing records for a specific customer"""
+    conn = None
+    try:
+        conn = await get_db_connection()
+        async with conn.cursor(DictCursor) as cursor:
+            # Check if customer exists
+            await cursor.execute("SELECT customer_id FROM customer WHERE customer_id = %s", (customer_id,))
+            if not await cursor.fetchone():
+                return jsonify({"error": f"Customer with ID {customer_id} not found"}), 404
+
+            await cursor.execute(BILLINGS_QUERY + " WHERE b.customer_id = %s", (customer_id,))
+            billings = await cursor.fetchall()
+
+        return jsonify(billings)
+    except Error as e:
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn:
+            await release(conn)
+
+@app.route('/billings/appointment/<int:appointment_id>', methods=['GET'])
+async def get_billing_by_appointment_id(appointment_id):
+    """Get billing information related to a specific appointment"""
+    conn = None
+    try:
+        conn = await get_db_connection()
+        async with conn.cursor(DictCursor) as cursor:
+            # Get appointment data
+            await cursor.execute("SELECT * FROM appointments WHERE appointment_id = %s", (appointment_id,))
+            appointment = await cursor.fetchone()
+
+            if not appointment:
+                return jsonify({"error": f"Appointment with ID {appointment_id} not found"}), 404
+
+            # Get billing information if it exists
+            billing_info = None
+            if appointment['billing_id']:
+                await cursor.execute("SELECT * FROM billings WHERE billing_id = %s", (appointment['billing_id'],))
+                billing_info = await cursor.fetchone()
+
+        # Customer and trainer details come from the read-through entity cache
+        customer = await get_customer(appointment['customer_id'], conn) if appointment['customer_id'] else None
+        trainer = await get_trainer(appointment['trainer_id'], conn) if appointment['trainer_id'] else None
+        appointment['customer_name'] = customer['name'] if customer else None
+        appointment['membership_type'] = customer['membership_type'] if customer else None
+        appointment['trainer_name'] = trainer['name'] if trainer else None
+        appointment['spesialisasi'] = trainer['spesialisasi'] if trainer else None
+
+        # Calculate billing details if not already assigned
+        if not billing_info:
+            base_fee, specialty_fee, total_amount = calculate_fees(
+                appointment['membership_type'], appointment['spesialisasi']
+            )
+
+            billing_info = {
+                "customer_id": appointment['customer_id'],
+                "amount": total_amount
+            }
+
+        return jsonify({
+            "appointment": appointment,
+            "billing": billing_info
+        })
+    except Error as e:
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn:
+            await release(conn)
+
+@app.route('/billings', methods=['POST'])
+async def create_billing():
+    """Create a new billing record"""
+    data = await request.get_json()
+
+    missing_fields = [field for field in ['customer_id', 'amount'] if field not in data] if data else []
+
+    if not data or missing_fields:
+        error_message = f"Missing required fields: {', '.join(missing_fields)}" if missing_fields else "No data provided"
+        return jsonify({"error": error_message}), 400
+
+    appointment_ids, error_message = billing_links.read_appointment_ids(data)
+    if error_message:
+        return jsonify({"error": error_message}), 400
+
+    conn = None
+    try:
+        conn = await get_db_connection()
+        async with conn.cursor(DictCursor) as cursor:
+            # Lock the appointments first so the checks still hold at commit
+            if appointment_ids:
+                await cursor.execute(*billing_links.lock_statement(appointment_ids))
+                problems = billing_links.link_errors(appointment_ids, await cursor.fetchall())
+                if problems:
+                    return jsonify(problems), 400
+
+            # fk_billings_customer replaces the customer existence SELECT
+            await cursor.execute(
+                "INSERT INTO billings (customer_id, amount) VALUES (%s, %s)",
+                (data['customer_id'], data['amount'])
+            )
+            billing_id = cursor.lastrowid
+            await apply_statements(cursor, billing_stats.delta_statements(data['customer_id'], 1, data['amount']))
+            await cursor.execute(*revenue_rollups.billing_statement(billing_id, 1))
+
+            # Link the appointments in one statement, in the same transaction
+            if appointment_ids:
+                await apply_statements(cursor, billing_links.link_statements(billing_id, appointment_ids))
+                await bump_versions(cursor, "billings", "appointments")
+            else:
+                await bump_versions(cursor, "billings")
+            await conn.commit()
+
+        new_billing = await billing_response(billing_id, data['customer_id'], data['amount'], conn)
+
+        return jsonify(new_billing), 201
+
+    except Error as e:
+        not_found = fk_not_found(e, data, BILLING_FOREIGN_KEYS)
+        if not_found:
+            return jsonify({"error": not_found}), 404
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn:
+            await release(conn)
+
+@app.route('/billings/<int:id>', methods=['PUT'])
+async def update_billing(id):
+    """Update a billing record"""
+    data = await request.get_json()
+
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
+
+    appointment_ids, error_message = billing_links.read_appointment_ids(data)
+    if error_message:
+        return jsonify({"error": error_message}), 400
+
+    conn = None
+    try:
+        conn = await get_db_connection()
+        async with conn.cursor(DictCursor) as cursor:
+            # Check if billing exists, locking it so the stats delta is exact
+            await cursor.execute("SELECT customer_id, amount FROM billings WHERE billing_id = %s FOR UPDATE", (id,))
+            existing = await cursor.fetchone()
+            if not existing:
+                return jsonify({"error": f"Billing record with ID {id} not found"}), 404
+
+            update_fields = []
+            values = []
+
+            for field in ['customer_id', 'amount']:
+                if field in data:
+                    update_fields.append(f"{field} = %s")
+                    values.append(data[field])
+
+            if not update_fields and appointment_ids is None:
+                return jsonify({"error": "No valid fields to update"}), 400
+
+            if appointment_ids:
+                await cursor.execute(*billing_links.lock_statement(appointment_ids))
+                problems = billing_links.link_errors(appointment_ids, await cursor.fetchall(), id)
+                if problems:
+                    return jsonify(problems), 400
+
+            if update_fields:
+                values.append(id)
+
+                # The rollups move with the billing's customer and amount
+                await cursor.execute(*revenue_rollups.billing_statement(id, -1))
+                await cursor.execute(f"UPDATE billings SET {', '.join(update_fields)} WHERE billing_id = %s", values)
+                await cursor.execute(*revenue_rollups.billing_statement(id, 1))
+                await apply_statements(cursor, billing_stats.move_statements(
+                    existing['customer_id'], existing['amount'],
+                    data.get('customer_id', existing['customer_id']), data.get('amount', existing['amount'])
+                ))
+
+            # The billing ends up linked to exactly the given appointments
+            if appointment_ids is not None:
+                await apply_statements(cursor, billing_links.link_statements(id, appointment_ids, replace=True))
+                await bump_versions(cursor, "billings", "appointments")
+            else:
+                await bump_versions(cursor, "billings")
+            await conn.commit()
+
+        updated_billing = await billing_response(
+            id,
+            data.get('customer_id', existing['customer_id']),
+            data.get('amount', existing['amount']),
+            conn
+        )
+
+        return jsonify(updated_billing)
+    except Error as e:
+        not_found = fk_not_found(e, data, BILLING_FOREIGN_KEYS)
+        if not_found:
+            return jsonify({"error": not_found}), 404
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn:
+            await release(conn)
+
+@app.route('/billings/<int:id>', methods=['DELETE'])
+async def delete_billing(id):
+    """Delete a billing record"""
+    conn = None
+    try:
+        conn = await get_db_connection()
+        async with conn.cursor(DictCursor) as cursor:
+            # Check if billing exists
+            await cursor.execute("SELECT customer_id, amount FROM billings WHERE billing_id = %s FOR UPDATE", (id,))
+            existing = await cursor.fetchone()
+            if not existing:
+                return jsonify({"error": f"Billing record with ID {id} not found"}), 404
+
+            await cursor.execute(*revenue_rollups.billing_statement(id, -1))
+
+            # Delete the billing; fk_appointments_billing (ON DELETE SET NULL)
+            # unlinks its appointments
+            await cursor.execute("DELETE FROM billings WHERE billing_id = %s", (id,))
+            await apply_statements(cursor, billing_stats.delta_statements(existing['customer_id'], -1, -existing['amount']))
+            await bump_versions(cursor, *DELETE_CASCADES["billings"])
+            await conn.commit()
+
+        return jsonify({"message": f"Billing record with ID {id} has been deleted"}), 200
+    except Error as e:
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn:
+            await release(conn)
+
+@app.route('/billings/stats', methods=['GET'])
+async def get_billing_stats():
+    """Get billing statistics from the incrementally maintained summary tables"""
+    conn = None
+    try:
+        conn = await get_db_connection()
+        async with conn.cursor(DictCursor) as cursor:
+            await cursor.execute(billing_stats.TOTALS_QUERY)
+            totals = await cursor.fetchone()
+
+            await cursor.execute(billing_stats.BY_CUSTOMER_QUERY)
+            customer_stats = await cursor.fetchall()
+
+        return jsonify(billing_stats.format_stats(totals, customer_stats))
+    except Error as e:
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn:
+            await release(conn)
+
+@app.route('/billings/stats/rebuild', methods=['POST'])
+async def rebuild_billing_stats_route():
+    """Recompute the billing summary tables from the billings table"""
+    conn = None
+    try:
+        conn = await get_db_connection()
+        customers = await rebuild_billing_stats(conn)
+        logger.info("Rebuilt billing stats for %s customers", customers)
+
+        return jsonify({"message": f"Billing stats rebuilt for {customers} customers"})
+    except Error as e:
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn:
+            await release(conn)
+
+@app.route('/billings/reports', methods=['GET'])
+async def get_billing_reports():
+    """Get revenue and session counts per day or month from the rollup table"""
+    try:
+        granularity, start, end = revenue_rollups.report_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    conn = None
+    try:
+        conn = await get_db_connection()
+        async with conn.cursor(DictCursor) as cursor:
+            etag = await list_etag(cursor, "revenue")
+            if is_fresh(request, etag):
+                return not_modified(etag)
+
+            await cursor.execute(*revenue_rollups.report_statement(granularity, start, end))
+            rows = await cursor.fetchall()
+
+        return jsonify(revenue_rollups.format_report(granularity, start, end, rows)), 200, {"ETag": etag}
+    except Error as e:
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn:
+            await release(conn)
+
+@app.route('/billings/reports/rebuild', methods=['POST'])
+async def rebuild_billing_reports():
+    """Recompute the revenue rollups from billings and appointments"""
+    conn = None
+    try:
+        conn = await get_db_connection()
+        rows = await rebuild_revenue_rollups(conn)
+        logger.info("Rebuilt revenue rollups with %s rows", rows)
+
+        return jsonify({"message": f"Revenue rollups rebuilt with {rows} rows"})
+    except Error as e:
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn:
+            await release(conn)
+
+@app.route('/billings/pricing', methods=['GET'])
+async def get_pricing_rules():
+    """Get the fee rules in effect in this process"""
+    # Picks up a changed rules file first
+    pricing.rules.table()
+    return jsonify(pricing.rules.stats())
+
+@app.route('/billings/pricing/reload', methods=['POST'])
+async def reload_pricing_rules():
+    """Reload the fee rules file without waiting for the next change check"""
+    try:
+        pricing.rules.reload()
+    except (OSError, ValueError) as e:
+        logger.error("Could not reload pricing rules: %s", e)
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify(pricing.rules.stats())
+
+@app.route('/billings/calculate', methods=['POST'])
+async def calculate_billing():
+    """Calculate billing amount for specific customer and trainer"""
+    data = await request.get_json()
+
+    if not data or 'customer_id' not in data or 'trainer_id' not in data:
+        return jsonify({"error": "Missing required customer_id and/or trainer_id"}), 400
+
+    try:
+        # Customer and trainer rows come from the read-through entity cache
+        customer = await get_customer(data['customer_id'])
+        if not customer:
+            return jsonify({"error": f"Customer with ID {data['customer_id']} not found"}), 404
+
+        trainer = await get_trainer(data['trainer_id'])
+        if not trainer:
+            return jsonify({"error": f"Trainer with ID {data['trainer_id']} not found"}), 404
+
+        # Calculate billing amount based on membership type and trainer specialization
+        base_fee, specialty_fee, total_amount = calculate_fees(
+            customer['membership_type'], trainer['spesialisasi']
+        )
+
+        return jsonify({
+            "customer_id": customer['customer_id'],
+            "customer_name": customer['name'],
+            "membership_type": customer['membership_type'],
+            "trainer_id": trainer['trainer_id'],
+            "trainer_name": trainer['name'],
+            "trainer_specialty": trainer['spesialisasi'],
+            "base_fee": base_fee,
+            "specialty_fee": specialty_fee,
+            "total_amount": total_amount
+        })
+    except Error as e:
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/billings/calculate/batch', methods=['POST'])
+async def calculate_billing_batch():
+    """Calculate billing amounts for many customer/trainer pairs"""
+    pairs, error = read_batch(await request.get_json())
+    if error:
+        return jsonify({"error": error}), 400
+
+    invalid = [
+        index for index, pair in enumerate(pairs)
+        if not isinstance(pair, dict) or 'customer_id' not in pair or 'trainer_id' not in pair
+    ]
+    if invalid:
+        return jsonify({
+            "error": "Missing required customer_id and/or trainer_id",
+            "invalid_indexes": invalid
+        }), 400
+
+    # The lookups below return int keys
+    errors = coerce_ids(pairs, ['customer_id', 'trainer_id'])
+    if errors:
+        return jsonify({"error": f"Batch rejected: {len(errors)} invalid item(s)", "errors": errors}), 400
+
+    conn = None
+    try:
+        conn = await get_db_connection()
+        async with conn.cursor(DictCursor) as cursor:
+            # Resolve every customer and trainer with one IN query each
+            customers = await fetch_existing(
+                cursor, "customer", "customer_id", [pair['customer_id'] for pair in pairs],
+                ["name", "membership_type"]
+            )
+            trainers = await fetch_existing(
+                cursor, "trainer", "trainer_id", [pair['trainer_id'] for pair in pairs],
+                ["name", "spesialisasi"]
+            )
+    except Error as e:
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn:
+            await release(conn)
+
+    quotes = quote_pairs(pairs, customers, trainers)
+
+    if len(pairs) <= QUOTE_STREAM_THRESHOLD:
+        return jsonify(list(quotes))
+
+    async def generate():
+        yield "["
+        for index, quote in enumerate(quotes):
+            yield ("," if index else "") + serialization.dumps(quote).decode()
+        yield "]"
+
+    return Response(generate(), mimetype='application/json')
+
+@app.route('/pool/stats', methods=['GET'])
+async def get_pool_stats():
+    """Get database connection pool statistics for this process"""
+    return jsonify(await pool_stats())
+
+@app.route('/cache/stats', methods=['GET'])
+async def get_cache_stats():
+    """Get entity cache hit/miss counters for this process"""
+    return jsonify(cache_stats())
+
+@app.route('/slow-queries', methods=['GET'])
+async def get_slow_queries():
+    """Get the most recent slow queries logged by this process"""
+    limit = request.args.get('limit', type=int)
+    return jsonify(slow_queries.recent(limit))
+
+if __name__ == '__main__':
+    app.run(port=5003, debug=True)
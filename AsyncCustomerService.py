@@ -0,0 +1,317 @@
+from quart import Quart, Response, jsonify, request
+import logging
+import asyncio
+from async_db import Error, DictCursor, get_db_connection, release, pooled_cursor, pool_stats, ndjson_lines, entity_etag, list_etag, bump_versions, get_customer_search, insert_rows, import_csv, request_lines
+import revenue_rollups
+import customer_search
+from bulk import placeholders, read_batch
+from entity_cache import customer_cache, cache_stats
+from validation import CUSTOMER_FIELDS, validate_batch
+from pagination import parse_page_args, wants_stream, keyset_query, build_page
+import serialization
+import metrics
+import logging_setup
+import slow_queries
+from coalesce import AsyncSingleFlight
+from etag import is_fresh, not_modified, DELETE_CASCADES
+
+app = Quart(__name__)
+# CSV imports are not capped by Quart's 16MB default, as in the sync build
+app.config['MAX_CONTENT_LENGTH'] = None
+serialization.init_app(app)
+metrics.init_app(app, "customer")
+
+logging_setup.init_app(app, "customer")
+logger = logging.getLogger(__name__)
+
+customer_list_reads = AsyncSingleFlight("customers")
+
+@app.route('/customers', methods=['GET'])
+async def get_customers():
+    """Get all customers from database, optionally paginated or streamed"""
+    try:
+        limit, after = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if wants_stream(request.args):
+        query, params = keyset_query("SELECT * FROM customer", "customer_id", after)
+        return Response(ndjson_lines(query, params), mimetype='application/x-ndjson')
+
+    try:
+        async with pooled_cursor() as cursor:
+            etag = await list_etag(cursor, "customer")
+        if is_fresh(request, etag):
+            return not_modified(etag)
+
+        async def fetch():
+            # Only the request running the query holds a connection
+            async with pooled_cursor() as cursor:
+                if limit is not None:
+                    query, params = keyset_query("SELECT * FROM customer", "customer_id", after, limit + 1)
+                    await cursor.execute(query, params)
+                    return build_page(await cursor.fetchall(), "customer_id", limit)
+                await cursor.execute("SELECT * FROM customer")
+                return await cursor.fetchall()
+
+        # Concurrent requests for the same version of the list share one query
+        body = await customer_list_reads.do((etag, limit, after), fetch)
+        return jsonify(body), 200, {"ETag": etag}
+    except Error as e:
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/customers/search', methods=['GET'])
+async def search_customers():
+    """Find customers by part of their name, email or phone number"""
+    try:
+        q, match, limit, after = customer_search.search_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    conn = None
+    try:
+        conn = await get_db_connection()
+        # Matching runs on the in-process trigram index; only the page is read
+        index = await get_customer_search(conn)
+        # A wide scan is CPU-bound; keep it off the event loop
+        ids, next_cursor = await asyncio.to_thread(index.search, q, match, limit, after)
+        customers = {}
+        if ids:
+            async with conn.cursor(DictCursor) as cursor:
+                await cursor.execute(
+                    f"SELECT * FROM customer WHERE customer_id IN ({placeholders(len(ids))})", ids
+                )
+                customers = {row['customer_id']: row for row in await cursor.fetchall()}
+
+        return jsonify({
+            "data": [customers[customer_id] for customer_id in ids if customer_id in customers],
+            "limit": limit,
+            "next_cursor": next_cursor
+        })
+    except Error as e:
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn:
+            await release(conn)
+
+@app.route('/customers/<int:id>', methods=['GET'])
+async def get_customer(id):
+    """Get a customer by ID"""
+    conn = None
+    try:
+        conn = await get_db_connection()
+        async with conn.cursor(DictCursor) as cursor:
+            # A version lookup by primary key decides 304 before the full query
+            etag = await entity_etag(cursor, "customer", id)
+            if etag is None:
+                return jsonify({"error": f"Customer with ID {id} not found"}), 404
+            if is_fresh(request, etag):
+                return not_modified(etag)
+
+            await cursor.execute("SELECT * FROM customer WHERE customer_id = %s", (id,))
+            customer = await cursor.fetchone()
+
+        if not customer:
+            return jsonify({"error": f"Customer with ID {id} not found"}), 404
+
+        return jsonify(customer), 200, {"ETag": etag}
+    except Error as e:
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn:
+            await release(conn)
+
+@app.route('/customers', methods=['POST'])
+async def add_customer():
+    """Add a new customer"""
+    data = await request.get_json()
+
+    if not data or not all(field in data for field in CUSTOMER_FIELDS):
+        return jsonify({"error": f"Missing required fields: {', '.join(CUSTOMER_FIELDS)}"}), 400
+
+    conn = None
+    try:
+        conn = await get_db_connection()
+        async with conn.cursor() as cursor:
+            query = """
+            INSERT INTO customer (name, email, no_telp, alamat, membership_type)
+            VALUES (%s, %s, %s, %s, %s)
+            """
+            values = tuple(data[field] for field in CUSTOMER_FIELDS)
+
+            await cursor.execute(query, values)
+            customer_id = cursor.lastrowid
+            await bump_versions(cursor, "customer")
+            await conn.commit()
+
+        customer = {"customer_id": customer_id, **{field: data[field] for field in CUSTOMER_FIELDS}}
+        customer_search.index.record(customer)
+        logger.info("Added new customer with ID: %s", customer_id)
+
+        return jsonify(customer), 201
+
+    except Error as e:
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn:
+            await release(conn)
+
+@app.route('/customers/bulk', methods=['POST'])
+async def add_customers_bulk():
+    """Add many customers in one transaction"""
+    items, error = read_batch(await request.get_json())
+    if error:
+        return jsonify({"error": error}), 400
+
+    errors = validate_batch(items, CUSTOMER_FIELDS)
+    if errors:
+        return jsonify({"error": f"Batch rejected: {len(errors)} invalid item(s)", "errors": errors}), 400
+
+    conn = None
+    try:
+        conn = await get_db_connection()
+        async with conn.cursor() as cursor:
+            rows = [tuple(item[field] for field in CUSTOMER_FIELDS) for item in items]
+            customer_ids = await insert_rows(cursor, "customer", CUSTOMER_FIELDS, rows)
+            await bump_versions(cursor, "customer")
+            await conn.commit()
+
+        customers = [
+            {"customer_id": customer_id, **{field: item[field] for field in CUSTOMER_FIELDS}}
+            for item, customer_id in zip(items, customer_ids)
+        ]
+        for customer in customers:
+            customer_search.index.record(customer)
+        logger.info("Added %s customers in bulk", len(customer_ids))
+
+        results = [{"index": index, **customer} for index, customer in enumerate(customers)]
+        return jsonify({"created": len(results), "results": results}), 201
+
+    except Error as e:
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn:
+            await release(conn)
+
+@app.route('/customers/import', methods=['POST'])
+async def import_customers():
+    """Import customers from a CSV upload; bad rows are reported, not fatal"""
+    conn = None
+    try:
+        conn = await get_db_connection()
+        report = await import_csv(conn, "customers", await request_lines(request))
+        if report.imported:
+            customer_search.index.expire()
+        return jsonify(report.as_dict())
+
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Error as e:
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn:
+            await release(conn)
+
+@app.route('/customers/<int:id>', methods=['PUT'])
+async def update_customer(id):
+    """Update a customer by ID"""
+    data = await request.get_json()
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
+
+    conn = None
+    try:
+        conn = await get_db_connection()
+        async with conn.cursor(DictCursor) as cursor:
+            update_fields = []
+            values = []
+
+            for field in CUSTOMER_FIELDS:
+                if field in data:
+                    update_fields.append(f"{field} = %s")
+                    values.append(data[field])
+
+            if not update_fields:
+                return jsonify({"error": "No valid fields to update"}), 400
+
+            values.append(id)
+
+            # The matched-row count doubles as the existence check
+            update_query = f"UPDATE customer SET {', '.join(update_fields)} WHERE customer_id = %s"
+            # Revenue rollups are attributed by membership type, so move them along
+            if 'membership_type' in data:
+                await cursor.execute(*revenue_rollups.customer_statement(id, -1))
+            await cursor.execute(update_query, values)
+            if cursor.rowcount == 0:
+                return jsonify({"error": f"Customer with ID {id} not found"}), 404
+            if 'membership_type' in data:
+                await cursor.execute(*revenue_rollups.customer_statement(id, 1))
+
+            await cursor.execute("SELECT * FROM customer WHERE customer_id = %s", (id,))
+            updated_customer = await cursor.fetchone()
+            await bump_versions(cursor, "customer")
+            await conn.commit()
+            customer_cache.set(id, updated_customer)
+            customer_search.index.record(updated_customer)
+
+        return jsonify(updated_customer)
+
+    except Error as e:
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn:
+            await release(conn)
+
+@app.route('/customers/<int:id>', methods=['DELETE'])
+async def delete_customer(id):
+    """Delete a customer by ID"""
+    conn = None
+    try:
+        conn = await get_db_connection()
+        async with conn.cursor() as cursor:
+            # Billings cascade with the customer, so take them out of the rollups
+            # first; the customer's billing stats row cascades with it
+            await cursor.execute(*revenue_rollups.remove_customer_statement(id))
+            await cursor.execute("DELETE FROM customer WHERE customer_id = %s", (id,))
+            if cursor.rowcount == 0:
+                return jsonify({"error": f"Customer with ID {id} not found"}), 404
+
+            await bump_versions(cursor, *DELETE_CASCADES["customer"])
+            await conn.commit()
+            customer_cache.invalidate(id)
+            customer_search.index.discard(id)
+
+        return jsonify({"message": f"Customer with ID {id} successfully deleted"})
+
+    except Error as e:
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn:
+            await release(conn)
+
+@app.route('/pool/stats', methods=['GET'])
+async def get_pool_stats():
+    """Get database connection pool statistics for this process"""
+    return jsonify(await pool_stats())
+
+@app.route('/cache/stats', methods=['GET'])
+async def get_cache_stats():
+    """Get entity cache hit/miss counters for this process"""
+    return jsonify(cache_stats())
+
+@app.route('/slow-queries', methods=['GET'])
+async def get_slow_queries():
+    """Get the most recent slow queries logged by this process"""
+    limit = request.args.get('limit', type=int)
+    return jsonify(slow_queries.recent(limit))
+
+if __name__ == '__main__':
+    app.run(port=5000, debug=True)
@@ -0,0 +1,312 @@
+from quart import Quart, Response, jsonify, request
+import logging
+from async_db import Error, DictCursor, get_db_connection, release, pooled_cursor, pool_stats, ndjson_lines, get_availability, entity_etag, list_etag, bump_versions, insert_rows, import_csv, request_lines
+from entity_cache import trainer_cache, cache_stats
+from validation import TRAINER_FIELDS, validate_batch
+from bulk import read_batch
+from pagination import parse_page_args, wants_stream, keyset_query, build_page
+import serialization
+import metrics
+import logging_setup
+import slow_queries
+from coalesce import AsyncSingleFlight
+from etag import is_fresh, not_modified, DELETE_CASCADES
+import availability
+import revenue_rollups
+from availability import parse_date
+
+app = Quart(__name__)
+# CSV imports are not capped by Quart's 16MB default, as in the sync build
+app.config['MAX_CONTENT_LENGTH'] = None
+serialization.init_app(app)
+metrics.init_app(app, "trainer")
+
+logging_setup.init_app(app, "trainer")
+logger = logging.getLogger(__name__)
+
+trainer_list_reads = AsyncSingleFlight("trainers")
+
+@app.route('/trainers', methods=['GET'])
+async def get_trainers():
+    """Get all trainers from database, optionally paginated or streamed"""
+    try:
+        limit, after = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if wants_stream(request.args):
+        query, params = keyset_query("SELECT * FROM trainer", "trainer_id", after)
+        return Response(ndjson_lines(query, params), mimetype='application/x-ndjson')
+
+    try:
+        async with pooled_cursor() as cursor:
+            etag = await list_etag(cursor, "trainer")
+        if is_fresh(request, etag):
+            return not_modified(etag)
+
+        async def fetch():
+            # Only the request running the query holds a connection
+            async with pooled_cursor() as cursor:
+                if limit is not None:
+                    query, params = keyset_query("SELECT * FROM trainer", "trainer_id", after, limit + 1)
+                    await cursor.execute(query, params)
+                    return build_page(await cursor.fetchall(), "trainer_id", limit)
+                await cursor.execute("SELECT * FROM trainer")
+                return await cursor.fetchall()
+
+        # Concurrent requests for the same version of the list share one query
+        body = await trainer_list_reads.do((etag, limit, after), fetch)
+        return jsonify(body), 200, {"ETag": etag}
+    except Error as e:
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/trainers/<int:id>', methods=['GET'])
+async def get_trainer(id):
+    """Get a trainer by ID"""
+    conn = None
+    try:
+        conn = await get_db_connection()
+        async with conn.cursor(DictCursor) as cursor:
+            # A version lookup by primary key decides 304 before the full query
+            etag = await entity_etag(cursor, "trainer", id)
+            if etag is None:
+                return jsonify({"error": f"Trainer with ID {id} not found"}), 404
+            if is_fresh(request, etag):
+                return not_modified(etag)
+
+            await cursor.execute("SELECT * FROM trainer WHERE trainer_id = %s", (id,))
+            trainer = await cursor.fetchone()
+
+        if not trainer:
+            return jsonify({"error": f"Trainer with ID {id} not found"}), 404
+
+        return jsonify(trainer), 200, {"ETag": etag}
+    except Error as e:
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn:
+            await release(conn)
+
+@app.route('/trainers/available', methods=['GET'])
+async def get_available_trainers():
+    """Get trainers with no active appointment on a date, optionally by specialty"""
+    booking_date = parse_date(request.args.get('date', ''))
+    if booking_date is None:
+        return jsonify({"error": "date is required as YYYY-MM-DD"}), 400
+
+    specialty = request.args.get('specialty')
+
+    conn = None
+    try:
+        conn = await get_db_connection()
+        # The index holds no past dates
+        slots = await get_availability(conn)
+        if slots.covers(booking_date):
+            booked = slots.booked_trainers(booking_date)
+        else:
+            async with conn.cursor(DictCursor) as cursor:
+                await cursor.execute(availability.BOOKED_QUERY, (booking_date,))
+                booked = {row['active_trainer_id'] for row in await cursor.fetchall()}
+
+        query = "SELECT * FROM trainer"
+        params = ()
+        if specialty:
+            query += " WHERE spesialisasi = %s"
+            params = (specialty,)
+
+        async with conn.cursor(DictCursor) as cursor:
+            await cursor.execute(query, params)
+            trainers = [trainer for trainer in await cursor.fetchall() if trainer['trainer_id'] not in booked]
+
+        return jsonify(trainers)
+    except Error as e:
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn:
+            await release(conn)
+
+@app.route('/trainers', methods=['POST'])
+async def add_trainer():
+    """Add a new trainer"""
+    data = await request.get_json()
+
+    if not data or not all(field in data for field in TRAINER_FIELDS):
+        return jsonify({"error": f"Missing required fields: {', '.join(TRAINER_FIELDS)}"}), 400
+
+    conn = None
+    try:
+        conn = await get_db_connection()
+        async with conn.cursor() as cursor:
+            query = """
+            INSERT INTO trainer (name, email, no_telp, spesialisasi)
+            VALUES (%s, %s, %s, %s)
+            """
+            values = tuple(data[field] for field in TRAINER_FIELDS)
+
+            await cursor.execute(query, values)
+            trainer_id = cursor.lastrowid
+            await bump_versions(cursor, "trainer")
+            await conn.commit()
+
+        logger.info("Added new trainer with ID: %s", trainer_id)
+
+        return jsonify({"trainer_id": trainer_id, **{field: data[field] for field in TRAINER_FIELDS}}), 201
+
+    except Error as e:
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn:
+            await release(conn)
+
+@app.route('/trainers/bulk', methods=['POST'])
+async def add_trainers_bulk():
+    """Add many trainers in one transaction"""
+    items, error = read_batch(await request.get_json())
+    if error:
+        return jsonify({"error": error}), 400
+
+    errors = validate_batch(items, TRAINER_FIELDS)
+    if errors:
+        return jsonify({"error": f"Batch rejected: {len(errors)} invalid item(s)", "errors": errors}), 400
+
+    conn = None
+    try:
+        conn = await get_db_connection()
+        async with conn.cursor() as cursor:
+            rows = [tuple(item[field] for field in TRAINER_FIELDS) for item in items]
+            trainer_ids = await insert_rows(cursor, "trainer", TRAINER_FIELDS, rows)
+            await bump_versions(cursor, "trainer")
+            await conn.commit()
+
+        logger.info("Added %s trainers in bulk", len(trainer_ids))
+
+        results = [
+            {"index": index, "trainer_id": trainer_id, **{field: item[field] for field in TRAINER_FIELDS}}
+            for index, (item, trainer_id) in enumerate(zip(items, trainer_ids))
+        ]
+        return jsonify({"created": len(results), "results": results}), 201
+
+    except Error as e:
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn:
+            await release(conn)
+
+@app.route('/trainers/import', methods=['POST'])
+async def import_trainers():
+    """Import trainers from a CSV upload; bad rows are reported, not fatal"""
+    conn = None
+    try:
+        conn = await get_db_connection()
+        report = await import_csv(conn, "trainers", await request_lines(request))
+        return jsonify(report.as_dict())
+
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Error as e:
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn:
+            await release(conn)
+
+@app.route('/trainers/<int:id>', methods=['PUT'])
+async def update_trainer(id):
+    """Update a trainer by ID"""
+    data = await request.get_json()
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
+
+    conn = None
+    try:
+        conn = await get_db_connection()
+        async with conn.cursor(DictCursor) as cursor:
+            update_fields = []
+            values = []
+
+            for field in TRAINER_FIELDS:
+                if field in data:
+                    update_fields.append(f"{field} = %s")
+                    values.append(data[field])
+
+            if not update_fields:
+                return jsonify({"error": "No valid fields to update"}), 400
+
+            values.append(id)
+
+            # The matched-row count doubles as the existence check
+            update_query = f"UPDATE trainer SET {', '.join(update_fields)} WHERE trainer_id = %s"
+            # Session rollups are attributed by specialty, so move them along
+            if 'spesialisasi' in data:
+                await cursor.execute(*revenue_rollups.trainer_statement(id, -1))
+            await cursor.execute(update_query, values)
+            if cursor.rowcount == 0:
+                return jsonify({"error": f"Trainer with ID {id} not found"}), 404
+            if 'spesialisasi' in data:
+                await cursor.execute(*revenue_rollups.trainer_statement(id, 1))
+
+            await cursor.execute("SELECT * FROM trainer WHERE trainer_id = %s", (id,))
+            updated_trainer = await cursor.fetchone()
+            await bump_versions(cursor, "trainer")
+            await conn.commit()
+            trainer_cache.set(id, updated_trainer)
+
+        return jsonify(updated_trainer)
+
+    except Error as e:
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn:
+            await release(conn)
+
+@app.route('/trainers/<int:id>', methods=['DELETE'])
+async def delete_trainer(id):
+    """Delete a trainer by ID"""
+    conn = None
+    try:
+        conn = await get_db_connection()
+        async with conn.cursor() as cursor:
+            # Appointments keep their sessions but lose the trainer's specialty
+            await cursor.execute(*revenue_rollups.remove_trainer_statement(id))
+            await cursor.execute("DELETE FROM trainer WHERE trainer_id = %s", (id,))
+            if cursor.rowcount == 0:
+                return jsonify({"error": f"Trainer with ID {id} not found"}), 404
+
+            await bump_versions(cursor, *DELETE_CASCADES["trainer"])
+            await conn.commit()
+            trainer_cache.invalidate(id)
+            availability.index.drop_trainer(id)
+
+        return jsonify({"message": f"Trainer with ID {id} successfully deleted"})
+
+    except Error as e:
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn:
+            await release(conn)
+
+@app.route('/pool/stats', methods=['GET'])
+async def get_pool_stats():
+    """Get database connection pool statistics for this process"""
+    return jsonify(await pool_stats())
+
+@app.route('/cache/stats', methods=['GET'])
+async def get_cache_stats():
+    """Get entity cache hit/miss counters for this process"""
+    return jsonify(cache_stats())
+
+@app.route('/slow-queries', methods=['GET'])
+async def get_slow_queries():
+    """Get the most recent slow queries logged by this process"""
+    limit = request.args.get('limit', type=int)
+    return jsonify(slow_queries.recent(limit))
+
+if __name__ == '__main__':
+    app.run(port=5001, debug=True)
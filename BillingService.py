@@ -1,40 +1,83 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 import logging
-import mysql.connector
+from decimal import Decimal
 from mysql.connector import Error
+from db import get_db_connection, pool_stats, fk_not_found
+from validation import BILLING_FOREIGN_KEYS, coerce_ids
+from entity_cache import get_customer, get_trainer, cache_stats
+from bulk import read_batch, fetch_existing
+import pricing
+from pricing import calculate_fees, quote_pairs
+import billing_stats
+import billing_links
+import revenue_rollups
+import export
+from pagination import parse_page_args, wants_stream, keyset_query, keyset_page, stream_ndjson
+import serialization
+import metrics
+import logging_setup
+import slow_queries
+from etag import entity_etag, list_etag, is_fresh, not_modified, bump_versions, DELETE_CASCADES
 from datetime import datetime
 
 app = Flask(__name__)
+serialization.init_app(app)
+metrics.init_app(app, "billing")
 
 # Logging setup
-logging.basicConfig(level=logging.DEBUG)
+logging_setup.init_app(app, "billing")
 logger = logging.getLogger(__name__)
 
-# Database connection function
-def get_db_connection():
-    return mysql.connector.connect(
-        host="localhost",
-        user="root",
-        password="",
-        database="gym"
-    )
+# Batch quotes with more pairs than this are streamed
+QUOTE_STREAM_THRESHOLD = 500
+
+def billing_response(billing_id, customer_id, amount, conn):
+    """Build a billing response without re-selecting the billings/customer join"""
+    customer = get_customer(customer_id, conn)
+    return {
+        "billing_id": billing_id,
+        "customer_id": customer_id,
+        "amount": Decimal(str(amount)).quantize(Decimal("0.01")),
+        "customer_name": customer['name'] if customer else None
+    }
+
+BILLINGS_QUERY = """
+    SELECT b.*, c.name as customer_name 
+    FROM billings b
+    LEFT JOIN customer c ON b.customer_id = c.customer_id
+"""
 
 @app.route('/billings', methods=['GET'])
 def get_billings():
-    """Get all billing records"""
+    """Get all billing records, optionally paginated or streamed"""
+    try:
+        limit, after = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    if wants_stream(request.args):
+        return stream_ndjson(*keyset_query(BILLINGS_QUERY, "b.billing_id", after))
+    
+    conn = None
+    cursor = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
-        cursor.execute("""
-            SELECT b.*, c.name as customer_name 
-            FROM billings b
-            LEFT JOIN customer c ON b.customer_id = c.customer_id
-        """)
+        
+        etag = list_etag(cursor, "billing")
+        if is_fresh(request, etag):
+            return not_modified(etag)
+        
+        if limit is not None:
+            page = keyset_page(cursor, BILLINGS_QUERY, "b.billing_id", "billing_id", limit, after)
+            return jsonify(page), 200, {"ETag": etag}
+        
+        cursor.execute(BILLINGS_QUERY)
         billings = cursor.fetchall()
         
-        return jsonify(billings)
+        return jsonify(billings), 200, {"ETag": etag}
     except Error as e:
-        logger.error(f"Database error: {e}")
+        logger.error("Database error: %s", e)
         return jsonify({"error": str(e)}), 500
     finally:
         if cursor:
@@ -42,12 +85,33 @@ def get_billings():
         if conn:
             conn.close()
 
+@app.route('/billings/export', methods=['GET'])
+def export_billings():
+    """Stream every billing with its customer and appointments as CSV or NDJSON"""
+    try:
+        fmt, after = export.export_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    # Resumable: pass the last complete billing_id received as `after`
+    return export.stream_export(fmt, after)
+
 @app.route('/billings/<int:id>', methods=['GET'])
 def get_billing(id):
     """Get billing record by ID"""
+    conn = None
+    cursor = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
+        
+        # A version lookup by primary key decides 304 before the full query
+        etag = entity_etag(cursor, "billing", id)
+        if etag is None:
+            return jsonify({"error": f"Billing record with ID {id} not found"}), 404
+        if is_fresh(request, etag):
+            return not_modified(etag)
+        
         cursor.execute("""
             SELECT b.*, c.name as customer_name 
             FROM billings b
@@ -67,16 +131,11 @@ def get_billing(id):
         """, (id,))
         appointments = cursor.fetchall()
         
-        # Format dates for JSON response
-        for appointment in appointments:
-            if 'booking_date' in appointment and appointment['booking_date']:
-                appointment['booking_date'] = appointment['booking_date'].isoformat()
-        
         billing['appointments'] = appointments
         
-        return jsonify(billing)
+        return jsonify(billing), 200, {"ETag": etag}
     except Error as e:
-        logger.error(f"Database error: {e}")
+        logger.error("Database error: %s", e)
         return jsonify({"error": str(e)}), 500
     finally:
         if cursor:
@@ -87,6 +146,8 @@ def get_billing(id):
 @app.route('/billings/customer/<int:customer_id>', methods=['GET'])
 def get_customer_billings(customer_id):
     """Get all billing records for a specific customer"""
+    conn = None
+    cursor = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
@@ -106,7 +167,7 @@ def get_customer_billings(customer_id):
         
         return jsonify(billings)
     except Error as e:
-        logger.error(f"Database error: {e}")
+        logger.error("Database error: %s", e)
         return jsonify({"error": str(e)}), 500
     finally:
         if cursor:
@@ -117,23 +178,27 @@ def get_customer_billings(customer_id):
 @app.route('/billings/appointment/<int:appointment_id>', methods=['GET'])
 def get_billing_by_appointment_id(appointment_id):
     """Get billing information related to a specific appointment"""
+    conn = None
+    cursor = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
 
         # Get appointment data
-        cursor.execute("""
-            SELECT a.*, c.name as customer_name, c.membership_type, t.name as trainer_name, t.spesialisasi
-            FROM appointments a
-            LEFT JOIN customer c ON a.customer_id = c.customer_id
-            LEFT JOIN trainer t ON a.trainer_id = t.trainer_id
-            WHERE a.appointment_id = %s
-        """, (appointment_id,))
+        cursor.execute("SELECT * FROM appointments WHERE appointment_id = %s", (appointment_id,))
         appointment = cursor.fetchone()
 
         if not appointment:
             return jsonify({"error": f"Appointment with ID {appointment_id} not found"}), 404
 
+        # Customer and trainer details come from the read-through entity cache
+        customer = get_customer(appointment['customer_id'], conn) if appointment['customer_id'] else None
+        trainer = get_trainer(appointment['trainer_id'], conn) if appointment['trainer_id'] else None
+        appointment['customer_name'] = customer['name'] if customer else None
+        appointment['membership_type'] = customer['membership_type'] if customer else None
+        appointment['trainer_name'] = trainer['name'] if trainer else None
+        appointment['spesialisasi'] = trainer['spesialisasi'] if trainer else None
+
         # Get billing information if it exists
         billing_info = None
         if appointment['billing_id']:
@@ -142,20 +207,16 @@ def get_billing_by_appointment_id(appointment_id):
             """, (appointment['billing_id'],))
             billing_info = cursor.fetchone()
 
-        # Format dates for appointment
-        if 'booking_date' in appointment and appointment['booking_date']:
-            appointment['booking_date'] = appointment['booking_date'].isoformat()
-
         # Calculate billing details if not already assigned
         if not billing_info:
             # Calculate amount based on membership type and trainer specialization
-            base_fee = 200000 if appointment['membership_type'] == "Premium" else 150000
-            specialty_fee = 50000 if appointment['spesialisasi'] == "Strength Training" else 30000
-            total_amount = base_fee + specialty_fee
+            base_fee, specialty_fee, total_amount = calculate_fees(
+                appointment['membership_type'], appointment['spesialisasi']
+            )
             
             billing_info = {
                 "customer_id": appointment['customer_id'],
-                "amount": float(total_amount)
+                "amount": total_amount
             }
 
         response = {
@@ -165,7 +226,7 @@ def get_billing_by_appointment_id(appointment_id):
 
         return jsonify(response)
     except Error as e:
-        logger.error(f"Database error: {e}")
+        logger.error("Database error: %s", e)
         return jsonify({"error": str(e)}), 500
     finally:
         if cursor:
@@ -185,15 +246,23 @@ def create_billing():
         error_message = f"Missing required fields: {', '.join(missing_fields)}" if missing_fields else "No data provided"
         return jsonify({"error": error_message}), 400
     
+    appointment_ids, error_message = billing_links.read_appointment_ids(data)
+    if error_message:
+        return jsonify({"error": error_message}), 400
+    
+    conn = None
+    cursor = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        # Check if customer exists
-        cursor.execute("SELECT customer_id FROM customer WHERE customer_id = %s", (data['customer_id'],))
-        if not cursor.fetchone():
-            return jsonify({"error": f"Customer with ID {data['customer_id']} not found"}), 404
+        # Lock the appointments first so the checks still hold at commit
+        if appointment_ids:
+            problems = billing_links.check_links(cursor, appointment_ids)
+            if problems:
+                return jsonify(problems), 400
         
+        # fk_billings_customer replaces the customer existence SELECT
         insert_query = """
         INSERT INTO billings (
             customer_id, amount
@@ -206,33 +275,27 @@ def create_billing():
         )
         
         cursor.execute(insert_query, values)
-        conn.commit()
         billing_id = cursor.lastrowid
+        billing_stats.apply_delta(cursor, data['customer_id'], 1, data['amount'])
+        revenue_rollups.apply(cursor, revenue_rollups.billing_statement(billing_id, 1))
+        
+        # Link the appointments in one statement, in the same transaction
+        if appointment_ids:
+            billing_links.link_appointments(cursor, billing_id, appointment_ids)
+            bump_versions(cursor, "billings", "appointments")
+        else:
+            bump_versions(cursor, "billings")
+        conn.commit()
         
-        # If appointments are provided, link them to this billing
-        if 'appointment_ids' in data and isinstance(data['appointment_ids'], list):
-            for app_id in data['appointment_ids']:
-                cursor.execute(
-                    "UPDATE appointments SET billing_id = %s WHERE appointment_id = %s",
-                    (billing_id, app_id)
-                )
-            conn.commit()
-        
-        # Get the created billing with customer name
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("""
-            SELECT b.*, c.name as customer_name 
-            FROM billings b
-            LEFT JOIN customer c ON b.customer_id = c.customer_id
-            WHERE b.billing_id = %s
-        """, (billing_id,))
-        
-        new_billing = cursor.fetchone()
+        new_billing = billing_response(billing_id, data['customer_id'], data['amount'], conn)
             
         return jsonify(new_billing), 201
         
     except Error as e:
-        logger.error(f"Database error: {e}")
+        not_found = fk_not_found(e, data, BILLING_FOREIGN_KEYS)
+        if not_found:
+            return jsonify({"error": not_found}), 404
+        logger.error("Database error: %s", e)
         return jsonify({"error": str(e)}), 500
     finally:
         if cursor:
@@ -248,13 +311,20 @@ def update_billing(id):
     if not data:
         return jsonify({"error": "No data provided"}), 400
     
+    appointment_ids, error_message = billing_links.read_appointment_ids(data)
+    if error_message:
+        return jsonify({"error": error_message}), 400
+    
+    conn = None
+    cursor = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
-        # Check if billing exists
-        cursor.execute("SELECT billing_id FROM billings WHERE billing_id = %s", (id,))
-        if not cursor.fetchone():
+        # Check if billing exists, locking it so the stats delta is exact
+        cursor.execute("SELECT customer_id, amount FROM billings WHERE billing_id = %s FOR UPDATE", (id,))
+        existing = cursor.fetchone()
+        if not existing:
             return jsonify({"error": f"Billing record with ID {id} not found"}), 404
         
         # Only update fields that are provided
@@ -266,56 +336,56 @@ def update_billing(id):
                 update_fields.append(f"{field} = %s")
                 values.append(data[field])
         
-        if not update_fields:
+        if not update_fields and appointment_ids is None:
             return jsonify({"error": "No valid fields to update"}), 400
         
-        # Add billing_id to values for the WHERE clause
-        values.append(id)
+        if appointment_ids:
+            problems = billing_links.check_links(cursor, appointment_ids, id)
+            if problems:
+                return jsonify(problems), 400
         
-        update_query = f"""
-        UPDATE billings 
-        SET {', '.join(update_fields)}
-        WHERE billing_id = %s
-        """
+        if update_fields:
+            # Add billing_id to values for the WHERE clause
+            values.append(id)
+            
+            update_query = f"""
+            UPDATE billings 
+            SET {', '.join(update_fields)}
+            WHERE billing_id = %s
+            """
+            
+            # The rollups move with the billing's customer and amount
+            revenue_rollups.apply(cursor, revenue_rollups.billing_statement(id, -1))
+            cursor.execute(update_query, values)
+            revenue_rollups.apply(cursor, revenue_rollups.billing_statement(id, 1))
+            billing_stats.move_billing(
+                cursor,
+                existing['customer_id'], existing['amount'],
+                data.get('customer_id', existing['customer_id']), data.get('amount', existing['amount'])
+            )
         
-        cursor.execute(update_query, values)
+        # The billing ends up linked to exactly the given appointments
+        if appointment_ids is not None:
+            billing_links.link_appointments(cursor, id, appointment_ids, replace=True)
+            bump_versions(cursor, "billings", "appointments")
+        else:
+            bump_versions(cursor, "billings")
         conn.commit()
         
-        # If customer_id is being updated, check if new customer exists
-        if 'customer_id' in data:
-            cursor.execute("SELECT customer_id FROM customer WHERE customer_id = %s", (data['customer_id'],))
-            if not cursor.fetchone():
-                return jsonify({"error": f"Customer with ID {data['customer_id']} not found"}), 404
-        
-        # If appointments are provided, update their billing_id
-        if 'appointment_ids' in data and isinstance(data['appointment_ids'], list):
-            # First, remove this billing_id from all appointments that may have it
-            cursor.execute(
-                "UPDATE appointments SET billing_id = NULL WHERE billing_id = %s",
-                (id,)
-            )
-            
-            # Then add this billing_id to specified appointments
-            for app_id in data['appointment_ids']:
-                cursor.execute(
-                    "UPDATE appointments SET billing_id = %s WHERE appointment_id = %s",
-                    (id, app_id)
-                )
-            conn.commit()
-        
-        # Get the updated billing
-        cursor.execute("""
-            SELECT b.*, c.name as customer_name 
-            FROM billings b
-            LEFT JOIN customer c ON b.customer_id = c.customer_id
-            WHERE b.billing_id = %s
-        """, (id,))
-        
-        updated_billing = cursor.fetchone()
+        updated_billing = billing_response(
+            id,
+            data.get('customer_id', existing['customer_id']),
+            data.get('amount', existing['amount']),
+            conn
+        )
         
         return jsonify(updated_billing)
     except Error as e:
-        logger.error(f"Database error: {e}")
+        # An unknown customer_id now fails the UPDATE on fk_billings_customer
+        not_found = fk_not_found(e, data, BILLING_FOREIGN_KEYS)
+        if not_found:
+            return jsonify({"error": not_found}), 404
+        logger.error("Database error: %s", e)
         return jsonify({"error": str(e)}), 500
     finally:
         if cursor:
@@ -326,25 +396,30 @@ def update_billing(id):
 @app.route('/billings/<int:id>', methods=['DELETE'])
 def delete_billing(id):
     """Delete a billing record"""
+    conn = None
+    cursor = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
         
         # Check if billing exists
-        cursor.execute("SELECT billing_id FROM billings WHERE billing_id = %s", (id,))
-        if not cursor.fetchone():
+        cursor.execute("SELECT customer_id, amount FROM billings WHERE billing_id = %s FOR UPDATE", (id,))
+        existing = cursor.fetchone()
+        if not existing:
             return jsonify({"error": f"Billing record with ID {id} not found"}), 404
         
-        # Remove billing_id reference from appointments
-        cursor.execute("UPDATE appointments SET billing_id = NULL WHERE billing_id = %s", (id,))
+        revenue_rollups.apply(cursor, revenue_rollups.billing_statement(id, -1))
         
-        # Delete the billing
+        # Delete the billing; fk_appointments_billing (ON DELETE SET NULL)
+        # unlinks its appointments
         cursor.execute("DELETE FROM billings WHERE billing_id = %s", (id,))
+        billing_stats.apply_delta(cursor, existing[0], -1, -existing[1])
+        bump_versions(cursor, *DELETE_CASCADES["billings"])
         conn.commit()
         
         return jsonify({"message": f"Billing record with ID {id} has been deleted"}), 200
     except Error as e:
-        logger.error(f"Database error: {e}")
+        logger.error("Database error: %s", e)
         return jsonify({"error": str(e)}), 500
     finally:
         if cursor:
@@ -354,44 +429,65 @@ def delete_billing(id):
 
 @app.route('/billings/stats', methods=['GET'])
 def get_billing_stats():
-    """Get billing statistics"""
+    """Get billing statistics from the incrementally maintained summary tables"""
+    conn = None
+    cursor = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
-        # Total billings
-        cursor.execute("SELECT COUNT(*) as total_count FROM billings")
-        total_result = cursor.fetchone()
+        stats = billing_stats.read_stats(cursor)
         
-        # Total billing amount
-        cursor.execute("SELECT SUM(amount) as total_amount FROM billings")
-        amount_result = cursor.fetchone()
-        total_amount = float(amount_result['total_amount']) if amount_result['total_amount'] else 0
+        return jsonify(stats)
+    except Error as e:
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+@app.route('/billings/stats/rebuild', methods=['POST'])
+def rebuild_billing_stats():
+    """Recompute the billing summary tables from the billings table"""
+    conn = None
+    try:
+        conn = get_db_connection()
+        customers = billing_stats.rebuild(conn)
+        logger.info("Rebuilt billing stats for %s customers", customers)
         
-        # Count by customer
-        cursor.execute("""
-            SELECT c.name, COUNT(b.billing_id) as count, SUM(b.amount) as total
-            FROM billings b
-            JOIN customer c ON b.customer_id = c.customer_id
-            GROUP BY b.customer_id
-            ORDER BY total DESC
-        """)
-        customer_stats = cursor.fetchall()
-        
-        # Format totals for JSON response
-        for stat in customer_stats:
-            if 'total' in stat and stat['total']:
-                stat['total'] = float(stat['total'])
-        
-        stats = {
-            "total_count": total_result['total_count'],
-            "total_amount": total_amount,
-            "by_customer": customer_stats
-        }
+        return jsonify({"message": f"Billing stats rebuilt for {customers} customers"})
+    except Error as e:
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn:
+            conn.close()
+
+@app.route('/billings/reports', methods=['GET'])
+def get_billing_reports():
+    """Get revenue and session counts per day or month from the rollup table"""
+    try:
+        granularity, start, end = revenue_rollups.report_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
         
-        return jsonify(stats)
+        etag = list_etag(cursor, "revenue")
+        if is_fresh(request, etag):
+            return not_modified(etag)
+        
+        report = revenue_rollups.read_report(cursor, granularity, start, end)
+        
+        return jsonify(report), 200, {"ETag": etag}
     except Error as e:
-        logger.error(f"Database error: {e}")
+        logger.error("Database error: %s", e)
         return jsonify({"error": str(e)}), 500
     finally:
         if cursor:
@@ -399,6 +495,41 @@ def get_billing_stats():
         if conn:
             conn.close()
 
+@app.route('/billings/reports/rebuild', methods=['POST'])
+def rebuild_billing_reports():
+    """Recompute the revenue rollups from billings and appointments"""
+    conn = None
+    try:
+        conn = get_db_connection()
+        rows = revenue_rollups.rebuild(conn)
+        logger.info("Rebuilt revenue rollups with %s rows", rows)
+        
+        return jsonify({"message": f"Revenue rollups rebuilt with {rows} rows"})
+    except Error as e:
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn:
+            conn.close()
+
+@app.route('/billings/pricing', methods=['GET'])
+def get_pricing_rules():
+    """Get the fee rules in effect in this process"""
+    # Picks up a changed rules file first
+    pricing.rules.table()
+    return jsonify(pricing.rules.stats())
+
+@app.route('/billings/pricing/reload', methods=['POST'])
+def reload_pricing_rules():
+    """Reload the fee rules file without waiting for the next change check"""
+    try:
+        pricing.rules.reload()
+    except (OSError, ValueError) as e:
+        logger.error("Could not reload pricing rules: %s", e)
+        return jsonify({"error": str(e)}), 400
+    
+    return jsonify(pricing.rules.stats())
+
 @app.route('/billings/calculate', methods=['POST'])
 def calculate_billing():
     """Calculate billing amount for specific customer and trainer"""
@@ -408,25 +539,19 @@ def calculate_billing():
         return jsonify({"error": "Missing required customer_id and/or trainer_id"}), 400
     
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
-        # Get customer data
-        cursor.execute("SELECT * FROM customer WHERE customer_id = %s", (data['customer_id'],))
-        customer = cursor.fetchone()
+        # Customer and trainer rows come from the read-through entity cache
+        customer = get_customer(data['customer_id'])
         if not customer:
             return jsonify({"error": f"Customer with ID {data['customer_id']} not found"}), 404
         
-        # Get trainer data
-        cursor.execute("SELECT * FROM trainer WHERE trainer_id = %s", (data['trainer_id'],))
-        trainer = cursor.fetchone()
+        trainer = get_trainer(data['trainer_id'])
         if not trainer:
             return jsonify({"error": f"Trainer with ID {data['trainer_id']} not found"}), 404
         
         # Calculate billing amount based on membership type and trainer specialization
-        base_fee = 200000 if customer['membership_type'] == "Premium" else 150000
-        specialty_fee = 50000 if trainer['spesialisasi'] == "Strength Training" else 30000
-        total_amount = base_fee + specialty_fee
+        base_fee, specialty_fee, total_amount = calculate_fees(
+            customer['membership_type'], trainer['spesialisasi']
+        )
         
         billing_calculation = {
             "customer_id": customer['customer_id'],
@@ -442,13 +567,83 @@ def calculate_billing():
         
         return jsonify(billing_calculation)
     except Error as e:
-        logger.error(f"Database error: {e}")
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/billings/calculate/batch', methods=['POST'])
+def calculate_billing_batch():
+    """Calculate billing amounts for many customer/trainer pairs"""
+    pairs, error = read_batch(request.json)
+    if error:
+        return jsonify({"error": error}), 400
+    
+    invalid = [
+        index for index, pair in enumerate(pairs)
+        if not isinstance(pair, dict) or 'customer_id' not in pair or 'trainer_id' not in pair
+    ]
+    if invalid:
+        return jsonify({
+            "error": "Missing required customer_id and/or trainer_id",
+            "invalid_indexes": invalid
+        }), 400
+    
+    # The lookups below return int keys
+    errors = coerce_ids(pairs, ['customer_id', 'trainer_id'])
+    if errors:
+        return jsonify({"error": f"Batch rejected: {len(errors)} invalid item(s)", "errors": errors}), 400
+    
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        
+        # Resolve every customer and trainer with one IN query each
+        customers = fetch_existing(
+            cursor, "customer", "customer_id", [pair['customer_id'] for pair in pairs],
+            ["name", "membership_type"]
+        )
+        trainers = fetch_existing(
+            cursor, "trainer", "trainer_id", [pair['trainer_id'] for pair in pairs],
+            ["name", "spesialisasi"]
+        )
+    except Error as e:
+        logger.error("Database error: %s", e)
         return jsonify({"error": str(e)}), 500
     finally:
         if cursor:
             cursor.close()
         if conn:
             conn.close()
+    
+    quotes = quote_pairs(pairs, customers, trainers)
+    
+    if len(pairs) <= QUOTE_STREAM_THRESHOLD:
+        return jsonify(list(quotes))
+    
+    def generate():
+        yield "["
+        for index, quote in enumerate(quotes):
+            yield ("," if index else "") + serialization.dumps(quote).decode()
+        yield "]"
+    
+    return Response(generate(), mimetype='application/json')
+
+@app.route('/pool/stats', methods=['GET'])
+def get_pool_stats():
+    """Get database connection pool statistics for this process"""
+    return jsonify(pool_stats())
+
+@app.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """Get entity cache hit/miss counters for this process"""
+    return jsonify(cache_stats())
+
+@app.route('/slow-queries', methods=['GET'])
+def get_slow_queries():
+    """Get the most recent slow queries logged by this process"""
+    limit = request.args.get('limit', type=int)
+    return jsonify(slow_queries.recent(limit))
 
 if __name__ == '__main__':
     app.run(port=5003, debug=True)
\ No newline at end of file
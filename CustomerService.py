@@ -1,32 +1,86 @@
 from flask import Flask, jsonify, request
-import mysql.connector
 from mysql.connector import Error
+from db import get_db_connection, pooled_cursor, pool_stats
+from entity_cache import customer_cache, cache_stats
+from validation import CUSTOMER_FIELDS, validate_batch
+from bulk import read_batch, insert_rows, fetch_existing
+import importer
+import customer_search
+import revenue_rollups
+from pagination import parse_page_args, wants_stream, keyset_query, keyset_page, stream_ndjson
+import serialization
+import metrics
+import logging_setup
+import slow_queries
+from coalesce import SingleFlight
+from etag import entity_etag, list_etag, is_fresh, not_modified, bump_versions, DELETE_CASCADES
 import logging
 
 app = Flask(__name__)
+serialization.init_app(app)
+metrics.init_app(app, "customer")
 
-logging.basicConfig(level=logging.DEBUG)
+logging_setup.init_app(app, "customer")
 logger = logging.getLogger(__name__)
 
-def get_db_connection():
-    return mysql.connector.connect(
-        host="localhost",
-        user="root",
-        password="",
-        database="gym"
-    )
+customer_list_reads = SingleFlight("customers")
 
 @app.route('/customers', methods=['GET'])
 def get_customers():
-    """Get all customers from database"""
+    """Get all customers from database, optionally paginated or streamed"""
+    try:
+        limit, after = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    if wants_stream(request.args):
+        return stream_ndjson(*keyset_query("SELECT * FROM customer", "customer_id", after))
+    
+    try:
+        with pooled_cursor(dictionary=True) as cursor:
+            etag = list_etag(cursor, "customer")
+        if is_fresh(request, etag):
+            return not_modified(etag)
+        
+        def fetch():
+            # Only the request running the query holds a connection
+            with pooled_cursor(dictionary=True) as cursor:
+                if limit is not None:
+                    return keyset_page(cursor, "SELECT * FROM customer", "customer_id", "customer_id", limit, after)
+                cursor.execute("SELECT * FROM customer")
+                return cursor.fetchall()
+        
+        # Concurrent requests for the same version of the list share one query
+        body = customer_list_reads.do((etag, limit, after), fetch)
+        return jsonify(body), 200, {"ETag": etag}
+    except Error as e:
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/customers/search', methods=['GET'])
+def search_customers():
+    """Find customers by part of their name, email or phone number"""
+    try:
+        q, match, limit, after = customer_search.search_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    conn = None
+    cursor = None
     try:
         conn = get_db_connection()
+        # Matching runs on the in-process trigram index; only the page is read
+        ids, next_cursor = customer_search.get_index(conn).search(q, match, limit, after)
         cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM customer")
-        customers = cursor.fetchall()
-        return jsonify(customers)
+        customers = fetch_existing(cursor, "customer", "customer_id", ids, CUSTOMER_FIELDS)
+        
+        return jsonify({
+            "data": [customers[customer_id] for customer_id in ids if customer_id in customers],
+            "limit": limit,
+            "next_cursor": next_cursor
+        })
     except Error as e:
-        logger.error(f"Database error: {e}")
+        logger.error("Database error: %s", e)
         return jsonify({"error": str(e)}), 500
     finally:
         if cursor:
@@ -37,18 +91,28 @@ def get_customers():
 @app.route('/customers/<int:id>', methods=['GET'])
 def get_customer(id):
     """Get a customer by ID"""
+    conn = None
+    cursor = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
+        
+        # A version lookup by primary key decides 304 before the full query
+        etag = entity_etag(cursor, "customer", id)
+        if etag is None:
+            return jsonify({"error": f"Customer with ID {id} not found"}), 404
+        if is_fresh(request, etag):
+            return not_modified(etag)
+        
         cursor.execute("SELECT * FROM customer WHERE customer_id = %s", (id,))
         customer = cursor.fetchone()
         
         if not customer:
             return jsonify({"error": f"Customer with ID {id} not found"}), 404
         
-        return jsonify(customer)
+        return jsonify(customer), 200, {"ETag": etag}
     except Error as e:
-        logger.error(f"Database error: {e}")
+        logger.error("Database error: %s", e)
         return jsonify({"error": str(e)}), 500
     finally:
         if cursor:
@@ -60,11 +124,12 @@ def get_customer(id):
 def add_customer():
     """Add a new customer"""
     data = request.json
-    required_fields = ['name', 'email', 'no_telp', 'alamat', 'membership_type']
     
-    if not data or not all(field in data for field in required_fields):
-        return jsonify({"error": f"Missing required fields: {', '.join(required_fields)}"}), 400
+    if not data or not all(field in data for field in CUSTOMER_FIELDS):
+        return jsonify({"error": f"Missing required fields: {', '.join(CUSTOMER_FIELDS)}"}), 400
     
+    conn = None
+    cursor = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
@@ -82,22 +147,18 @@ def add_customer():
         )
         
         cursor.execute(query, values)
-        conn.commit()
         customer_id = cursor.lastrowid
+        bump_versions(cursor, "customer")
+        conn.commit()
         
-        logger.info(f"Added new customer with ID: {customer_id}")
+        customer = {"customer_id": customer_id, **{field: data[field] for field in CUSTOMER_FIELDS}}
+        customer_search.index.record(customer)
+        logger.info("Added new customer with ID: %s", customer_id)
         
-        return jsonify({
-            "customer_id": customer_id,
-            "name": data['name'],
-            "email": data['email'],
-            "no_telp": data['no_telp'],
-            "alamat": data['alamat'],
-            "membership_type": data['membership_type']
-        }), 201
+        return jsonify(customer), 201
     
     except Error as e:
-        logger.error(f"Database error: {e}")
+        logger.error("Database error: %s", e)
         return jsonify({"error": str(e)}), 500
     finally:
         if cursor:
@@ -105,6 +166,68 @@ def add_customer():
         if conn:
             conn.close()
 
+@app.route('/customers/bulk', methods=['POST'])
+def add_customers_bulk():
+    """Add many customers in one transaction"""
+    items, error = read_batch(request.json)
+    if error:
+        return jsonify({"error": error}), 400
+    
+    errors = validate_batch(items, CUSTOMER_FIELDS)
+    if errors:
+        return jsonify({"error": f"Batch rejected: {len(errors)} invalid item(s)", "errors": errors}), 400
+    
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        
+        rows = [tuple(item[field] for field in CUSTOMER_FIELDS) for item in items]
+        customer_ids = insert_rows(cursor, "customer", CUSTOMER_FIELDS, rows)
+        bump_versions(cursor, "customer")
+        conn.commit()
+        
+        customers = [
+            {"customer_id": customer_id, **{field: item[field] for field in CUSTOMER_FIELDS}}
+            for item, customer_id in zip(items, customer_ids)
+        ]
+        for customer in customers:
+            customer_search.index.record(customer)
+        logger.info("Added %s customers in bulk", len(customer_ids))
+        
+        results = [{"index": index, **customer} for index, customer in enumerate(customers)]
+        return jsonify({"created": len(results), "results": results}), 201
+    
+    except Error as e:
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+@app.route('/customers/import', methods=['POST'])
+def import_customers():
+    """Import customers from a CSV upload; bad rows are reported, not fatal"""
+    conn = None
+    try:
+        conn = get_db_connection()
+        report = importer.import_csv(conn, "customers", importer.request_lines(request))
+        if report.imported:
+            customer_search.index.expire()
+        return jsonify(report.as_dict())
+    
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Error as e:
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn:
+            conn.close()
+
 @app.route('/customers/<int:id>', methods=['PUT'])
 def update_customer(id):
     """Update a customer by ID"""
@@ -112,16 +235,12 @@ def update_customer(id):
     if not data:
         return jsonify({"error": "No data provided"}), 400
     
+    conn = None
+    cursor = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
-        cursor.execute("SELECT * FROM customer WHERE customer_id = %s", (id,))
-        customer = cursor.fetchone()
-        
-        if not customer:
-            return jsonify({"error": f"Customer with ID {id} not found"}), 404
-        
         update_fields = []
         values = []
         
@@ -150,17 +269,28 @@ def update_customer(id):
         
         values.append(id)
         
+        # The matched-row count doubles as the existence check
         update_query = f"UPDATE customer SET {', '.join(update_fields)} WHERE customer_id = %s"
+        # Revenue rollups are attributed by membership type, so move them along
+        if 'membership_type' in data:
+            revenue_rollups.apply(cursor, revenue_rollups.customer_statement(id, -1))
         cursor.execute(update_query, values)
-        conn.commit()
+        if cursor.rowcount == 0:
+            return jsonify({"error": f"Customer with ID {id} not found"}), 404
+        if 'membership_type' in data:
+            revenue_rollups.apply(cursor, revenue_rollups.customer_statement(id, 1))
         
         cursor.execute("SELECT * FROM customer WHERE customer_id = %s", (id,))
         updated_customer = cursor.fetchone()
+        bump_versions(cursor, "customer")
+        conn.commit()
+        customer_cache.set(id, updated_customer)
+        customer_search.index.record(updated_customer)
         
         return jsonify(updated_customer)
     
     except Error as e:
-        logger.error(f"Database error: {e}")
+        logger.error("Database error: %s", e)
         return jsonify({"error": str(e)}), 500
     finally:
         if cursor:
@@ -171,23 +301,28 @@ def update_customer(id):
 @app.route('/customers/<int:id>', methods=['DELETE'])
 def delete_customer(id):
     """Delete a customer by ID"""
+    conn = None
+    cursor = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        cursor.execute("SELECT customer_id FROM customer WHERE customer_id = %s", (id,))
-        customer = cursor.fetchone()
-        
-        if not customer:
+        # Billings cascade with the customer, so take them out of the rollups
+        # first; the customer's billing stats row cascades with it
+        revenue_rollups.apply(cursor, revenue_rollups.remove_customer_statement(id))
+        cursor.execute("DELETE FROM customer WHERE customer_id = %s", (id,))
+        if cursor.rowcount == 0:
             return jsonify({"error": f"Customer with ID {id} not found"}), 404
         
-        cursor.execute("DELETE FROM customer WHERE customer_id = %s", (id,))
+        bump_versions(cursor, *DELETE_CASCADES["customer"])
         conn.commit()
+        customer_cache.invalidate(id)
+        customer_search.index.discard(id)
         
         return jsonify({"message": f"Customer with ID {id} successfully deleted"})
     
     except Error as e:
-        logger.error(f"Database error: {e}")
+        logger.error("Database error: %s", e)
         return jsonify({"error": str(e)}), 500
     finally:
         if cursor:
@@ -195,5 +330,21 @@ def delete_customer(id):
         if conn:
             conn.close()
 
+@app.route('/pool/stats', methods=['GET'])
+def get_pool_stats():
+    """Get database connection pool statistics for this process"""
+    return jsonify(pool_stats())
+
+@app.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """Get entity cache hit/miss counters for this process"""
+    return jsonify(cache_stats())
+
+@app.route('/slow-queries', methods=['GET'])
+def get_slow_queries():
+    """Get the most recent slow queries logged by this process"""
+    limit = request.args.get('limit', type=int)
+    return jsonify(slow_queries.recent(limit))
+
 if __name__ == '__main__':
     app.run(port=5000, debug=True)
\ No newline at end of file
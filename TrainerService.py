@@ -1,54 +1,132 @@
 from flask import Flask, jsonify, request
-import mysql.connector
 from mysql.connector import Error
+from db import get_db_connection, pooled_cursor, pool_stats
+from entity_cache import trainer_cache, cache_stats
+from validation import TRAINER_FIELDS, validate_batch
+from bulk import read_batch, insert_rows
+import importer
+from pagination import parse_page_args, wants_stream, keyset_query, keyset_page, stream_ndjson
+import serialization
+import metrics
+import logging_setup
+import slow_queries
+from coalesce import SingleFlight
+from etag import entity_etag, list_etag, is_fresh, not_modified, bump_versions, DELETE_CASCADES
+import availability
+import revenue_rollups
+from availability import get_index, parse_date
 import logging
 
 app = Flask(__name__)
+serialization.init_app(app)
+metrics.init_app(app, "trainer")
 
-logging.basicConfig(level=logging.DEBUG)
+logging_setup.init_app(app, "trainer")
 logger = logging.getLogger(__name__)
 
-def get_db_connection():
-    return mysql.connector.connect(
-        host="localhost",
-        user="root",
-        password="",
-        database="gym"
-    )
+trainer_list_reads = SingleFlight("trainers")
 
 @app.route('/trainers', methods=['GET'])
 def get_trainers():
-    """Get all trainers from database"""
+    """Get all trainers from database, optionally paginated or streamed"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM trainer")
-        trainers = cursor.fetchall()
-        return jsonify(trainers)
+        limit, after = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    if wants_stream(request.args):
+        return stream_ndjson(*keyset_query("SELECT * FROM trainer", "trainer_id", after))
+    
+    try:
+        with pooled_cursor(dictionary=True) as cursor:
+            etag = list_etag(cursor, "trainer")
+        if is_fresh(request, etag):
+            return not_modified(etag)
+        
+        def fetch():
+            # Only the request running the query holds a connection
+            with pooled_cursor(dictionary=True) as cursor:
+                if limit is not None:
+                    return keyset_page(cursor, "SELECT * FROM trainer", "trainer_id", "trainer_id", limit, after)
+                cursor.execute("SELECT * FROM trainer")
+                return cursor.fetchall()
+        
+        # Concurrent requests for the same version of the list share one query
+        body = trainer_list_reads.do((etag, limit, after), fetch)
+        return jsonify(body), 200, {"ETag": etag}
     except Error as e:
-        logger.error(f"Database error: {e}")
+        logger.error("Database error: %s", e)
         return jsonify({"error": str(e)}), 500
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
 
 @app.route('/trainers/<int:id>', methods=['GET'])
 def get_trainer(id):
     """Get a trainer by ID"""
+    conn = None
+    cursor = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
+        
+        # A version lookup by primary key decides 304 before the full query
+        etag = entity_etag(cursor, "trainer", id)
+        if etag is None:
+            return jsonify({"error": f"Trainer with ID {id} not found"}), 404
+        if is_fresh(request, etag):
+            return not_modified(etag)
+        
         cursor.execute("SELECT * FROM trainer WHERE trainer_id = %s", (id,))
         trainer = cursor.fetchone()
         
         if not trainer:
             return jsonify({"error": f"Trainer with ID {id} not found"}), 404
         
-        return jsonify(trainer)
+        return jsonify(trainer), 200, {"ETag": etag}
+    except Error as e:
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+@app.route('/trainers/available', methods=['GET'])
+def get_available_trainers():
+    """Get trainers with no active appointment on a date, optionally by specialty"""
+    booking_date = parse_date(request.args.get('date', ''))
+    if booking_date is None:
+        return jsonify({"error": "date is required as YYYY-MM-DD"}), 400
+    
+    specialty = request.args.get('specialty')
+    
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        
+        # Booked trainers come from the in-memory slot index, so this is one
+        # trainer query instead of one appointment query per trainer; the
+        # index holds no past dates
+        slots = get_index(conn)
+        if slots.covers(booking_date):
+            booked = slots.booked_trainers(booking_date)
+        else:
+            cursor.execute(availability.BOOKED_QUERY, (booking_date,))
+            booked = {row['active_trainer_id'] for row in cursor.fetchall()}
+        
+        query = "SELECT * FROM trainer"
+        params = ()
+        if specialty:
+            query += " WHERE spesialisasi = %s"
+            params = (specialty,)
+        
+        cursor.execute(query, params)
+        trainers = [trainer for trainer in cursor.fetchall() if trainer['trainer_id'] not in booked]
+        
+        return jsonify(trainers)
     except Error as e:
-        logger.error(f"Database error: {e}")
+        logger.error("Database error: %s", e)
         return jsonify({"error": str(e)}), 500
     finally:
         if cursor:
@@ -60,11 +138,12 @@ def get_trainer(id):
 def add_trainer():
     """Add a new trainer"""
     data = request.json
-    required_fields = ['name', 'email', 'no_telp', 'spesialisasi']
     
-    if not data or not all(field in data for field in required_fields):
-        return jsonify({"error": f"Missing required fields: {', '.join(required_fields)}"}), 400
+    if not data or not all(field in data for field in TRAINER_FIELDS):
+        return jsonify({"error": f"Missing required fields: {', '.join(TRAINER_FIELDS)}"}), 400
     
+    conn = None
+    cursor = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
@@ -81,10 +160,11 @@ def add_trainer():
         )
         
         cursor.execute(query, values)
-        conn.commit()
         trainer_id = cursor.lastrowid
+        bump_versions(cursor, "trainer")
+        conn.commit()
         
-        logger.info(f"Added new trainer with ID: {trainer_id}")
+        logger.info("Added new trainer with ID: %s", trainer_id)
         
         return jsonify({
             "trainer_id": trainer_id,
@@ -95,7 +175,7 @@ def add_trainer():
         }), 201
     
     except Error as e:
-        logger.error(f"Database error: {e}")
+        logger.error("Database error: %s", e)
         return jsonify({"error": str(e)}), 500
     finally:
         if cursor:
@@ -103,6 +183,63 @@ def add_trainer():
         if conn:
             conn.close()
 
+@app.route('/trainers/bulk', methods=['POST'])
+def add_trainers_bulk():
+    """Add many trainers in one transaction"""
+    items, error = read_batch(request.json)
+    if error:
+        return jsonify({"error": error}), 400
+    
+    errors = validate_batch(items, TRAINER_FIELDS)
+    if errors:
+        return jsonify({"error": f"Batch rejected: {len(errors)} invalid item(s)", "errors": errors}), 400
+    
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        
+        rows = [tuple(item[field] for field in TRAINER_FIELDS) for item in items]
+        trainer_ids = insert_rows(cursor, "trainer", TRAINER_FIELDS, rows)
+        bump_versions(cursor, "trainer")
+        conn.commit()
+        
+        logger.info("Added %s trainers in bulk", len(trainer_ids))
+        
+        results = [
+            {"index": index, "trainer_id": trainer_id, **{field: item[field] for field in TRAINER_FIELDS}}
+            for index, (item, trainer_id) in enumerate(zip(items, trainer_ids))
+        ]
+        return jsonify({"created": len(results), "results": results}), 201
+    
+    except Error as e:
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+@app.route('/trainers/import', methods=['POST'])
+def import_trainers():
+    """Import trainers from a CSV upload; bad rows are reported, not fatal"""
+    conn = None
+    try:
+        conn = get_db_connection()
+        report = importer.import_csv(conn, "trainers", importer.request_lines(request))
+        return jsonify(report.as_dict())
+    
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Error as e:
+        logger.error("Database error: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if conn:
+            conn.close()
+
 @app.route('/trainers/<int:id>', methods=['PUT'])
 def update_trainer(id):
     """Update a trainer by ID"""
@@ -110,14 +247,11 @@ def update_trainer(id):
     if not data:
         return jsonify({"error": "No data provided"}), 400
     
+    conn = None
+    cursor = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM trainer WHERE trainer_id = %s", (id,))
-        trainer = cursor.fetchone()
-        
-        if not trainer:
-            return jsonify({"error": f"Trainer with ID {id} not found"}), 404
         
         update_fields = []
         values = []
@@ -143,19 +277,27 @@ def update_trainer(id):
         
         values.append(id)
         
+        # The matched-row count doubles as the existence check
         update_query = f"UPDATE trainer SET {', '.join(update_fields)} WHERE trainer_id = %s"
-        cursor = conn.cursor()
+        # Session rollups are attributed by specialty, so move them along
+        if 'spesialisasi' in data:
+            revenue_rollups.apply(cursor, revenue_rollups.trainer_statement(id, -1))
         cursor.execute(update_query, values)
-        conn.commit()
+        if cursor.rowcount == 0:
+            return jsonify({"error": f"Trainer with ID {id} not found"}), 404
+        if 'spesialisasi' in data:
+            revenue_rollups.apply(cursor, revenue_rollups.trainer_statement(id, 1))
         
-        cursor = conn.cursor(dictionary=True)
         cursor.execute("SELECT * FROM trainer WHERE trainer_id = %s", (id,))
         updated_trainer = cursor.fetchone()
+        bump_versions(cursor, "trainer")
+        conn.commit()
+        trainer_cache.set(id, updated_trainer)
         
         return jsonify(updated_trainer)
     
     except Error as e:
-        logger.error(f"Database error: {e}")
+        logger.error("Database error: %s", e)
         return jsonify({"error": str(e)}), 500
     finally:
         if cursor:
@@ -166,23 +308,27 @@ def update_trainer(id):
 @app.route('/trainers/<int:id>', methods=['DELETE'])
 def delete_trainer(id):
     """Delete a trainer by ID"""
+    conn = None
+    cursor = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        cursor.execute("SELECT trainer_id FROM trainer WHERE trainer_id = %s", (id,))
-        trainer = cursor.fetchone()
-        
-        if not trainer:
+        # Appointments keep their sessions but lose the trainer's specialty
+        revenue_rollups.apply(cursor, revenue_rollups.remove_trainer_statement(id))
+        cursor.execute("DELETE FROM trainer WHERE trainer_id = %s", (id,))
+        if cursor.rowcount == 0:
             return jsonify({"error": f"Trainer with ID {id} not found"}), 404
         
-        cursor.execute("DELETE FROM trainer WHERE trainer_id = %s", (id,))
+        bump_versions(cursor, *DELETE_CASCADES["trainer"])
         conn.commit()
+        trainer_cache.invalidate(id)
+        availability.index.drop_trainer(id)
         
         return jsonify({"message": f"Trainer with ID {id} successfully deleted"})
     
     except Error as e:
-        logger.error(f"Database error: {e}")
+        logger.error("Database error: %s", e)
         return jsonify({"error": str(e)}), 500
     finally:
         if cursor:
@@ -190,5 +336,21 @@ def delete_trainer(id):
         if conn:
             conn.close()
 
+@app.route('/pool/stats', methods=['GET'])
+def get_pool_stats():
+    """Get database connection pool statistics for this process"""
+    return jsonify(pool_stats())
+
+@app.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """Get entity cache hit/miss counters for this process"""
+    return jsonify(cache_stats())
+
+@app.route('/slow-queries', methods=['GET'])
+def get_slow_queries():
+    """Get the most recent slow queries logged by this process"""
+    limit = request.args.get('limit', type=int)
+    return jsonify(slow_queries.recent(limit))
+
 if __name__ == '__main__':
     app.run(port=5001, debug=True)
\ No newline at end of file
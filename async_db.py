@@ -0,0 +1,595 @@
+import asyncio
+import io
+import logging
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from datetime import date
+
+import aiomysql
+from pymysql.constants import CLIENT
+
+from db import DB_CONFIG, POOL_SIZE, POOL_MAX_OVERFLOW, POOL_MAX_LIFETIME, POOL_TIMEOUT, AUTOINC_QUERY, autoinc_from_row
+from entity_cache import customer_cache, trainer_cache
+from bulk import INSERT_CHUNK_SIZE, existing_statement, insert_statement
+import availability
+import billing_stats
+import revenue_rollups
+import customer_search
+import etag
+import export
+import importer
+from group_commit import GroupCommitStats, GROUP_COMMIT_WINDOW_MS, GROUP_COMMIT_MAX_ROWS
+import metrics
+import slow_queries
+from serialization import ndjson_line
+
+logger = logging.getLogger(__name__)
+
+# aiomysql raises PyMySQL errors rather than mysql.connector ones
+Error = aiomysql.Error
+
+_pool = None
+_pool_lock = asyncio.Lock()
+# (innodb_autoinc_lock_mode, auto_increment_increment), read when the pool is created
+_autoinc = None
+# Bytes of a CSV upload kept in memory before it is spooled to disk
+IMPORT_SPOOL_SIZE = 8 * 1024 * 1024
+# Serializes the first, blocking load of the availability index
+_availability_first_load = asyncio.Lock()
+# Serializes the first, blocking load of the customer search index
+_customer_search_first_load = asyncio.Lock()
+
+
+class PoolTimeout(aiomysql.OperationalError):
+    pass
+
+
+class TimedCursorMixin:
+    """Record execute() time per query in metrics and slow queries, like db.TimedCursor"""
+
+    async def execute(self, query, args=None):
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = await super().execute(query, args)
+            failed = False
+            return result
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.observe_query(query, elapsed, failed)
+            if elapsed >= slow_queries.SLOW_QUERY_THRESHOLD:
+                slow_queries.record(query, args, elapsed, self.rowcount, failed)
+
+
+class Cursor(TimedCursorMixin, aiomysql.Cursor):
+    pass
+
+
+class DictCursor(TimedCursorMixin, aiomysql.DictCursor):
+    pass
+
+
+class SSDictCursor(TimedCursorMixin, aiomysql.SSDictCursor):
+    pass
+
+
+async def get_pool():
+    """Return the process-wide aiomysql pool, creating it on first use
+
+    Sizing mirrors the sync pool: POOL_SIZE connections are opened up front and
+    up to POOL_MAX_OVERFLOW more under load.
+    """
+    global _pool, _autoinc
+    if _pool is None:
+        async with _pool_lock:
+            if _pool is None:
+                pool = await aiomysql.create_pool(
+                    minsize=POOL_SIZE,
+                    maxsize=POOL_SIZE + POOL_MAX_OVERFLOW,
+                    pool_recycle=int(POOL_MAX_LIFETIME) if POOL_MAX_LIFETIME else -1,
+                    host=DB_CONFIG["host"],
+                    port=DB_CONFIG["port"],
+                    user=DB_CONFIG["user"],
+                    password=DB_CONFIG["password"],
+                    db=DB_CONFIG["database"],
+                    autocommit=False,
+                    # Matched-row counts, as in the sync pool
+                    client_flag=CLIENT.FOUND_ROWS,
+                    cursorclass=Cursor,
+                )
+                _autoinc = await _read_autoinc(pool)
+                _pool = pool
+    return _pool
+
+
+async def _read_autoinc(pool):
+    conn = await pool.acquire()
+    try:
+        async with conn.cursor() as cursor:
+            await cursor.execute(AUTOINC_QUERY)
+            row = await cursor.fetchone()
+    except Error as e:
+        logger.warning("Could not read the auto-increment settings (%s); bulk inserts go row by row", e)
+        return None, 1
+    finally:
+        pool.release(conn)
+    return autoinc_from_row(row)
+
+
+async def get_db_connection():
+    """Acquire a connection, giving up after POOL_TIMEOUT seconds"""
+    pool = await get_pool()
+    started = time.perf_counter()
+    try:
+        conn = await asyncio.wait_for(pool.acquire(), POOL_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise PoolTimeout(f"Timed out after {POOL_TIMEOUT}s waiting for a database connection")
+    metrics.observe_acquire("async", time.perf_counter() - started)
+    return conn
+
+
+async def release(conn):
+    """Return a connection to the pool, rolling back any open transaction"""
+    try:
+        await conn.rollback()
+    except Error as e:
+        logger.warning("Closing connection after failed rollback: %s", e)
+        conn.close()
+    (await get_pool()).release(conn)
+
+
+@asynccontextmanager
+async def pooled_cursor(cursorclass=DictCursor):
+    """Async counterpart of db.pooled_cursor()"""
+    conn = await get_db_connection()
+    try:
+        async with conn.cursor(cursorclass) as cursor:
+            yield cursor
+    finally:
+        await release(conn)
+
+
+async def pool_stats():
+    pool = await get_pool()
+    return {
+        "minsize": pool.minsize,
+        "maxsize": pool.maxsize,
+        "open": pool.size,
+        "idle": pool.freesize,
+        "in_use": pool.size - pool.freesize,
+    }
+
+
+async def fetch_existing(cursor, table, key_column, ids, columns=()):
+    """Async counterpart of bulk.fetch_existing()"""
+    ids = list(set(ids))
+    if not ids:
+        return {}
+    await cursor.execute(*existing_statement(table, key_column, ids, columns))
+    return {row[key_column]: row for row in await cursor.fetchall()}
+
+
+async def insert_rows(cursor, table, columns, rows, chunk_size=INSERT_CHUNK_SIZE):
+    """Async counterpart of bulk.insert_rows()"""
+    lock_mode, step = _autoinc or (None, 1)
+    ids = []
+    if lock_mode not in (0, 1):
+        query = insert_statement(table, columns, 1)
+        for row in rows:
+            await cursor.execute(query, row)
+            ids.append(cursor.lastrowid)
+        return ids
+
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        await cursor.execute(insert_statement(table, columns, len(chunk)), [value for row in chunk for value in row])
+        first_id = cursor.lastrowid
+        ids.extend(first_id + i * step for i in range(len(chunk)))
+    return ids
+
+
+async def rebuild_billing_stats(conn):
+    """Async counterpart of billing_stats.rebuild()"""
+    await conn.begin()
+    async with conn.cursor() as cursor:
+        for query in billing_stats.REBUILD_QUERIES:
+            await cursor.execute(query)
+        customers = cursor.rowcount
+    await conn.commit()
+    return customers
+
+
+async def rebuild_revenue_rollups(conn):
+    """Async counterpart of revenue_rollups.rebuild()"""
+    await conn.begin()
+    async with conn.cursor() as cursor:
+        for query, params in revenue_rollups.rebuild_statements():
+            await cursor.execute(query, params)
+        rows = cursor.rowcount
+        await bump_versions(cursor, "revenue_rollups")
+    await conn.commit()
+    return rows
+
+
+async def _read_through(cache, query, key, conn=None):
+    try:
+        key = int(key)
+    except (TypeError, ValueError):
+        return None
+
+    row = cache.get(key)
+    if row is not None:
+        return row
+
+    own_conn = conn is None
+    if own_conn:
+        conn = await get_db_connection()
+    try:
+        async with conn.cursor(DictCursor) as cursor:
+            await cursor.execute(query, (key,))
+            row = await cursor.fetchone()
+    finally:
+        if own_conn:
+            await release(conn)
+
+    if row is not None:
+        cache.set(key, row)
+    return row
+
+
+async def get_customer(customer_id, conn=None):
+    """Async read-through of the shared customer cache"""
+    return await _read_through(customer_cache, "SELECT * FROM customer WHERE customer_id = %s", customer_id, conn)
+
+
+async def get_trainer(trainer_id, conn=None):
+    """Async read-through of the shared trainer cache"""
+    return await _read_through(trainer_cache, "SELECT * FROM trainer WHERE trainer_id = %s", trainer_id, conn)
+
+
+async def _load_availability(conn):
+    since = date.today()
+    async with conn.cursor(DictCursor) as cursor:
+        # Bounded to today's and later slots, so this stays small
+        await cursor.execute(availability.LOAD_QUERY, (since,))
+        rows = await cursor.fetchall()
+    availability.index.load(rows, since)
+
+
+async def _reload_availability():
+    conn = None
+    try:
+        conn = await get_db_connection()
+        await _load_availability(conn)
+    except Exception as e:
+        availability.index.abort_reload()
+        logger.error("Reloading the availability index failed: %s", e)
+    finally:
+        if conn:
+            await release(conn)
+
+
+async def get_availability(conn=None):
+    """Async counterpart of availability.get_index()"""
+    index = availability.index
+    if not index.loaded():
+        own_conn = conn is None
+        if own_conn:
+            conn = await get_db_connection()
+        try:
+            # Claims the load, so concurrent first callers wait for it instead
+            async with _availability_first_load:
+                if not index.loaded():
+                    index.begin_reload()
+                    await _load_availability(conn)
+        except Error:
+            index.abort_reload()
+            raise
+        finally:
+            if own_conn:
+                await release(conn)
+    elif index.stale() and index.begin_reload():
+        asyncio.get_running_loop().create_task(_reload_availability())
+    return index
+
+
+async def taken_slots(cursor, slots):
+    """Async counterpart of availability.taken_slots()"""
+    hits = availability.index_hits(slots)
+    rows = []
+    for slot in hits:
+        await cursor.execute(availability.CONFIRM_QUERY, slot)
+        rows.append(await cursor.fetchone())
+    return availability.confirm_rows(hits, rows)
+
+
+async def _load_customer_search(conn, reload=False):
+    async with conn.cursor(DictCursor) as cursor:
+        await cursor.execute(customer_search.VERSION_QUERY)
+        row = await cursor.fetchone()
+        version = row['version'] if row else None
+        if reload and customer_search.index.unchanged(version):
+            return
+        await cursor.execute(customer_search.LOAD_QUERY)
+        rows = await cursor.fetchall()
+    # Building the index is CPU-bound; keep it off the event loop
+    await asyncio.to_thread(customer_search.index.load, rows, version)
+
+
+async def _reload_customer_search():
+    conn = None
+    try:
+        conn = await get_db_connection()
+        await _load_customer_search(conn, reload=True)
+    except Exception as e:
+        customer_search.index.abort_reload()
+        logger.error("Reloading the customer search index failed: %s", e)
+    finally:
+        if conn:
+            await release(conn)
+
+
+async def get_customer_search(conn=None):
+    """Async counterpart of customer_search.get_index()"""
+    index = customer_search.index
+    if not index.loaded():
+        own_conn = conn is None
+        if own_conn:
+            conn = await get_db_connection()
+        try:
+            # Claims the load, so concurrent first callers wait for it instead
+            async with _customer_search_first_load:
+                if not index.loaded():
+                    index.begin_reload()
+                    await _load_customer_search(conn)
+        except Error:
+            index.abort_reload()
+            raise
+        finally:
+            if own_conn:
+                await release(conn)
+    elif index.stale() and index.begin_reload():
+        asyncio.get_running_loop().create_task(_reload_customer_search())
+    return index
+
+
+async def entity_etag(cursor, kind, key):
+    """Async counterpart of etag.entity_etag()"""
+    await cursor.execute(*etag.entity_statement(kind, key))
+    return etag.entity_etag_from_row(kind, key, await cursor.fetchone())
+
+
+async def list_etag(cursor, kind):
+    """Async counterpart of etag.list_etag()"""
+    await cursor.execute(*etag.list_statement(kind))
+    return etag.list_etag_from_rows(kind, await cursor.fetchall())
+
+
+async def bump_versions(cursor, *tables):
+    """Async counterpart of etag.bump_versions()"""
+    await cursor.execute(*etag.bump_statement(*tables))
+
+
+async def stream_rows(query, params=()):
+    """Yield rows from an unbuffered server-side cursor
+
+    The connection is closed instead of reused if the consumer stops early,
+    so unread rows are never drained.
+    """
+    conn = await get_db_connection()
+    finished = False
+    try:
+        cursor = await conn.cursor(SSDictCursor)
+        await cursor.execute(query, params)
+        while True:
+            row = await cursor.fetchone()
+            if row is None:
+                break
+            yield row
+        await cursor.close()
+        finished = True
+    finally:
+        if not finished:
+            conn.close()
+        (await get_pool()).release(conn)
+
+
+async def ndjson_lines(query, params=()):
+    """Encode streamed rows as NDJSON lines"""
+    try:
+        async for row in stream_rows(query, params):
+            yield ndjson_line(row)
+    except Error as e:
+        logger.error("Database error while streaming: %s", e)
+        yield ndjson_line({"error": str(e)})
+
+
+async def export_lines(fmt, after=0):
+    """Async counterpart of export.stream_export(): the export as CSV or NDJSON chunks"""
+    try:
+        if fmt == "csv":
+            yield export.csv_header()
+        grouper = export.BillingGrouper()
+        async for row in stream_rows(*export.export_statement(after)):
+            billing = grouper.add(row)
+            if billing is not None:
+                yield export.encode_billing(billing, fmt)
+        billing = grouper.finish()
+        if billing is not None:
+            yield export.encode_billing(billing, fmt)
+    except Error as e:
+        logger.error("Database error while exporting: %s", e)
+        if fmt != "ndjson":
+            raise
+        yield ndjson_line({"error": str(e)})
+
+
+async def request_lines(request):
+    """Async counterpart of importer.request_lines()
+
+    The upload is spooled to a temporary file first, so the CSV is parsed
+    without awaiting the client between rows.
+    """
+    upload = (await request.files).get('file')
+    if upload:
+        stream = upload.stream
+    else:
+        stream = tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_SIZE)
+        async for data in request.body:
+            stream.write(data)
+    stream.seek(0)
+    return io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+
+
+async def _stage(conn, cursor, table, fields, chunk, report):
+    try:
+        await cursor.execute(importer.stage_statement(table, fields, len(chunk)), importer.stage_params(chunk))
+        await conn.commit()
+        report.staged += len(chunk)
+        return
+    except Error:
+        await conn.rollback()
+
+    # Find the rows the database refuses
+    for line, values in chunk:
+        try:
+            await cursor.execute(importer.stage_statement(table, fields, 1), (line, *values))
+            await conn.commit()
+            report.staged += 1
+        except Error as e:
+            await conn.rollback()
+            report.reject(line, e.args[1] if len(e.args) > 1 else str(e))
+
+
+async def import_csv(conn, entity, lines, chunk_size=importer.IMPORT_CHUNK_SIZE):
+    """Async counterpart of importer.import_csv()"""
+    table, fields = importer.ENTITIES[entity]
+    report = importer.ImportReport()
+    chunks = importer.read_chunks(lines, fields, report, chunk_size)
+
+    async with conn.cursor() as cursor:
+        try:
+            for query in importer.staging_statements(table, fields):
+                await cursor.execute(query)
+            for chunk in chunks:
+                await _stage(conn, cursor, table, fields, chunk, report)
+
+            if report.staged:
+                await cursor.execute(importer.merge_statement(table, fields))
+                report.imported = cursor.rowcount
+                report.first_id = cursor.lastrowid
+                await bump_versions(cursor, table)
+                await conn.commit()
+            logger.info("Imported %s %s, rejected %s rows", report.imported, entity, report.rejected)
+            return report
+        finally:
+            try:
+                await cursor.execute(importer.drop_staging_statement(table))
+            except Error as e:
+                logger.warning("Could not drop %s: %s", importer.staging_table(table), e)
+
+
+class AsyncGroupCommitBuffer(GroupCommitStats):
+    """group_commit.GroupCommitBuffer for the Quart services
+
+    submit() is awaited by request tasks and a flusher task on the same event
+    loop writes the batches. `after_insert(cursor, ids)` is a coroutine
+    function. A request that is cancelled while waiting does not take its
+    row out of the batch.
+    """
+
+    def __init__(self, table, columns, window=GROUP_COMMIT_WINDOW_MS / 1000, max_rows=GROUP_COMMIT_MAX_ROWS,
+                 after_insert=None):
+        super().__init__(table, columns, window, max_rows, after_insert)
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    async def submit(self, row):
+        """Write one row with the next group commit and return its ID"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        queued_at = time.monotonic()
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run())
+        self._pending.append((tuple(row), future))
+        self._wakeup.set()
+
+        try:
+            return await asyncio.shield(future)
+        finally:
+            self._record_wait(time.monotonic() - queued_at)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            while not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            deadline = loop.time() + self.window
+            while len(self._pending) < self.max_rows:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            batch = self._pending[:self.max_rows]
+            del self._pending[:self.max_rows]
+
+            try:
+                await self._flush(batch)
+            except Exception as e:
+                # Never leave a caller waiting, whatever went wrong
+                logger.error("Group commit flush failed: %s", e)
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    async def _flush(self, batch):
+        started = time.monotonic()
+        fallback = False
+        conn = None
+        try:
+            conn = await get_db_connection()
+            async with conn.cursor() as cursor:
+                try:
+                    ids = await insert_rows(cursor, self.table, self.columns, [row for row, _ in batch])
+                    if self.after_insert:
+                        await self.after_insert(cursor, ids)
+                    # One list-counter bump for the whole batch
+                    await bump_versions(cursor, self.table)
+                    await conn.commit()
+                except Error as e:
+                    await conn.rollback()
+                    if len(batch) == 1:
+                        batch[0][1].set_exception(e)
+                        return
+                    logger.warning("Group commit of %s rows failed (%s), retrying row by row", len(batch), e)
+                    fallback = True
+                    await self._flush_rows(conn, cursor, batch)
+                    return
+
+            for (_, future), new_id in zip(batch, ids):
+                future.set_result(new_id)
+        finally:
+            if conn:
+                await release(conn)
+            self._record_flush(time.monotonic() - started, len(batch), fallback)
+
+    async def _flush_rows(self, conn, cursor, batch):
+        query = insert_statement(self.table, self.columns, 1)
+        for row, future in batch:
+            try:
+                await cursor.execute(query, row)
+                new_id = cursor.lastrowid
+                if self.after_insert:
+                    await self.after_insert(cursor, [new_id])
+                await bump_versions(cursor, self.table)
+                await conn.commit()
+                future.set_result(new_id)
+            except Error as e:
+                await conn.rollback()
+                future.set_exception(e)
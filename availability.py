@@ -0,0 +1,318 @@
+import os
+import threading
+import time
+import logging
+from datetime import date, datetime
+
+from mysql.connector import Error
+from db import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+INDEX_TTL = float(os.environ.get("AVAILABILITY_INDEX_TTL", 300))
+
+# Cancelled appointments free the trainer's slot again
+CANCELLED_STATUS = "cancelled"
+
+# Past slots can no longer be booked, so only today's and later ones are
+# loaded; the (trainer_id, booking_date) index serves the date range
+LOAD_QUERY = """
+    SELECT appointment_id, trainer_id, booking_date, status
+    FROM appointments
+    WHERE trainer_id IS NOT NULL AND booking_date >= %s
+"""
+
+# Index hits are confirmed on the unique slot key before a booking is refused
+CONFIRM_QUERY = "SELECT appointment_id FROM appointments WHERE active_trainer_id = %s AND booking_date = %s"
+
+# Booked trainers on a date the index does not cover
+BOOKED_QUERY = "SELECT DISTINCT active_trainer_id FROM appointments WHERE booking_date = %s AND active_trainer_id IS NOT NULL"
+
+# Unique key from migrations/002_trainer_availability.sql
+SLOT_KEY = "uq_appointments_trainer_slot"
+
+
+def parse_date(value):
+    """Return `value` as a date, or None if it is not a YYYY-MM-DD date"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+def is_active(status):
+    return status != CANCELLED_STATUS
+
+
+def _trainer_key(trainer_id):
+    try:
+        return int(trainer_id)
+    except (TypeError, ValueError):
+        return None
+
+
+def slot_taken_message(trainer_id, booking_date):
+    return f"Trainer with ID {trainer_id} is already booked on {booking_date}"
+
+
+class _Slots:
+    """trainer -> date -> appointment and appointment -> slot"""
+
+    def __init__(self):
+        self.by_trainer = {}
+        self.by_appointment = {}
+
+    def record(self, appointment_id, trainer_id, booking_date, status):
+        self.remove(appointment_id)
+        trainer_id = _trainer_key(trainer_id)
+        if trainer_id is not None and is_active(status):
+            slot = (trainer_id, parse_date(booking_date))
+            self.by_trainer.setdefault(slot[0], {})[slot[1]] = appointment_id
+            self.by_appointment[appointment_id] = slot
+
+    def remove(self, appointment_id):
+        slot = self.by_appointment.pop(appointment_id, None)
+        if slot is None:
+            return
+        dates = self.by_trainer.get(slot[0], {})
+        if dates.get(slot[1]) == appointment_id:
+            del dates[slot[1]]
+            if not dates:
+                del self.by_trainer[slot[0]]
+
+    def drop_trainer(self, trainer_id):
+        for appointment_id in self.by_trainer.pop(_trainer_key(trainer_id), {}).values():
+            self.by_appointment.pop(appointment_id, None)
+
+
+class AvailabilityIndex:
+    """In-memory index of booked trainer slots from today on
+
+    A slot is one trainer on one booking date; appointments only carry a
+    date, so a trainer takes at most one active appointment per day. The
+    index maps trainer -> date -> appointment and appointment -> slot, so
+    a free slot is confirmed without touching the database.
+
+    Each process has its own copy. Writes in this process keep it current;
+    writes made by other processes are picked up when the index is reloaded
+    after `ttl` seconds. Like the customer search index, reloads after the
+    first run in the background while the current copy keeps serving, and
+    writes made meanwhile are replayed onto the new copy.
+
+    An entry may therefore be stale, so a hit is only a hint: see
+    taken_slots(). The unique key on appointments stays the authority for
+    double bookings.
+    """
+
+    def __init__(self, ttl=INDEX_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._slots = None
+        self._since = None
+        self._loaded_at = None
+        self._reloading = False
+        self._journal = []
+        self.loads = 0
+        self.conflicts = 0
+        self.stale_hits = 0
+
+    def loaded(self):
+        return self._slots is not None
+
+    def stale(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl
+
+    def begin_reload(self):
+        """Claim a reload; False if one is already running"""
+        with self._lock:
+            if self._reloading:
+                return False
+            self._reloading = True
+            self._journal = []
+            return True
+
+    def abort_reload(self):
+        with self._lock:
+            self._reloading = False
+            self._journal = []
+
+    def load(self, rows, since):
+        """Replace the index with rows from LOAD_QUERY run for dates from `since`"""
+        built = _Slots()
+        for row in rows:
+            built.record(row['appointment_id'], row['trainer_id'], row['booking_date'], row['status'])
+
+        with self._lock:
+            for method, args in self._journal:
+                getattr(built, method)(*args)
+            self._journal = []
+            self._reloading = False
+            self._slots = built
+            self._since = since
+            self._loaded_at = time.monotonic()
+            self.loads += 1
+
+    def covers(self, booking_date):
+        """True if the index holds the bookings of `booking_date`"""
+        booking_date = parse_date(booking_date)
+        return self._since is not None and booking_date is not None and booking_date >= self._since
+
+    def booking_for(self, trainer_id, booking_date):
+        """Return the appointment the index has in the slot, or None if it is free"""
+        with self._lock:
+            return self._slots.by_trainer.get(_trainer_key(trainer_id), {}).get(parse_date(booking_date))
+
+    def booked_trainers(self, booking_date):
+        """Return the IDs of trainers with an active appointment on the date"""
+        booking_date = parse_date(booking_date)
+        with self._lock:
+            return {trainer_id for trainer_id, dates in self._slots.by_trainer.items() if booking_date in dates}
+
+    def record(self, appointment_id, trainer_id, booking_date, status):
+        """Apply a committed create/update of an appointment"""
+        self._apply("record", (appointment_id, trainer_id, booking_date, status))
+
+    def discard(self, appointment_id):
+        """Apply a committed delete of an appointment, or drop a stale entry"""
+        self._apply("remove", (appointment_id,))
+
+    def drop_trainer(self, trainer_id):
+        """Forget a deleted trainer; its appointments keep no trainer"""
+        self._apply("drop_trainer", (trainer_id,))
+
+    def _apply(self, method, args):
+        with self._lock:
+            if self._reloading:
+                self._journal.append((method, args))
+            if self._slots is not None:
+                getattr(self._slots, method)(*args)
+
+    def count_conflict(self):
+        with self._lock:
+            self.conflicts += 1
+
+    def count_stale_hit(self):
+        with self._lock:
+            self.stale_hits += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "trainers": len(self._slots.by_trainer) if self._slots else 0,
+                "booked_slots": len(self._slots.by_appointment) if self._slots else 0,
+                "since": self._since.isoformat() if self._since else None,
+                "ttl": self.ttl,
+                "age": time.monotonic() - self._loaded_at if self._loaded_at is not None else None,
+                "reloading": self._reloading,
+                "loads": self.loads,
+                "conflicts": self.conflicts,
+                "stale_hits": self.stale_hits,
+            }
+
+
+index = AvailabilityIndex()
+# Serializes the first, blocking load
+_first_load_lock = threading.Lock()
+
+
+def _read_rows(conn):
+    since = date.today()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(LOAD_QUERY, (since,))
+        # Unbuffered, so the rows are never all held at once
+        index.load((row for row in cursor), since)
+    finally:
+        cursor.close()
+
+
+def _reload():
+    conn = None
+    try:
+        conn = get_db_connection()
+        _read_rows(conn)
+    except Exception as e:
+        index.abort_reload()
+        logger.error("Reloading the availability index failed: %s", e)
+    finally:
+        if conn:
+            conn.close()
+
+
+def _first_load(conn):
+    own_conn = conn is None
+    try:
+        if own_conn:
+            conn = get_db_connection()
+        index.begin_reload()
+        try:
+            _read_rows(conn)
+        except Error:
+            index.abort_reload()
+            raise
+    finally:
+        if own_conn and conn:
+            conn.close()
+
+
+def get_index(conn=None):
+    """Return the process-wide index
+
+    The first call loads it on the calling thread (reusing the caller's
+    connection when given); later reloads run on one background thread
+    while the current copy keeps serving.
+    """
+    if not index.loaded():
+        with _first_load_lock:
+            if not index.loaded():
+                _first_load(conn)
+    elif index.stale() and index.begin_reload():
+        threading.Thread(target=_reload, name="availability-reload", daemon=True).start()
+    return index
+
+
+def index_hits(slots):
+    """Map each of the (trainer_id, date) pairs the index has booked to its appointment"""
+    hits = {}
+    for trainer_id, booking_date in slots:
+        slot = (_trainer_key(trainer_id), parse_date(booking_date))
+        appointment_id = index.booking_for(*slot)
+        if appointment_id is not None:
+            hits[slot] = appointment_id
+    return hits
+
+
+def confirm_rows(hits, rows):
+    """Which index hits CONFIRM_QUERY still finds booked; stale entries are dropped
+
+    `rows` holds what CONFIRM_QUERY returned for each slot of `hits`, in
+    order: a row, or None.
+    """
+    taken = set()
+    for (slot, appointment_id), row in zip(hits.items(), rows):
+        if row is None:
+            index.discard(appointment_id)
+            index.count_stale_hit()
+        else:
+            taken.add(slot)
+    return taken
+
+
+def taken_slots(cursor, slots):
+    """Return the slots, of the (trainer_id, date) pairs given, that are booked
+
+    Returned slots are (int trainer_id, date). Slots the index has free are
+    taken as free: a concurrent booking is still stopped by the unique key.
+    Slots it has booked are confirmed with one unique key lookup each, since
+    another process may have freed them since the last reload.
+    """
+    hits = index_hits(slots)
+    rows = []
+    for slot in hits:
+        cursor.execute(CONFIRM_QUERY, slot)
+        rows.append(cursor.fetchone())
+    return confirm_rows(hits, rows)
@@ -0,0 +1,87 @@
+"""Micro-benchmark: encoding a large appointment list as a JSON response
+
+Compares the previous path (a per-row booking_date.isoformat() loop, then
+Flask's default jsonify) with the shared serialization provider on rows
+shaped like APPOINTMENTS_QUERY results. No database is needed.
+
+    python benchmarks/bench_serialization.py [--rows 100000] [--repeat 5]
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, jsonify
+
+import serialization
+
+
+def make_rows(count):
+    start = date(2025, 1, 1)
+    return [
+        {
+            "appointment_id": i,
+            "customer_id": i % 5000 + 1,
+            "trainer_id": i % 200 + 1,
+            "booking_date": start + timedelta(days=i % 365),
+            "billing_id": i // 3 if i % 4 else None,
+            "status": "confirmed" if i % 3 else "pending",
+            "customer_name": f"Customer {i % 5000 + 1}",
+            "trainer_name": f"Trainer {i % 200 + 1}",
+            "amount": Decimal("250000.00"),
+        }
+        for i in range(count)
+    ]
+
+
+def legacy(app, rows):
+    for row in rows:
+        if 'booking_date' in row and row['booking_date']:
+            row['booking_date'] = row['booking_date'].isoformat()
+        row['amount'] = float(row['amount'])
+    with app.app_context():
+        return jsonify(rows).get_data()
+
+
+def shared(app, rows):
+    with app.app_context():
+        return jsonify(rows).get_data()
+
+
+def timed(func, app, count, repeat):
+    best = None
+    size = 0
+    for _ in range(repeat):
+        rows = make_rows(count)
+        started = time.perf_counter()
+        size = len(func(app, rows))
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    default_app = Flask("legacy")
+    fast_app = serialization.init_app(Flask("shared"))
+    encoder = "orjson" if serialization.orjson is not None else "json (orjson not installed)"
+
+    legacy_time, legacy_size = timed(legacy, default_app, args.rows, args.repeat)
+    shared_time, shared_size = timed(shared, fast_app, args.rows, args.repeat)
+
+    print(f"{args.rows} rows, best of {args.repeat}")
+    print(f"  isoformat loop + Flask jsonify  {legacy_time * 1000:8.1f} ms  {legacy_size / 1e6:.1f} MB")
+    print(f"  serialization ({encoder})  {shared_time * 1000:8.1f} ms  {shared_size / 1e6:.1f} MB")
+    print(f"  speedup {legacy_time / shared_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
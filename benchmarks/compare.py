@@ -0,0 +1,60 @@
+"""Compare two loadtest.py reports endpoint by endpoint
+
+    python benchmarks/compare.py before.json after.json
+
+Prints throughput and p50/p95/p99 latency for both runs with the relative
+change; endpoints present in only one report are listed with a dash.
+"""
+import argparse
+import json
+
+METRICS = ("throughput_rps", "p50", "p95", "p99")
+
+
+def _metric(result, name):
+    if result is None:
+        return None
+    if name == "throughput_rps":
+        return result["throughput_rps"]
+    return result["latency_ms"][name]
+
+
+def _change(before, after):
+    if before is None or after is None:
+        return "-"
+    if not before:
+        return "n/a"
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def compare(before, after):
+    """Yield (endpoint, metric, before, after, change) rows"""
+    endpoints = ["total"] + sorted(set(before["endpoints"]) | set(after["endpoints"]))
+    for endpoint in endpoints:
+        if endpoint == "total":
+            old, new = before["total"], after["total"]
+        else:
+            old, new = before["endpoints"].get(endpoint), after["endpoints"].get(endpoint)
+        for metric in METRICS:
+            a, b = _metric(old, metric), _metric(new, metric)
+            yield endpoint, metric, a, b, _change(a, b)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("before")
+    parser.add_argument("after")
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+
+    print(f"{'endpoint':<36} {'metric':<15} {'before':>10} {'after':>10} {'change':>8}")
+    for endpoint, metric, a, b, change in compare(before, after):
+        print(f"{endpoint:<36} {metric:<15} {'-' if a is None else a:>10} {'-' if b is None else b:>10} {change:>8}")
+
+
+if __name__ == "__main__":
+    main()
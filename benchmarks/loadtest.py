@@ -0,0 +1,343 @@
+"""Replay a realistic request mix against the gym services and report latency
+
+Worker threads run weighted scenarios (browse, book, invoice, stats) that
+touch all four services, using IDs and dates from the manifest written by
+seed.py. At the end a JSON report with throughput, status counts and
+p50/p95/p99 latency per endpoint is written, ready for compare.py.
+
+    python benchmarks/loadtest.py --url http://127.0.0.1:5000 --duration 60 --concurrency 16
+    python benchmarks/loadtest.py --split --host 127.0.0.1     # one port per service, as run.py
+    python benchmarks/loadtest.py --in-process                 # sync gateway in this process
+
+--in-process needs no running servers, only the database from DB_*.
+Every worker draws from its own Random(seed + worker), so a run with the
+same seed and manifest sends the same request sequence per worker.
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta
+from urllib.parse import quote, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_MIX = "browse=50,book=20,invoice=15,stats=15"
+
+# Bookings go after the seeded dates, so most of them find a free slot
+BOOKING_HORIZON_DAYS = 365
+
+
+class HttpTarget:
+    """Keep-alive HTTP connections, one per worker thread and server"""
+
+    def __init__(self, routes, timeout=30):
+        # routes: first path segment -> "host:port", "" for everything else
+        self.routes = routes
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self, netloc):
+        connections = self._local.__dict__.setdefault("connections", {})
+        conn = connections.get(netloc)
+        if conn is None:
+            conn = connections[netloc] = http.client.HTTPConnection(netloc, timeout=self.timeout)
+        return conn
+
+    def request(self, method, path, body=None):
+        netloc = self.routes.get(path.lstrip('/').split('/', 1)[0], self.routes[""])
+        conn = self._connection(netloc)
+        payload = json.dumps(body) if body is not None else None
+        headers = {"Content-Type": "application/json"} if payload is not None else {}
+        try:
+            conn.request(method, path, payload, headers)
+            response = conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            self._local.connections.pop(netloc, None)
+            raise
+        if data and response.getheader("Content-Type", "").startswith("application/json"):
+            return response.status, json.loads(data)
+        return response.status, None
+
+
+class InProcessTarget:
+    """The sync gateway called through WSGI, without a server"""
+
+    def __init__(self):
+        from werkzeug.test import Client
+        from gateway import create_app
+
+        self.client = Client(create_app("sync"))
+
+    def request(self, method, path, body=None):
+        response = self.client.open(path, method=method, json=body)
+        return response.status_code, response.json if response.is_json else None
+
+
+class Recorder:
+    """Per-worker latency samples and status counts, keyed by endpoint name"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.scenarios = Counter()
+        self.recording = False
+
+
+class Session:
+    """What a scenario sees: a random source, the manifest and call()"""
+
+    def __init__(self, target, manifest, rng, recorder):
+        self.target = target
+        self.manifest = manifest
+        self.rng = rng
+        self.recorder = recorder
+
+    def call(self, name, method, path, body=None):
+        """Send one request and record it under `name`; returns (status, json)"""
+        started = time.perf_counter()
+        try:
+            status, data = self.target.request(method, path, body)
+        except Exception:
+            status, data = "error", None
+        elapsed = time.perf_counter() - started
+        if self.recorder.recording:
+            self.recorder.latencies[name].append(elapsed)
+            self.recorder.statuses[name][str(status)] += 1
+        return status, data
+
+    def pick(self, kind):
+        first, last = self.manifest["ranges"][kind]
+        return self.rng.randint(first, last) if last >= first else first
+
+    def seeded_date(self):
+        first, last = (date.fromisoformat(d) for d in self.manifest["booking_dates"])
+        return first + timedelta(days=self.rng.randint(0, max((last - first).days, 0)))
+
+    def future_date(self):
+        last = date.fromisoformat(self.manifest["booking_dates"][1])
+        return last + timedelta(days=self.rng.randint(1, BOOKING_HORIZON_DAYS))
+
+
+def browse(session):
+    """A member looks around: customer pages, a profile, free trainers, own bookings"""
+    after = session.pick("customers") - 1
+    session.call("GET /customers?limit", "GET", f"/customers?limit=50&after={after}")
+    customer_id = session.pick("customers")
+    session.call("GET /customers/<id>", "GET", f"/customers/{customer_id}")
+    session.call("GET /trainers/<id>", "GET", f"/trainers/{session.pick('trainers')}")
+    specialty = session.rng.choice(session.manifest["specialties"])
+    session.call("GET /trainers/available", "GET",
+                 f"/trainers/available?date={session.future_date()}&specialty={quote(specialty)}")
+    start = session.seeded_date()
+    session.call("GET /appointments/customer/<id>", "GET",
+                 f"/appointments/customer/{customer_id}?from={start}&to={start + timedelta(days=90)}")
+
+
+def book(session):
+    """Pick a free trainer for a date, book, then confirm"""
+    booking_date = session.future_date()
+    status, trainers = session.call("GET /trainers/available", "GET", f"/trainers/available?date={booking_date}")
+    if status == 200 and trainers:
+        trainer_id = session.rng.choice(trainers)["trainer_id"]
+    else:
+        trainer_id = session.pick("trainers")
+
+    status, appointment = session.call("POST /appointments", "POST", "/appointments", {
+        "customer_id": session.pick("customers"), "trainer_id": trainer_id,
+        "booking_date": booking_date.isoformat(), "status": "pending"
+    })
+    if status == 201 and session.rng.random() < 0.7:
+        session.call("PUT /appointments/<id>", "PUT",
+                     f"/appointments/{appointment['appointment_id']}", {"status": "confirmed"})
+
+
+def invoice(session):
+    """Price a session and invoice a customer's unbilled confirmed appointments"""
+    customer_id = session.pick("customers")
+    status, appointments = session.call("GET /appointments/customer/<id>", "GET",
+                                        f"/appointments/customer/{customer_id}?status=confirmed")
+    if status != 200:
+        return
+    unbilled = [a for a in appointments if a["billing_id"] is None and a["trainer_id"] is not None][:4]
+    if not unbilled:
+        return
+
+    status, fees = session.call("POST /billings/calculate", "POST", "/billings/calculate", {
+        "customer_id": customer_id, "trainer_id": unbilled[0]["trainer_id"]
+    })
+    if status != 200:
+        return
+    session.call("POST /billings", "POST", "/billings", {
+        "customer_id": customer_id,
+        "amount": fees["total_amount"] * len(unbilled),
+        "appointment_ids": [a["appointment_id"] for a in unbilled]
+    })
+
+
+def stats(session):
+    """Front-desk reporting: totals, one customer's invoices, a day's bookings"""
+    session.call("GET /billings/stats", "GET", "/billings/stats")
+    session.call("GET /billings/customer/<id>", "GET", f"/billings/customer/{session.pick('customers')}")
+    session.call("GET /billings/<id>", "GET", f"/billings/{session.pick('billings')}")
+    day = session.seeded_date()
+    session.call("GET /appointments?from&to", "GET",
+                 f"/appointments?from={day}&to={day}&status=confirmed&limit=100")
+
+
+SCENARIOS = {"browse": browse, "book": book, "invoice": invoice, "stats": stats}
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"unknown scenario {name!r}, expected one of {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of sorted samples"""
+    if not samples:
+        return None
+    return samples[max(math.ceil(fraction * len(samples)), 1) - 1]
+
+
+def summarize(samples, statuses, seconds):
+    samples = sorted(samples)
+    errors = sum(count for status, count in statuses.items() if status == "error" or status.startswith("5"))
+    return {
+        "requests": len(samples),
+        "throughput_rps": round(len(samples) / seconds, 2) if seconds else 0.0,
+        "errors": errors,
+        "statuses": dict(sorted(statuses.items())),
+        "latency_ms": {
+            "mean": round(sum(samples) / len(samples) * 1000, 3) if samples else None,
+            **{name: round(percentile(samples, fraction) * 1000, 3) if samples else None
+               for name, fraction in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99))},
+            "max": round(samples[-1] * 1000, 3) if samples else None,
+        },
+    }
+
+
+def run(target, manifest, args):
+    names, weights = zip(*args.mix.items())
+    recorders = [Recorder() for _ in range(args.concurrency)]
+    start_recording = time.monotonic() + args.warmup
+    deadline = start_recording + args.duration
+
+    def worker(index):
+        rng = random.Random(args.seed + index)
+        recorder = recorders[index]
+        session = Session(target, manifest, rng, recorder)
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                return
+            recorder.recording = now >= start_recording
+            scenario = rng.choices(names, weights)[0]
+            SCENARIOS[scenario](session)
+            if recorder.recording:
+                recorder.scenarios[scenario] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # The last iterations may run past the deadline; count them in the window
+    seconds = max(time.monotonic(), deadline) - start_recording
+
+    latencies = defaultdict(list)
+    statuses = defaultdict(Counter)
+    scenarios = Counter()
+    for recorder in recorders:
+        for name, samples in recorder.latencies.items():
+            latencies[name].extend(samples)
+            statuses[name].update(recorder.statuses[name])
+        scenarios.update(recorder.scenarios)
+
+    all_samples = [sample for samples in latencies.values() for sample in samples]
+    all_statuses = sum(statuses.values(), Counter())
+    return {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "target": args.target_description,
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "warmup_s": args.warmup,
+            "seed": args.seed,
+            "mix": args.mix,
+            "manifest": {"seed": manifest.get("seed"), "counts": manifest.get("counts")},
+        },
+        "elapsed_s": round(seconds, 3),
+        "scenarios": dict(scenarios),
+        "total": summarize(all_samples, all_statuses, seconds),
+        "endpoints": {name: summarize(latencies[name], statuses[name], seconds) for name in sorted(latencies)},
+    }
+
+
+def build_target(args):
+    if args.in_process:
+        args.target_description = "in-process"
+        return InProcessTarget()
+
+    if args.split:
+        from gateway import PATH_PREFIXES
+        from run import SERVICES
+
+        routes = {prefix: f"{args.host}:{SERVICES[service][2]}" for prefix, service in PATH_PREFIXES.items()}
+        routes[""] = routes["customers"]
+        args.target_description = f"split:{args.host}"
+        return HttpTarget(routes)
+
+    netloc = urlsplit(args.url).netloc
+    args.target_description = args.url
+    return HttpTarget({"": netloc})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", default="http://127.0.0.1:5000", help="gateway base URL (python run.py all)")
+    target.add_argument("--split", action="store_true", help="call each service on its own port from run.py")
+    target.add_argument("--in-process", action="store_true", help="call the sync gateway in this process")
+    parser.add_argument("--host", default="127.0.0.1", help="host for --split")
+    parser.add_argument("--manifest", default="seed_manifest.json")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"scenario weights, default {DEFAULT_MIX}")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=30, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="unmeasured seconds before the run")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="loadtest.json")
+    args = parser.parse_args()
+
+    with open(args.manifest) as f:
+        manifest = json.load(f)
+
+    report = run(build_target(args), manifest, args)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    total = report["total"]
+    print(f"{total['requests']} requests in {report['elapsed_s']}s, "
+          f"{total['throughput_rps']} req/s, {total['errors']} errors")
+    for name, result in report["endpoints"].items():
+        latency = result["latency_ms"]
+        print(f"{name:<36} {result['requests']:>7}  p50 {latency['p50']:>8} ms  "
+              f"p95 {latency['p95']:>8} ms  p99 {latency['p99']:>8} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Count database round trips per write endpoint
+
+Runs one request per endpoint through the sync gateway against the database
+configured by the DB_* variables (load gym.sql and the migrations first) and
+prints the number of statements and commits each one sent. The entity cache
+is cleared before every request so cache misses are included in the count.
+
+    python benchmarks/roundtrips.py [--output roundtrips.json]
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.test import Client
+
+import db
+from entity_cache import customer_cache, trainer_cache
+
+counts = {"execute": 0, "commit": 0}
+
+
+class CountingCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, *args, **kwargs):
+        counts["execute"] += 1
+        return self._cursor.execute(*args, **kwargs)
+
+
+def _cursor(self, *args, **kwargs):
+    return CountingCursor(self._raw.cursor(*args, **kwargs))
+
+
+def _commit(self):
+    counts["commit"] += 1
+    return self._raw.commit()
+
+
+db.PooledConnection.cursor = _cursor
+db.PooledConnection.commit = _commit
+
+from gateway import create_app  # noqa: E402  (import after patching)
+
+
+def measure(client, method, path, body=None):
+    customer_cache.clear()
+    trainer_cache.clear()
+    counts["execute"] = counts["commit"] = 0
+    response = client.open(path, method=method, json=body)
+    return response, {
+        "endpoint": f"{method} {path}",
+        "status": response.status_code,
+        "statements": counts["execute"],
+        "commits": counts["commit"],
+        "round_trips": counts["execute"] + counts["commit"]
+    }
+
+
+def run():
+    client = Client(create_app("sync"))
+    results = []
+
+    def call(method, path, body=None):
+        response, result = measure(client, method, path, body)
+        results.append(result)
+        return response.json
+
+    customer = call("POST", "/customers", {
+        "name": "Bench", "email": "bench@example.com", "no_telp": "0800",
+        "alamat": "Bench St", "membership_type": "premium"
+    })
+    trainer = call("POST", "/trainers", {
+        "name": "Bench", "email": "bench@example.com", "no_telp": "0800",
+        "spesialisasi": "strength"
+    })
+    customer_id, trainer_id = customer["customer_id"], trainer["trainer_id"]
+
+    appointment = call("POST", "/appointments", {
+        "customer_id": customer_id, "trainer_id": trainer_id,
+        "booking_date": "2025-01-01", "status": "pending"
+    })
+    appointment_id = appointment["appointment_id"]
+    call("PUT", f"/appointments/{appointment_id}", {"status": "confirmed"})
+
+    billing = call("POST", "/billings", {"customer_id": customer_id, "amount": 250000})
+    billing_id = billing["billing_id"]
+    call("PUT", f"/billings/{billing_id}", {"amount": 260000})
+    call("DELETE", f"/billings/{billing_id}")
+
+    call("DELETE", f"/appointments/{appointment_id}")
+    call("PUT", f"/customers/{customer_id}", {"no_telp": "0801"})
+    call("PUT", f"/trainers/{trainer_id}", {"no_telp": "0801"})
+    call("DELETE", f"/trainers/{trainer_id}")
+    call("DELETE", f"/customers/{customer_id}")
+
+    # Unknown IDs take the FK / matched-row path instead of a SELECT
+    call("POST", "/appointments", {
+        "customer_id": 0, "trainer_id": 0, "booking_date": "2025-01-01", "status": "pending"
+    })
+    call("PUT", "/customers/0", {"no_telp": "0801"})
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = run()
+    for result in results:
+        print(f"{result['endpoint']:<28} {result['status']}  "
+              f"{result['statements']} statements + {result['commits']} commits")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
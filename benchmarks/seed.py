@@ -0,0 +1,315 @@
+"""Generate scalable, reproducible seed data for load tests
+
+Fills customer, trainer, billings and appointments with synthetic rows
+from a fixed random seed, so the same arguments always produce the same
+data. Rows are written with multi-row INSERTs in chunks, straight into the
+database configured by the DB_* variables or into a SQL file that can be
+loaded into any local MariaDB/MySQL instance:
+
+    python benchmarks/seed.py --customers 1000000 --trainers 2000 --appointments 5000000
+    python benchmarks/seed.py --customers 10000 --appointments 50000 --reset --sql seed.sql
+
+A manifest with the generated ID ranges and booking dates is written next
+to the data (seed_manifest.json by default); loadtest.py reads it to pick
+IDs and dates that exist.
+
+The data keeps the invariants the services rely on: every trainer has at
+most one active appointment per booking date (the unique key from
+migrations/002), appointments only link to a billing of their own customer,
+and billing amounts follow pricing.calculate_fees() per linked session.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pricing import PREMIUM_MEMBERSHIP, STRENGTH_SPECIALTY, calculate_fees
+from etag import bump_statement
+
+CHUNK_SIZE = 5000
+
+FIRST_NAMES = [
+    "Andi", "Budi", "Citra", "Dewi", "Eka", "Fajar", "Gita", "Hadi", "Indah", "Joko",
+    "Kartika", "Lestari", "Made", "Nina", "Oki", "Putri", "Rizky", "Sari", "Tomi", "Wulan",
+]
+LAST_NAMES = [
+    "Setiawan", "Kurnia", "Wijaya", "Pratama", "Saputra", "Hidayat", "Lestari", "Nugroho",
+    "Santoso", "Halim", "Gunawan", "Siregar", "Simanjuntak", "Wibowo", "Utami", "Rahman",
+]
+STREETS = ["Mawar", "Melati", "Anggrek", "Kenanga", "Cempaka", "Dahlia", "Flamboyan", "Kamboja"]
+CITIES = ["Jakarta", "Bandung", "Surabaya", "Yogyakarta", "Medan", "Semarang", "Makassar", "Denpasar"]
+
+# (value, weight) pairs
+MEMBERSHIPS = [(PREMIUM_MEMBERSHIP, 30), ("Basic", 70)]
+SPECIALTIES = [
+    (STRENGTH_SPECIALTY, 30), ("Yoga & Flexibility", 20), ("Cardio & HIIT", 20),
+    ("Zumba & Dance", 10), ("Personal Training", 20),
+]
+STATUSES = [("confirmed", 75), ("pending", 15), ("cancelled", 10)]
+
+CUSTOMER_COLUMNS = ["customer_id", "name", "email", "no_telp", "alamat", "membership_type"]
+TRAINER_COLUMNS = ["trainer_id", "name", "email", "no_telp", "spesialisasi"]
+BILLING_COLUMNS = ["billing_id", "customer_id", "amount", "created_at"]
+# created_at follows booking_date, as in the backfill of migrations/005
+APPOINTMENT_COLUMNS = ["appointment_id", "customer_id", "trainer_id", "booking_date", "billing_id", "status", "created_at"]
+
+# Tables with a list ETag counter in table_versions
+VERSIONED_TABLES = ["appointments", "billings", "customer", "trainer"]
+
+# Children first, so foreign keys never point at a truncated table
+RESET_TABLES = ["appointments", "billings", "billing_customer_stats", "revenue_rollups", "trainer", "customer"]
+
+
+def _weighted(rng, choices):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights)[0]
+
+
+def _name(rng):
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+
+def _phone(rng):
+    return f"08{rng.randrange(10 ** 9, 10 ** 10)}"
+
+
+def customer_rows(rng, first_id, count, premium):
+    """Yield customer rows, recording each customer's membership in `premium`"""
+    for customer_id in range(first_id, first_id + count):
+        membership = _weighted(rng, MEMBERSHIPS)
+        premium.append(membership == PREMIUM_MEMBERSHIP)
+        yield (
+            customer_id, _name(rng), f"customer{customer_id}@example.com", _phone(rng),
+            f"Jl. {rng.choice(STREETS)} No. {rng.randint(1, 200)}, {rng.choice(CITIES)}", membership
+        )
+
+
+def trainer_rows(rng, first_id, count, strength):
+    """Yield trainer rows, recording each trainer's specialty in `strength`"""
+    for trainer_id in range(first_id, first_id + count):
+        specialty = _weighted(rng, SPECIALTIES)
+        strength.append(specialty == STRENGTH_SPECIALTY)
+        yield trainer_id, _name(rng), f"trainer{trainer_id}@gymfit.com", _phone(rng), specialty
+
+
+def appointment_chunks(rng, args, ids, premium, strength):
+    """Yield (billing_rows, appointment_rows) chunks of about CHUNK_SIZE appointments
+
+    Appointment k takes trainer k % trainers on day k // trainers, so no
+    trainer is ever booked twice on one date. Appointments come in groups
+    of 1-4 for one customer; a group is invoiced together with probability
+    `args.billed`, leaving cancelled sessions out of the invoice.
+    """
+    fee_cache = {}
+    billings, appointments = [], []
+    billing_id = ids["billings"]
+    k = 0
+    while k < args.appointments:
+        customer_index = rng.randrange(args.customers)
+        group = min(rng.randint(1, 4), args.appointments - k)
+        billed = rng.random() < args.billed
+        group_billing = billing_id if billed else None
+        amount = 0
+
+        for _ in range(group):
+            trainer_index = k % args.trainers
+            booking_date = args.start_date + timedelta(days=k // args.trainers)
+            status = _weighted(rng, STATUSES)
+            linked = group_billing if status != "cancelled" else None
+            if linked is not None:
+                key = (premium[customer_index], strength[trainer_index])
+                if key not in fee_cache:
+                    fee_cache[key] = calculate_fees(
+                        PREMIUM_MEMBERSHIP if key[0] else "Basic",
+                        STRENGTH_SPECIALTY if key[1] else None
+                    )[2]
+                amount += fee_cache[key]
+            appointments.append((
+                ids["appointments"] + k, ids["customers"] + customer_index, ids["trainers"] + trainer_index,
+                booking_date, linked, status, booking_date
+            ))
+            k += 1
+
+        if amount:
+            billings.append((billing_id, ids["customers"] + customer_index, amount, booking_date))
+            billing_id += 1
+
+        if len(appointments) >= CHUNK_SIZE:
+            yield billings, appointments
+            billings, appointments = [], []
+
+    if appointments:
+        yield billings, appointments
+
+
+def _chunked(rows, size=CHUNK_SIZE):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def sql_literal(value):
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, date):
+        return f"'{value.isoformat()}'"
+    return "'" + str(value).replace("\\", "\\\\").replace("'", "''") + "'"
+
+
+class DatabaseSink:
+    """Writes chunks with executemany(), which sends one multi-row INSERT per chunk"""
+
+    def __init__(self):
+        import mysql.connector
+        from db import DB_CONFIG
+
+        self.conn = mysql.connector.connect(**DB_CONFIG)
+        self.cursor = self.conn.cursor()
+
+    def next_ids(self):
+        ids = {}
+        for name, table, column in (
+            ("customers", "customer", "customer_id"), ("trainers", "trainer", "trainer_id"),
+            ("billings", "billings", "billing_id"), ("appointments", "appointments", "appointment_id"),
+        ):
+            self.cursor.execute(f"SELECT COALESCE(MAX({column}), 0) + 1 FROM {table}")
+            ids[name] = int(self.cursor.fetchone()[0])
+        return ids
+
+    def reset(self):
+        self.cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+        for table in RESET_TABLES:
+            self.cursor.execute(f"TRUNCATE TABLE {table}")
+        self.cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+
+    def insert(self, table, columns, rows):
+        placeholders = ", ".join(["%s"] * len(columns))
+        self.cursor.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows)
+        self.conn.commit()
+
+    def finish(self):
+        import billing_stats
+        import revenue_rollups
+
+        billing_stats.rebuild(self.conn)
+        revenue_rollups.rebuild(self.conn)
+        # Writers bump the list ETag counters themselves (etag.bump_versions())
+        self.cursor.execute(*bump_statement(*VERSIONED_TABLES))
+        self.conn.commit()
+        self.cursor.close()
+        self.conn.close()
+
+
+class SqlFileSink:
+    """Writes the same multi-row INSERTs to a SQL script"""
+
+    def __init__(self, path):
+        self.file = open(path, "w")
+        self.file.write("-- Generated by benchmarks/seed.py\nSET autocommit = 0;\n")
+
+    def next_ids(self):
+        return {"customers": 1, "trainers": 1, "billings": 1, "appointments": 1}
+
+    def reset(self):
+        self.file.write("SET FOREIGN_KEY_CHECKS = 0;\n")
+        for table in RESET_TABLES:
+            self.file.write(f"TRUNCATE TABLE {table};\n")
+        self.file.write("SET FOREIGN_KEY_CHECKS = 1;\n")
+
+    def insert(self, table, columns, rows):
+        values = ",\n".join("(" + ", ".join(sql_literal(value) for value in row) + ")" for row in rows)
+        self.file.write(f"INSERT INTO {table} ({', '.join(columns)}) VALUES\n{values};\nCOMMIT;\n")
+
+    def finish(self):
+        tables = ", ".join(f"'{table}'" for table in VERSIONED_TABLES)
+        self.file.write(f"UPDATE table_versions SET version = version + 1 WHERE table_name IN ({tables});\nCOMMIT;\n")
+        self.file.close()
+
+
+def seed(args, sink):
+    rng = random.Random(args.seed)
+    if args.reset:
+        sink.reset()
+    ids = sink.next_ids()
+    counts = {"customers": 0, "trainers": 0, "billings": 0, "appointments": 0}
+
+    premium = []
+    for chunk in _chunked(customer_rows(rng, ids["customers"], args.customers, premium)):
+        sink.insert("customer", CUSTOMER_COLUMNS, chunk)
+        counts["customers"] += len(chunk)
+
+    strength = []
+    for chunk in _chunked(trainer_rows(rng, ids["trainers"], args.trainers, strength)):
+        sink.insert("trainer", TRAINER_COLUMNS, chunk)
+        counts["trainers"] += len(chunk)
+
+    for billings, appointments in appointment_chunks(rng, args, ids, premium, strength):
+        # Billings go first so the appointments' billing_id references exist
+        if billings:
+            sink.insert("billings", BILLING_COLUMNS, billings)
+            counts["billings"] += len(billings)
+        sink.insert("appointments", APPOINTMENT_COLUMNS, appointments)
+        counts["appointments"] += len(appointments)
+        print(f"\r{counts['appointments']}/{args.appointments} appointments", end="", file=sys.stderr)
+    print(file=sys.stderr)
+
+    sink.finish()
+
+    days = -(-args.appointments // args.trainers) if args.appointments else 0
+    return {
+        "seed": args.seed,
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "counts": counts,
+        "ranges": {name: [ids[name], ids[name] + counts[name] - 1] for name in counts},
+        "booking_dates": [args.start_date.isoformat(), (args.start_date + timedelta(days=max(days - 1, 0))).isoformat()],
+        "memberships": [value for value, _ in MEMBERSHIPS],
+        "specialties": [value for value, _ in SPECIALTIES],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--customers", type=int, default=10000)
+    parser.add_argument("--trainers", type=int, default=200)
+    parser.add_argument("--appointments", type=int, default=50000)
+    parser.add_argument("--billed", type=float, default=0.6, help="share of appointment groups that are invoiced")
+    parser.add_argument("--start-date", type=date.fromisoformat, default=date(2024, 1, 1))
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reset", action="store_true", help="truncate the gym tables first")
+    parser.add_argument("--sql", help="write a SQL script instead of inserting into the database")
+    parser.add_argument("--manifest", default="seed_manifest.json")
+    args = parser.parse_args()
+
+    if args.customers < 1 or args.trainers < 1 or args.appointments < 0:
+        parser.error("need at least one customer and one trainer")
+    if args.sql and not args.reset:
+        parser.error("--sql numbers rows from 1, so it needs --reset")
+
+    started = time.monotonic()
+    manifest = seed(args, SqlFileSink(args.sql) if args.sql else DatabaseSink())
+    manifest["seconds"] = round(time.monotonic() - started, 1)
+
+    with open(args.manifest, "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(json.dumps(manifest["counts"]), f"in {manifest['seconds']}s")
+    if args.sql:
+        print(f"Load {args.sql}, then run `python billing_stats.py rebuild` and "
+              "`python revenue_rollups.py rebuild` for the summary tables")
+
+
+if __name__ == "__main__":
+    main()
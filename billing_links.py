@@ -0,0 +1,92 @@
+from bulk import BULK_MAX_ITEMS, placeholders
+
+# Statements linking appointments to a billing in one set-based pass. The
+# caller runs them in the same transaction as the billing insert/update.
+LOCK_QUERY = "SELECT appointment_id, billing_id FROM appointments WHERE appointment_id IN ({}) FOR UPDATE"
+
+LINK_QUERY = "UPDATE appointments SET billing_id = %s WHERE appointment_id IN ({})"
+
+UNLINK_QUERY = "UPDATE appointments SET billing_id = NULL WHERE billing_id = %s"
+
+UNLINK_OTHERS_QUERY = UNLINK_QUERY + " AND appointment_id NOT IN ({})"
+
+
+def read_appointment_ids(data):
+    """Validate the optional `appointment_ids` list of a billing request
+
+    Returns (ids, error_message); ids is None when the field is absent and
+    duplicates are dropped keeping the first occurrence.
+    """
+    if 'appointment_ids' not in data:
+        return None, None
+
+    ids = data['appointment_ids']
+    if not isinstance(ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        return None, "appointment_ids must be a list of integers"
+    if len(ids) > BULK_MAX_ITEMS:
+        return None, f"A billing may link at most {BULK_MAX_ITEMS} appointments"
+    return list(dict.fromkeys(ids)), None
+
+
+def lock_statement(ids):
+    """Statement locking the appointments about to be linked"""
+    return LOCK_QUERY.format(placeholders(len(ids))), tuple(ids)
+
+
+def link_errors(ids, rows, billing_id=None):
+    """Check locked appointment rows against the requested IDs
+
+    Returns None when every appointment exists and is unbilled (or already
+    belongs to `billing_id`), otherwise one error body listing all problems.
+    """
+    current = {}
+    for row in rows:
+        if isinstance(row, dict):
+            current[row['appointment_id']] = row['billing_id']
+        else:
+            current[row[0]] = row[1]
+
+    unknown = [i for i in ids if i not in current]
+    already_billed = [
+        {"appointment_id": i, "billing_id": current[i]}
+        for i in ids
+        if current.get(i) is not None and current[i] != billing_id
+    ]
+
+    if not unknown and not already_billed:
+        return None
+
+    return {
+        "error": "Some appointments cannot be linked to this billing",
+        "unknown_appointment_ids": unknown,
+        "already_billed": already_billed
+    }
+
+
+def link_statements(billing_id, ids, replace=False):
+    """Statements pointing `ids` at the billing
+
+    With `replace`, appointments of the billing that are not in `ids` are
+    unlinked first, so the billing ends up with exactly these appointments.
+    """
+    statements = []
+    if replace:
+        if ids:
+            statements.append((UNLINK_OTHERS_QUERY.format(placeholders(len(ids))), (billing_id, *ids)))
+        else:
+            statements.append((UNLINK_QUERY, (billing_id,)))
+    if ids:
+        statements.append((LINK_QUERY.format(placeholders(len(ids))), (billing_id, *ids)))
+    return statements
+
+
+def check_links(cursor, ids, billing_id=None):
+    """Lock the appointments and return link_errors() for them"""
+    cursor.execute(*lock_statement(ids))
+    return link_errors(ids, cursor.fetchall(), billing_id)
+
+
+def link_appointments(cursor, billing_id, ids, replace=False):
+    """Link appointments inside the caller's transaction"""
+    for query, params in link_statements(billing_id, ids, replace):
+        cursor.execute(query, params)
@@ -0,0 +1,131 @@
+import sys
+import logging
+from decimal import Decimal
+
+from mysql.connector import Error
+from db import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+# Statements maintaining billing_customer_stats from migrations/001_billing_stats.sql
+CUSTOMER_DELTA_QUERY = """
+    INSERT INTO billing_customer_stats (customer_id, billing_count, total_amount)
+    VALUES (%s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        billing_count = billing_count + VALUES(billing_count),
+        total_amount = total_amount + VALUES(total_amount)
+"""
+
+# Derived from the per-customer rows rather than kept in a singleton row,
+# which every billing write in every process would have to lock
+TOTALS_QUERY = """
+    SELECT COALESCE(SUM(billing_count), 0) as total_count, COALESCE(SUM(total_amount), 0) as total_amount
+    FROM billing_customer_stats
+"""
+
+BY_CUSTOMER_QUERY = """
+    SELECT c.name, s.billing_count as count, s.total_amount as total
+    FROM billing_customer_stats s
+    JOIN customer c ON s.customer_id = c.customer_id
+    WHERE s.billing_count > 0
+    ORDER BY s.total_amount DESC
+"""
+
+
+def delta_statements(customer_id, count, amount):
+    """Statements adding `count` billings worth `amount` to a customer's aggregates"""
+    return [(CUSTOMER_DELTA_QUERY, (customer_id, count, amount))]
+
+
+def move_statements(old_customer_id, old_amount, new_customer_id, new_amount):
+    """Statements re-attributing an updated billing from its old values to its new ones"""
+    if old_customer_id == new_customer_id:
+        difference = Decimal(str(new_amount)) - Decimal(str(old_amount))
+        return delta_statements(new_customer_id, 0, difference) if difference else []
+    return (
+        delta_statements(old_customer_id, -1, -Decimal(str(old_amount)))
+        + delta_statements(new_customer_id, 1, new_amount)
+    )
+
+
+def apply_delta(cursor, customer_id, count, amount):
+    """Update the aggregates inside the caller's transaction"""
+    for query, params in delta_statements(customer_id, count, amount):
+        cursor.execute(query, params)
+
+
+def move_billing(cursor, old_customer_id, old_amount, new_customer_id, new_amount):
+    """Re-attribute an updated billing inside the caller's transaction"""
+    for query, params in move_statements(old_customer_id, old_amount, new_customer_id, new_amount):
+        cursor.execute(query, params)
+
+
+def format_stats(totals, customer_stats):
+    """Shape the summary rows like the original /billings/stats response"""
+    totals = totals or {"total_count": 0, "total_amount": 0}
+
+    # DECIMAL totals are encoded as exact strings by serialization.py
+    return {
+        "total_count": totals['total_count'],
+        "total_amount": totals['total_amount'] or 0,
+        "by_customer": customer_stats
+    }
+
+
+def read_stats(cursor):
+    """Read the precomputed aggregates (a dictionary cursor is expected)"""
+    cursor.execute(TOTALS_QUERY)
+    totals = cursor.fetchone()
+
+    cursor.execute(BY_CUSTOMER_QUERY)
+    customer_stats = cursor.fetchall()
+
+    return format_stats(totals, customer_stats)
+
+
+# Run in order in one transaction; the row count of the last one is the
+# number of customers with billings
+REBUILD_QUERIES = (
+    # Lock billings against concurrent writers while recounting
+    "SELECT COUNT(*) FROM billings LOCK IN SHARE MODE",
+    "DELETE FROM billing_customer_stats",
+    """
+        INSERT INTO billing_customer_stats (customer_id, billing_count, total_amount)
+        SELECT customer_id, COUNT(*), SUM(amount) FROM billings GROUP BY customer_id
+    """,
+)
+
+
+def rebuild(conn):
+    """Recompute the per-customer summary from billings in one transaction"""
+    cursor = conn.cursor()
+    try:
+        conn.start_transaction()
+        for query in REBUILD_QUERIES:
+            cursor.execute(query)
+            if cursor.with_rows:
+                cursor.fetchall()
+        customers = cursor.rowcount
+        conn.commit()
+        return customers
+    finally:
+        cursor.close()
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] != ['rebuild']:
+        print("Usage: python billing_stats.py rebuild")
+        sys.exit(2)
+
+    logging.basicConfig(level=logging.INFO)
+    conn = None
+    try:
+        conn = get_db_connection()
+        customers = rebuild(conn)
+        logger.info("Rebuilt billing stats for %s customers", customers)
+    except Error as e:
+        logger.error("Database error: %s", e)
+        sys.exit(1)
+    finally:
+        if conn:
+            conn.close()
@@ -0,0 +1,79 @@
+import os
+
+from db import autoinc_settings
+
+BULK_MAX_ITEMS = int(os.environ.get("BULK_MAX_ITEMS", 5000))
+INSERT_CHUNK_SIZE = int(os.environ.get("BULK_INSERT_CHUNK_SIZE", 500))
+
+
+def placeholders(count):
+    """Return "%s, %s, ..." for an IN list or VALUES tuple"""
+    return ", ".join(["%s"] * count)
+
+
+def read_batch(data):
+    """Validate the envelope of a bulk request body
+
+    Returns (items, error_message); the body is either a JSON array or an
+    object with an "items" array.
+    """
+    items = data.get('items') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return None, "Request body must be a non-empty array of items"
+    if len(items) > BULK_MAX_ITEMS:
+        return None, f"A batch may contain at most {BULK_MAX_ITEMS} items"
+    return items, None
+
+
+def fetch_existing(cursor, table, key_column, ids, columns=()):
+    """Look up many rows by primary key with a single IN query
+
+    Returns a dict of key -> row (a dictionary cursor is expected).
+    """
+    ids = list(set(ids))
+    if not ids:
+        return {}
+    cursor.execute(*existing_statement(table, key_column, ids, columns))
+    return {row[key_column]: row for row in cursor.fetchall()}
+
+
+def existing_statement(table, key_column, ids, columns=()):
+    """(query, params) selecting the rows of distinct, non-empty `ids`"""
+    select = ", ".join([key_column, *columns])
+    return f"SELECT {select} FROM {table} WHERE {key_column} IN ({placeholders(len(ids))})", ids
+
+
+def insert_statement(table, columns, count):
+    """INSERT of `count` rows of `columns`"""
+    row_sql = f"({placeholders(len(columns))})"
+    return f"INSERT INTO {table} ({', '.join(columns)}) VALUES {', '.join([row_sql] * count)}"
+
+
+def insert_rows(cursor, table, columns, rows, chunk_size=INSERT_CHUNK_SIZE):
+    """Insert rows with multi-row INSERT statements and return their new IDs
+
+    The caller owns the transaction. IDs are derived from the first
+    auto-increment value of each statement, which InnoDB allocates as one
+    consecutive block for a multi-row INSERT under innodb_autoinc_lock_mode
+    0 or 1 (the MariaDB default). Under mode 2 (the MySQL 8 default)
+    concurrent inserts may interleave with the block, so the rows are then
+    inserted one statement each.
+    """
+    if not rows:
+        return []
+
+    lock_mode, step = autoinc_settings()
+    ids = []
+    if lock_mode not in (0, 1):
+        query = insert_statement(table, columns, 1)
+        for row in rows:
+            cursor.execute(query, row)
+            ids.append(cursor.lastrowid)
+        return ids
+
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        cursor.execute(insert_statement(table, columns, len(chunk)), [value for row in chunk for value in row])
+        first_id = cursor.lastrowid
+        ids.extend(first_id + i * step for i in range(len(chunk)))
+    return ids
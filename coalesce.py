@@ -0,0 +1,196 @@
+"""Single-flight coalescing of identical concurrent reads
+
+When many clients ask for the same thing at once (the /trainers list at the
+morning rush, the appointments of one popular trainer), only the first
+request runs the query; the others wait for it and get the same result.
+With COALESCE_WINDOW_MS > 0 a result is also reused for that long after the
+query returns, so requests arriving just after it are served too.
+
+Results are shared between requests and must not be modified. A request may
+get the result of a query that started up to one query duration before it
+arrived (plus the window, if set), which is no staler than a response
+already in flight to another client; keys that have an ETag include it, so
+a shared body always matches its tag.
+
+Counters per group are in stats(), /cache/stats and /metrics
+(coalesced_requests_total).
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+import metrics
+
+COALESCE_ENABLED = os.environ.get("COALESCE", "1").lower() in ("1", "true")
+COALESCE_WINDOW_MS = float(os.environ.get("COALESCE_WINDOW_MS", 0))
+# Cached results kept per group before expired ones are swept
+COALESCE_MAX_CACHED = int(os.environ.get("COALESCE_MAX_CACHED", 1024))
+
+_groups = {}
+
+
+class _Group:
+    """Counters and the micro-cache shared by the sync and async variants"""
+
+    def __init__(self, name, window, max_cached):
+        self.name = name
+        self.window = window
+        self.max_cached = max_cached
+        self._cache = {}
+        self.queries = 0
+        self.shared = 0
+        self.cache_hits = 0
+        _groups[name] = self
+
+    def _cached(self, key):
+        entry = self._cache.get(key)
+        if entry is None:
+            return False, None
+        expires, result = entry
+        if expires < time.monotonic():
+            del self._cache[key]
+            return False, None
+        self.cache_hits += 1
+        metrics.observe_coalesce(self.name, "cached")
+        return True, result
+
+    def _store(self, key, result):
+        if self.window <= 0:
+            return
+        now = time.monotonic()
+        if len(self._cache) >= self.max_cached:
+            self._cache = {k: entry for k, entry in self._cache.items() if entry[0] >= now}
+            if len(self._cache) >= self.max_cached:
+                return
+        self._cache[key] = (now + self.window, result)
+
+    def _count(self, leader):
+        if leader:
+            self.queries += 1
+        else:
+            self.shared += 1
+        metrics.observe_coalesce(self.name, "query" if leader else "shared")
+
+    def stats(self, in_flight):
+        served = self.queries + self.shared + self.cache_hits
+        return {
+            "window": self.window,
+            "in_flight": in_flight,
+            "cached": len(self._cache),
+            "queries": self.queries,
+            "shared": self.shared,
+            "cache_hits": self.cache_hits,
+            # Queries saved per request served
+            "saved_ratio": (self.shared + self.cache_hits) / served if served else None,
+        }
+
+
+class SingleFlight(_Group):
+    """Coalesce identical reads across request threads
+
+    do(key, fn) runs fn() for the first caller of a key; callers arriving
+    while it runs block until it returns and get its result, or its
+    exception.
+    """
+
+    def __init__(self, name, window=COALESCE_WINDOW_MS / 1000, max_cached=COALESCE_MAX_CACHED):
+        super().__init__(name, window, max_cached)
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def do(self, key, fn):
+        if not COALESCE_ENABLED:
+            return fn()
+
+        with self._lock:
+            hit, result = self._cached(key)
+            if hit:
+                return result
+            future = self._flights.get(key)
+            leader = future is None
+            if leader:
+                future = self._flights[key] = Future()
+            self._count(leader)
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+                if not future.done():
+                    self._store(key, result)
+        future.set_result(result)
+        return result
+
+    def stats(self):
+        with self._lock:
+            return super().stats(len(self._flights))
+
+
+class AsyncSingleFlight(_Group):
+    """SingleFlight for the Quart services: callers are tasks on one event loop
+
+    If the request running the query is cancelled (e.g. the client went
+    away), the requests waiting on it start the query again rather than
+    failing with it.
+    """
+
+    def __init__(self, name, window=COALESCE_WINDOW_MS / 1000, max_cached=COALESCE_MAX_CACHED):
+        super().__init__(name, window, max_cached)
+        self._flights = {}
+
+    async def do(self, key, fn):
+        """Await fn() once per key at a time; fn is a coroutine function"""
+        if not COALESCE_ENABLED:
+            return await fn()
+
+        while True:
+            hit, result = self._cached(key)
+            if hit:
+                return result
+            future = self._flights.get(key)
+            if future is None:
+                break
+            self._count(False)
+            try:
+                # Shielded, so a waiter being cancelled leaves the query running
+                failed, result = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if future.cancelled():
+                    continue
+                raise
+            if failed:
+                raise result
+            return result
+
+        future = self._flights[key] = asyncio.get_running_loop().create_future()
+        self._count(True)
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            # Passed as a result: an exception nobody waited for would be logged as unretrieved
+            future.set_result((True, e))
+            raise
+        finally:
+            del self._flights[key]
+        future.set_result((False, result))
+        self._store(key, result)
+        return result
+
+    def stats(self):
+        return super().stats(len(self._flights))
+
+
+def stats():
+    return {name: group.stats() for name, group in sorted(_groups.items())}
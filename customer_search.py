@@ -0,0 +1,392 @@
+import os
+import re
+import threading
+import time
+import logging
+from array import array
+from bisect import bisect_left, bisect_right
+from heapq import merge
+
+from mysql.connector import Error
+from db import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+SEARCH_INDEX_TTL = float(os.environ.get("SEARCH_INDEX_TTL", 300))
+# Candidates checked per lookup before the page is cut short
+SEARCH_MAX_SCAN = int(os.environ.get("SEARCH_MAX_SCAN", 50000))
+# Candidates walked one by one before the rest of the two shortest
+# postings is intersected as sets
+WALK_LIMIT = 1000
+
+MIN_QUERY_LENGTH = 3
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+MATCH_MODES = ("substring", "prefix")
+
+LOAD_QUERY = "SELECT customer_id, name, email, no_telp FROM customer ORDER BY customer_id"
+# Counter from migrations/004_etags.sql; a reload is skipped while it is unchanged
+VERSION_QUERY = "SELECT version FROM table_versions WHERE table_name = 'customer'"
+
+# Queries made only of these characters are also matched against phone digits
+_PHONE_QUERY = re.compile(r"[\d\s()+.-]+$")
+
+
+def normalize(value):
+    """Case-folded text with single spaces, as names and emails are indexed"""
+    return " ".join(str(value or "").casefold().split())
+
+
+def digits(value):
+    return "".join(ch for ch in str(value or "") if ch.isdigit())
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def entry_for(name, email, no_telp):
+    """What the index keeps per customer: (name, email, phone digits)"""
+    return normalize(name), normalize(email), digits(no_telp)
+
+
+def search_args(args):
+    """Validate `q`, `match`, `limit` and `after` of GET /customers/search
+
+    Returns (q, match, limit, after); raises ValueError on invalid input.
+    """
+    q = args.get('q', '').strip()
+    if len(normalize(q)) < MIN_QUERY_LENGTH:
+        raise ValueError(f"q must be at least {MIN_QUERY_LENGTH} characters")
+
+    match = args.get('match', 'substring')
+    if match not in MATCH_MODES:
+        raise ValueError("match must be 'substring' or 'prefix'")
+
+    try:
+        limit = int(args.get('limit', DEFAULT_LIMIT))
+        after = int(args['after']) if args.get('after') else None
+    except ValueError:
+        raise ValueError("limit and after must be integers")
+    if limit < 1 or limit > MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+
+    return q, match, limit, after
+
+
+def _contains(posting, customer_id):
+    i = bisect_left(posting, customer_id)
+    return i < len(posting) and posting[i] == customer_id
+
+
+class _Trigrams:
+    """Trigram postings (sorted arrays of customer IDs) plus the indexed text"""
+
+    def __init__(self):
+        self.entries = {}
+        self.postings = {}
+
+    @staticmethod
+    def _grams(entry):
+        grams = set()
+        for text in entry:
+            grams |= trigrams(text)
+        return grams
+
+    def add(self, customer_id, entry):
+        self.remove(customer_id)
+        self.entries[customer_id] = entry
+        for gram in self._grams(entry):
+            posting = self.postings.get(gram)
+            if posting is None:
+                posting = self.postings[gram] = array('i')
+            # New customers have the highest IDs, so this is nearly always an append
+            if not posting or posting[-1] < customer_id:
+                posting.append(customer_id)
+            else:
+                # Replaced rather than shifted in place; searches walk postings without the lock
+                i = bisect_left(posting, customer_id)
+                self.postings[gram] = posting[:i] + array('i', (customer_id,)) + posting[i:]
+
+    def remove(self, customer_id):
+        entry = self.entries.pop(customer_id, None)
+        if entry is None:
+            return
+        for gram in self._grams(entry):
+            posting = self.postings[gram]
+            if len(posting) == 1:
+                del self.postings[gram]
+            else:
+                i = bisect_left(posting, customer_id)
+                self.postings[gram] = posting[:i] + posting[i + 1:]
+
+    def candidates(self, text, after):
+        """IDs above `after` whose text contains every trigram of `text`, ascending
+
+        The postings are picked up now; the IDs are produced as the result
+        is iterated.
+        """
+        postings = [self.postings.get(gram) for gram in trigrams(text)]
+        if not postings or None in postings:
+            return iter(())
+        postings.sort(key=len)
+        return _walk(postings, after)
+
+
+def _walk(postings, after):
+    first, rest = postings[0], postings[1:]
+    start = bisect_right(first, after) if after is not None else 0
+    # Dense matches are found in the first few candidates...
+    walked = len(first) if not rest else min(len(first), start + WALK_LIMIT)
+    for i in range(start, walked):
+        customer_id = first[i]
+        if all(_contains(posting, customer_id) for posting in rest):
+            yield customer_id
+    if walked == len(first):
+        return
+
+    # ...sparse ones are cheaper to intersect in bulk than to bisect one by one
+    tail = first[walked:]
+    second = rest[0]
+    common = set(tail).intersection(second[bisect_left(second, tail[0]):])
+    for customer_id in sorted(common):
+        if all(_contains(posting, customer_id) for posting in rest[1:]):
+            yield customer_id
+
+
+def _matches(entry, q, phone, match):
+    name, email, no_telp = entry
+    if match == "prefix":
+        # Any word of the name, the email or the number may start with the query
+        return (" " + q) in (" " + name) or email.startswith(q) or bool(phone and no_telp.startswith(phone))
+    return q in name or q in email or bool(phone and phone in no_telp)
+
+
+class SearchIndex:
+    """In-memory trigram index over customer name, email and phone number
+
+    Every name, email and the digits of every phone number are split into
+    overlapping three-character grams; each gram maps to a sorted array of
+    the customers containing it. A lookup intersects the arrays for the
+    query's grams, walking the shortest one in ID order and confirming each
+    candidate against the indexed text, so a page costs about as much as
+    the matches on it rather than the table size. A million customers
+    take roughly 500 MB and half a minute to load.
+
+    Like the availability index, each process has its own copy, kept
+    current by this process's writes and reloaded after `ttl` seconds to
+    pick up other processes' writes. Reloads after the first run in the
+    background and are skipped while the customer table version is
+    unchanged; writes made meanwhile are replayed onto the new copy.
+    """
+
+    def __init__(self, ttl=SEARCH_INDEX_TTL, max_scan=SEARCH_MAX_SCAN):
+        self.ttl = ttl
+        self.max_scan = max_scan
+        self._lock = threading.Lock()
+        self._trigrams = None
+        self._loaded_at = None
+        self._version = None
+        self._reloading = False
+        self._journal = []
+        self.loads = 0
+        self.searches = 0
+        self.truncated = 0
+
+    def loaded(self):
+        return self._trigrams is not None
+
+    def stale(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl
+
+    def begin_reload(self):
+        """Claim a background reload; False if one is already running"""
+        with self._lock:
+            if self._reloading:
+                return False
+            self._reloading = True
+            self._journal = []
+            return True
+
+    def abort_reload(self):
+        with self._lock:
+            self._reloading = False
+            self._journal = []
+
+    def unchanged(self, version):
+        """Keep the current copy for another `ttl` if the table version is still `version`"""
+        with self._lock:
+            if version is None or version != self._version:
+                return False
+            self._loaded_at = time.monotonic()
+            self._reloading = False
+            self._journal = []
+            return True
+
+    def load(self, rows, version=None):
+        """Replace the index with rows from LOAD_QUERY (ascending customer_id)
+
+        `version` is the table version read before the rows.
+        """
+        built = _Trigrams()
+        for row in rows:
+            built.add(row['customer_id'], entry_for(row['name'], row['email'], row['no_telp']))
+
+        with self._lock:
+            for customer_id, entry in self._journal:
+                if entry is None:
+                    built.remove(customer_id)
+                else:
+                    built.add(customer_id, entry)
+            self._journal = []
+            self._reloading = False
+            self._trigrams = built
+            self._version = version
+            self._loaded_at = time.monotonic()
+            self.loads += 1
+
+    def record(self, customer):
+        """Apply a committed create/update; `customer` is the full row"""
+        entry = entry_for(customer['name'], customer['email'], customer['no_telp'])
+        self._apply(customer['customer_id'], entry)
+
+    def discard(self, customer_id):
+        """Apply a committed delete"""
+        self._apply(customer_id, None)
+
+    def expire(self):
+        """Reload on next use, e.g. after an import of many rows"""
+        with self._lock:
+            self._loaded_at = None
+
+    def _apply(self, customer_id, entry):
+        with self._lock:
+            if self._reloading:
+                self._journal.append((customer_id, entry))
+            if self._trigrams is None:
+                return
+            if entry is None:
+                self._trigrams.remove(customer_id)
+            else:
+                self._trigrams.add(customer_id, entry)
+
+    def search(self, q, match="substring", limit=DEFAULT_LIMIT, after=None):
+        """Return (customer IDs, next_cursor) for one page of matches in ID order
+
+        next_cursor is None on the last page. A page is cut short, with a
+        cursor to continue from, after `max_scan` candidates.
+        """
+        text = normalize(q)
+        phone = digits(q) if _PHONE_QUERY.match(q) else ""
+        if len(phone) < MIN_QUERY_LENGTH:
+            phone = ""
+
+        with self._lock:
+            self.searches += 1
+            index = self._trigrams
+            streams = [index.candidates(text, after)]
+            if phone and phone != text:
+                streams.append(index.candidates(phone, after))
+
+        # Writers only append to postings or swap in new ones, so the scan
+        # runs without the lock and does not hold up writes or other lookups
+        ids = []
+        scanned = 0
+        last = None
+        for customer_id in merge(*streams):
+            if customer_id == last:
+                continue
+            last = customer_id
+            entry = index.entries.get(customer_id)
+            if entry is not None and _matches(entry, text, phone, match):
+                ids.append(customer_id)
+                if len(ids) > limit:
+                    return ids[:limit], ids[limit - 1]
+            scanned += 1
+            if scanned >= self.max_scan:
+                with self._lock:
+                    self.truncated += 1
+                return ids, customer_id
+        return ids, None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "customers": len(self._trigrams.entries) if self._trigrams else 0,
+                "trigrams": len(self._trigrams.postings) if self._trigrams else 0,
+                "ttl": self.ttl,
+                "age": time.monotonic() - self._loaded_at if self._loaded_at is not None else None,
+                "reloading": self._reloading,
+                "loads": self.loads,
+                "searches": self.searches,
+                "truncated": self.truncated,
+            }
+
+
+index = SearchIndex()
+# Serializes the first, blocking load
+_first_load_lock = threading.Lock()
+
+
+def _read_version(cursor):
+    cursor.execute(VERSION_QUERY)
+    row = cursor.fetchone()
+    return row['version'] if row else None
+
+
+def _read_rows(conn, reload=False):
+    cursor = conn.cursor(dictionary=True)
+    try:
+        version = _read_version(cursor)
+        if reload and index.unchanged(version):
+            return
+        cursor.execute(LOAD_QUERY)
+        # Unbuffered, so the rows are never all held as dictionaries at once
+        index.load((row for row in cursor), version)
+    finally:
+        cursor.close()
+
+
+def _reload():
+    conn = None
+    try:
+        conn = get_db_connection()
+        _read_rows(conn, reload=True)
+    except Exception as e:
+        index.abort_reload()
+        logger.error("Reloading the customer search index failed: %s", e)
+    finally:
+        if conn:
+            conn.close()
+
+
+def _first_load(conn):
+    own_conn = conn is None
+    try:
+        if own_conn:
+            conn = get_db_connection()
+        index.begin_reload()
+        try:
+            _read_rows(conn)
+        except Error:
+            index.abort_reload()
+            raise
+    finally:
+        if own_conn and conn:
+            conn.close()
+
+
+def get_index(conn=None):
+    """Return the process-wide index
+
+    The first call loads it on the calling thread (reusing the caller's
+    connection when given); later reloads run on a background thread while
+    the current copy keeps serving.
+    """
+    if not index.loaded():
+        with _first_load_lock:
+            if not index.loaded():
+                _first_load(conn)
+    elif index.stale() and index.begin_reload():
+        threading.Thread(target=_reload, name="customer-search-reload", daemon=True).start()
+    return index
@@ -0,0 +1,389 @@
+import os
+import re
+import threading
+import time
+import logging
+from collections import deque
+from contextlib import contextmanager
+
+import mysql.connector
+from mysql.connector import Error
+from mysql.connector.constants import ClientFlag
+from mysql.connector.errors import PoolError
+
+import metrics
+import slow_queries
+
+logger = logging.getLogger(__name__)
+
+# Connection settings, overridable per deployment through the environment
+DB_CONFIG = {
+    "host": os.environ.get("DB_HOST", "localhost"),
+    "port": int(os.environ.get("DB_PORT", 3306)),
+    "user": os.environ.get("DB_USER", "root"),
+    "password": os.environ.get("DB_PASSWORD", ""),
+    "database": os.environ.get("DB_NAME", "gym"),
+    # Routes may leave a single-row result partly read before reusing the
+    # connection; consume it instead of raising "Unread result found".
+    "consume_results": True,
+    # UPDATE reports matched rather than changed rows, so a zero row count
+    # reliably means "not found" and no existence SELECT is needed
+    "client_flags": [ClientFlag.FOUND_ROWS],
+}
+
+# Pool sizing
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+POOL_MAX_OVERFLOW = int(os.environ.get("DB_POOL_MAX_OVERFLOW", 10))
+POOL_MAX_LIFETIME = float(os.environ.get("DB_POOL_MAX_LIFETIME", 1800))
+POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "1") == "1"
+# Only ping connections that sat idle longer than this many seconds
+POOL_PING_AFTER = float(os.environ.get("DB_POOL_PING_AFTER", 30))
+POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 10))
+
+# Read once per pool, on its first connection; see bulk.insert_rows()
+AUTOINC_QUERY = "SELECT @@innodb_autoinc_lock_mode, @@auto_increment_increment"
+
+
+class TimedCursor:
+    """Cursor wrapper recording execute() time per query in metrics and the slow-query log"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = self._cursor.execute(operation, params, *args, **kwargs)
+            failed = False
+            return result
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.observe_query(operation, elapsed, failed)
+            if elapsed >= slow_queries.SLOW_QUERY_THRESHOLD:
+                slow_queries.record(operation, params, elapsed, self._cursor.rowcount, failed)
+
+
+class PooledConnection:
+    """A checked-out connection; close() hands it back to the pool"""
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.released = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def cursor(self, *args, **kwargs):
+        return TimedCursor(self._raw.cursor(*args, **kwargs))
+
+    def close(self):
+        if not self.released:
+            self.released = True
+            self._pool.release(self)
+
+    def invalidate(self):
+        """Drop the connection instead of reusing it, e.g. mid-way through a result set"""
+        if not self.released:
+            self.released = True
+            self._pool.release(self, discard=True)
+
+
+class ConnectionPool:
+    """Thread-safe MySQL connection pool
+
+    Keeps up to `size` idle connections and allows `max_overflow` extra
+    connections under load. Connections older than `max_lifetime` seconds are
+    recycled, connections idle for more than `ping_after` seconds are pinged
+    before reuse when `pre_ping` is set, and acquire() raises PoolError after
+    waiting `timeout` seconds.
+    """
+
+    def __init__(self, size=POOL_SIZE, max_overflow=POOL_MAX_OVERFLOW,
+                 max_lifetime=POOL_MAX_LIFETIME, pre_ping=POOL_PRE_PING,
+                 timeout=POOL_TIMEOUT, ping_after=POOL_PING_AFTER, **connect_args):
+        self.size = size
+        self.max_overflow = max_overflow
+        self.max_lifetime = max_lifetime
+        self.pre_ping = pre_ping
+        self.ping_after = ping_after
+        self.timeout = timeout
+        self.connect_args = connect_args or dict(DB_CONFIG)
+
+        self._idle = deque()
+        self._lock = threading.Condition()
+        self._open = 0
+        self._in_use = 0
+        # (innodb_autoinc_lock_mode, auto_increment_increment)
+        self.autoinc = None
+
+        self._stats = {
+            "connections_created": 0,
+            "connections_recycled": 0,
+            "ping_failures": 0,
+            "acquired": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+            "peak_in_use": 0,
+        }
+
+    def _connect(self):
+        raw = mysql.connector.connect(**self.connect_args)
+        if self.autoinc is None:
+            self.autoinc = self._read_autoinc(raw)
+        conn = PooledConnection(self, raw)
+        with self._lock:
+            self._stats["connections_created"] += 1
+        return conn
+
+    def _read_autoinc(self, raw):
+        cursor = raw.cursor()
+        try:
+            cursor.execute(AUTOINC_QUERY)
+            row = cursor.fetchone()
+        except Error as e:
+            logger.warning("Could not read the auto-increment settings (%s); bulk inserts go row by row", e)
+            return None, 1
+        finally:
+            cursor.close()
+        return autoinc_from_row(row)
+
+    def _discard(self, conn):
+        try:
+            conn._raw.close()
+        except Error:
+            pass
+
+    def _expired(self, conn):
+        return self.max_lifetime and time.monotonic() - conn.created_at > self.max_lifetime
+
+    def _is_alive(self, conn):
+        try:
+            conn._raw.ping(reconnect=False)
+            return True
+        except Error:
+            with self._lock:
+                self._stats["ping_failures"] += 1
+            return False
+
+    def acquire(self):
+        """Check out a connection, opening a new one if the pool has room"""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+
+        with self._lock:
+            while True:
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._open < self.size + self.max_overflow:
+                    conn = None
+                    self._open += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolError(
+                        f"Timed out after {self.timeout}s waiting for a database connection"
+                    )
+                waited = True
+                self._lock.wait(remaining)
+
+            self._in_use += 1
+            self._stats["acquired"] += 1
+            self._stats["peak_in_use"] = max(self._stats["peak_in_use"], self._in_use)
+            if waited:
+                wait_time = time.monotonic() - start
+                self._stats["waits"] += 1
+                self._stats["wait_time_total"] += wait_time
+                self._stats["wait_time_max"] = max(self._stats["wait_time_max"], wait_time)
+
+        try:
+            if conn is not None:
+                if self._expired(conn):
+                    self._discard(conn)
+                    with self._lock:
+                        self._stats["connections_recycled"] += 1
+                    conn = None
+                elif (self.pre_ping and time.monotonic() - conn.last_used > self.ping_after
+                        and not self._is_alive(conn)):
+                    self._discard(conn)
+                    conn = None
+            if conn is None:
+                conn = self._connect()
+        except Error:
+            with self._lock:
+                self._open -= 1
+                self._in_use -= 1
+                self._lock.notify()
+            raise
+
+        conn.released = False
+        return conn
+
+    def release(self, conn, discard=False):
+        """Return a connection to the pool, rolling back any open transaction"""
+        keep = not discard
+        try:
+            if keep and conn._raw.in_transaction:
+                conn._raw.rollback()
+        except Error as e:
+            logger.warning("Discarding connection after failed rollback: %s", e)
+            keep = False
+
+        conn.last_used = time.monotonic()
+        with self._lock:
+            self._in_use -= 1
+            if keep and len(self._idle) < self.size and not self._expired(conn):
+                self._idle.append(conn)
+                conn = None
+            else:
+                self._open -= 1
+            self._lock.notify()
+
+        if conn is not None:
+            self._discard(conn)
+
+    def close(self):
+        """Close all idle connections"""
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._open -= len(idle)
+        for conn in idle:
+            self._discard(conn)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                "size": self.size,
+                "max_overflow": self.max_overflow,
+                "open": self._open,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+            })
+        waits = stats["waits"]
+        stats["wait_time_avg"] = stats["wait_time_total"] / waits if waits else 0.0
+        return stats
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+def get_db_connection():
+    started = time.perf_counter()
+    conn = get_pool().acquire()
+    metrics.observe_acquire("sync", time.perf_counter() - started)
+    return conn
+
+
+@contextmanager
+def pooled_cursor(**cursor_args):
+    """A cursor on a pooled connection, both closed on exit
+
+    For short checkouts, e.g. around one coalesced read, so a request does
+    not hold a connection while it waits for another request's query.
+    """
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor(**cursor_args)
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+    finally:
+        conn.close()
+
+
+def pool_stats():
+    return get_pool().stats()
+
+
+def autoinc_from_row(row):
+    """(lock mode, increment) from the row of AUTOINC_QUERY, warning if bulk inserts must go row by row"""
+    lock_mode, increment = int(row[0]), int(row[1])
+    if lock_mode not in (0, 1):
+        logger.warning(
+            "innodb_autoinc_lock_mode is %s; bulk inserts go row by row to return correct IDs", lock_mode
+        )
+    return lock_mode, increment
+
+
+def autoinc_settings():
+    """(innodb_autoinc_lock_mode, auto_increment_increment) of the server
+
+    Read when the pool opened its first connection; the lock mode is None if
+    it could not be read.
+    """
+    return get_pool().autoinc or (None, 1)
+
+
+# MySQL error raised when an INSERT/UPDATE references a missing parent row
+FK_VIOLATION = 1452
+
+# MySQL error raised when an INSERT/UPDATE would break a unique key
+DUPLICATE_KEY = 1062
+
+
+def fk_violation(error):
+    """Return the name of the violated foreign key constraint, or None
+
+    Accepts both mysql.connector errors and the PyMySQL errors raised by the
+    async build, which carry the code in args[0] instead of errno.
+    """
+    errno = getattr(error, 'errno', None) or (error.args[0] if error.args else None)
+    if errno != FK_VIOLATION:
+        return None
+    match = re.search(r"CONSTRAINT `([^`]+)`", str(error))
+    return match.group(1) if match else ""
+
+
+def fk_not_found(error, data, foreign_keys):
+    """Turn a foreign key violation into the matching "not found" message
+
+    `foreign_keys` maps constraint names to (entity label, request field).
+    Returns None when the error is not a foreign key violation.
+    """
+    constraint = fk_violation(error)
+    if constraint is None:
+        return None
+    if constraint not in foreign_keys:
+        return "Referenced record not found"
+    entity, field = foreign_keys[constraint]
+    return f"{entity} with ID {data.get(field)} not found"
+
+
+def duplicate_key(error):
+    """Return the name of the violated unique key, or None
+
+    MySQL 8 prefixes the key with the table name; MariaDB does not.
+    """
+    errno = getattr(error, 'errno', None) or (error.args[0] if error.args else None)
+    if errno != DUPLICATE_KEY:
+        return None
+    match = re.search(r"for key '(?:[^'.]+\.)?([^']+)'", str(error))
+    return match.group(1) if match else ""
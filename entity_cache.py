@@ -0,0 +1,129 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from db import get_db_connection
+import availability
+import customer_search
+import coalesce
+
+CACHE_MAX_ENTRIES = int(os.environ.get("ENTITY_CACHE_MAX_ENTRIES", 10000))
+CACHE_TTL = float(os.environ.get("ENTITY_CACHE_TTL", 60))
+
+
+class EntityCache:
+    """Bounded LRU cache with a per-entry TTL
+
+    Each service process has its own copy, so writes made by another process
+    are only picked up once the entry expires; the TTL bounds that staleness.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(entry[1])
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, dict(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+customer_cache = EntityCache()
+trainer_cache = EntityCache()
+
+
+def _read_through(cache, query, key, conn=None):
+    try:
+        key = int(key)
+    except (TypeError, ValueError):
+        return None
+
+    row = cache.get(key)
+    if row is not None:
+        return row
+
+    # Reuse the caller's connection when it holds one, so a miss never
+    # needs a second pooled connection
+    own_conn = conn is None
+    cursor = None
+    try:
+        if own_conn:
+            conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(query, (key,))
+        row = cursor.fetchone()
+    finally:
+        if cursor:
+            cursor.close()
+        if own_conn and conn:
+            conn.close()
+
+    # Missing rows are not cached so a newly created entity is seen at once
+    if row is not None:
+        cache.set(key, row)
+    return row
+
+
+def get_customer(customer_id, conn=None):
+    """Return the customer row, or None if it does not exist"""
+    return _read_through(customer_cache, "SELECT * FROM customer WHERE customer_id = %s", customer_id, conn)
+
+
+def get_trainer(trainer_id, conn=None):
+    """Return the trainer row, or None if it does not exist"""
+    return _read_through(trainer_cache, "SELECT * FROM trainer WHERE trainer_id = %s", trainer_id, conn)
+
+
+def cache_stats():
+    return {
+        "customer": customer_cache.stats(),
+        "trainer": trainer_cache.stats(),
+        "availability": availability.index.stats(),
+        "customer_search": customer_search.index.stats(),
+        "coalesce": coalesce.stats(),
+    }
@@ -0,0 +1,131 @@
+"""ETags for conditional GETs
+
+Entity ETags are built from the row_version columns added by
+migrations/004_etags.sql (plus the versions of joined rows whose names
+appear in the response); list ETags from the per-table counters in
+table_versions. Both are read with primary key lookups, so a 304 costs
+neither the full query nor a JSON body.
+
+Writers bump the counters with bump_versions() as the last statement of
+their transaction, once per transaction rather than per row (see
+migrations/006_version_counters.sql). The counter rows are then locked only
+for the commit itself, and always in the same (primary key) order, so
+writers to one table do not queue behind each other's whole transaction
+and cannot deadlock on them.
+
+The version is read before the response data. If the row changes in
+between, the ETag is older than the body and the next request gets a 200;
+a stale body is never confirmed with a 304.
+"""
+import hashlib
+
+from bulk import placeholders
+
+ENTITY_VERSION_QUERIES = {
+    "customer": "SELECT row_version FROM customer WHERE customer_id = %s",
+    "trainer": "SELECT row_version FROM trainer WHERE trainer_id = %s",
+    # The FK columns are included because ON DELETE SET NULL does not fire
+    # the row_version trigger
+    "appointment": """
+        SELECT a.row_version, a.customer_id, a.trainer_id, a.billing_id,
+               c.row_version AS customer_version, t.row_version AS trainer_version
+        FROM appointments a
+        LEFT JOIN customer c ON a.customer_id = c.customer_id
+        LEFT JOIN trainer t ON a.trainer_id = t.trainer_id
+        WHERE a.appointment_id = %s
+    """,
+    # Billing detail embeds its appointments, so any appointment change counts
+    "billing": """
+        SELECT b.row_version, b.customer_id, c.row_version AS customer_version, v.version AS appointments_version
+        FROM billings b
+        LEFT JOIN customer c ON b.customer_id = c.customer_id
+        LEFT JOIN table_versions v ON v.table_name = 'appointments'
+        WHERE b.billing_id = %s
+    """,
+}
+
+# Tables whose rows appear in each list response
+LIST_TABLES = {
+    "customer": ("customer",),
+    "trainer": ("trainer",),
+    "appointment": ("appointments", "customer", "trainer"),
+    "billing": ("billings", "customer"),
+    # Rollups change with these writes; revenue_rollups is bumped by a rebuild
+    "revenue": ("billings", "appointments", "customer", "trainer", "revenue_rollups"),
+}
+
+# Tables a DELETE from each table changes, counting the rows its foreign
+# key actions (ON DELETE CASCADE / SET NULL) change
+DELETE_CASCADES = {
+    "customer": ("customer", "billings", "appointments"),
+    "trainer": ("trainer", "appointments"),
+    "billings": ("billings", "appointments"),
+    "appointments": ("appointments",),
+}
+
+
+def make_etag(*parts):
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+    return f'"{digest}"'
+
+
+def is_fresh(request, etag):
+    """True when the client's If-None-Match already names `etag`"""
+    return bool(request.if_none_match) and request.if_none_match.contains_weak(etag.strip('"'))
+
+
+def not_modified(etag):
+    return "", 304, {"ETag": etag}
+
+
+def _values(row):
+    return tuple(row.values()) if isinstance(row, dict) else tuple(row)
+
+
+def entity_statement(kind, key):
+    return ENTITY_VERSION_QUERIES[kind], (key,)
+
+
+def entity_etag_from_row(kind, key, row):
+    """ETag for the version row of an entity, or None if it does not exist"""
+    if row is None:
+        return None
+    return make_etag(kind, key, _values(row))
+
+
+def list_statement(kind):
+    tables = LIST_TABLES[kind]
+    return (
+        f"SELECT table_name, version FROM table_versions WHERE table_name IN ({placeholders(len(tables))})",
+        tables
+    )
+
+
+def list_etag_from_rows(kind, rows):
+    versions = dict(_values(row) for row in rows)
+    return make_etag(kind, tuple(versions.get(table) for table in LIST_TABLES[kind]))
+
+
+def bump_statement(*tables):
+    tables = sorted(set(tables))
+    return (
+        f"UPDATE table_versions SET version = version + 1 WHERE table_name IN ({placeholders(len(tables))})",
+        tables
+    )
+
+
+def bump_versions(cursor, *tables):
+    """Bump the list counters of `tables`; call once, right before commit"""
+    cursor.execute(*bump_statement(*tables))
+
+
+def entity_etag(cursor, kind, key):
+    """Read the entity's versions and return its ETag, or None if it does not exist"""
+    cursor.execute(*entity_statement(kind, key))
+    return entity_etag_from_row(kind, key, cursor.fetchone())
+
+
+def list_etag(cursor, kind):
+    """Read the table counters behind a list endpoint and return its ETag"""
+    cursor.execute(*list_statement(kind))
+    return list_etag_from_rows(kind, cursor.fetchall())
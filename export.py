@@ -0,0 +1,291 @@
+"""Bulk export of billings with their customer and linked appointments
+
+One unbuffered query joins billings, customer, appointments and trainer,
+ordered by billing_id. Its rows are grouped into one record per billing
+as they arrive, so memory stays flat however many billings are exported.
+
+    GET /billings/export?format=csv|ndjson&after=<billing_id>
+    python export.py --format csv --output billings.csv [--after N | --resume]
+
+NDJSON has one line per billing with its appointments nested; CSV has one
+line per appointment (or one line with empty appointment columns for a
+billing without any), billing columns repeated. Either way a billing is
+written in one piece, so an interrupted download is resumed with
+`after` set to the last complete billing_id received.
+"""
+import argparse
+import csv
+import io
+import logging
+import os
+import sys
+
+from mysql.connector import Error
+from db import get_db_connection
+from serialization import loads, ndjson_line
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("csv", "ndjson")
+
+EXPORT_QUERY = """
+    SELECT b.billing_id, b.customer_id, c.name AS customer_name, b.amount, b.created_at,
+           a.appointment_id, a.trainer_id, t.name AS trainer_name, a.booking_date, a.status
+    FROM billings b
+    LEFT JOIN customer c ON b.customer_id = c.customer_id
+    LEFT JOIN appointments a ON a.billing_id = b.billing_id
+    LEFT JOIN trainer t ON a.trainer_id = t.trainer_id
+    WHERE b.billing_id > %s
+    ORDER BY b.billing_id, a.appointment_id
+"""
+
+BILLING_COLUMNS = ["billing_id", "customer_id", "customer_name", "amount", "created_at"]
+APPOINTMENT_COLUMNS = ["appointment_id", "trainer_id", "trainer_name", "booking_date", "status"]
+CSV_COLUMNS = BILLING_COLUMNS + APPOINTMENT_COLUMNS
+
+MIMETYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+# Bytes read from the end of an existing NDJSON file to find where to resume
+RESUME_TAIL = 64 * 1024
+
+
+def export_args(args):
+    """Validate `format` and `after`; returns (format, after). Raises ValueError"""
+    fmt = args.get('format', 'ndjson')
+    if fmt not in FORMATS:
+        raise ValueError("format must be 'csv' or 'ndjson'")
+    try:
+        after = int(args['after']) if args.get('after') else 0
+    except ValueError:
+        raise ValueError("after must be an integer")
+    return fmt, after
+
+
+def export_statement(after=0):
+    return EXPORT_QUERY, (after,)
+
+
+class BillingGrouper:
+    """Fold joined rows, ordered by billing_id, into one record per billing"""
+
+    def __init__(self):
+        self.current = None
+
+    def add(self, row):
+        """Take one row; returns the previous billing once it is complete"""
+        done = None
+        if self.current is None or self.current['billing_id'] != row['billing_id']:
+            done = self.current
+            self.current = {column: row[column] for column in BILLING_COLUMNS}
+            self.current['appointments'] = []
+        if row['appointment_id'] is not None:
+            self.current['appointments'].append({column: row[column] for column in APPOINTMENT_COLUMNS})
+        return done
+
+    def finish(self):
+        done, self.current = self.current, None
+        return done
+
+
+def csv_header():
+    return _csv_lines([CSV_COLUMNS])
+
+
+def _csv_value(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def _csv_lines(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+def encode_billing(billing, fmt):
+    """One billing as NDJSON or CSV text"""
+    if fmt == "ndjson":
+        return ndjson_line(billing)
+    head = [_csv_value(billing[column]) for column in BILLING_COLUMNS]
+    appointments = billing['appointments'] or [dict.fromkeys(APPOINTMENT_COLUMNS)]
+    return _csv_lines(head + [_csv_value(a[column]) for column in APPOINTMENT_COLUMNS] for a in appointments)
+
+
+def export_lines(rows, fmt, header=True):
+    """Encode an iterable of joined rows; yields the CSV header, then one chunk per billing"""
+    if fmt == "csv" and header:
+        yield csv_header()
+    grouper = BillingGrouper()
+    for row in rows:
+        billing = grouper.add(row)
+        if billing is not None:
+            yield encode_billing(billing, fmt)
+    billing = grouper.finish()
+    if billing is not None:
+        yield encode_billing(billing, fmt)
+
+
+def stream_rows(after=0):
+    """Rows of the export query from an unbuffered cursor on a pooled connection"""
+    conn = get_db_connection()
+    cursor = None
+    finished = False
+    try:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(*export_statement(after))
+        for row in cursor:
+            yield row
+        finished = True
+    finally:
+        if not finished:
+            # Unread rows would otherwise be drained before reuse
+            conn.invalidate()
+        else:
+            cursor.close()
+            conn.close()
+
+
+def stream_export(fmt, after=0):
+    """Flask response streaming the export
+
+    A database error ends NDJSON with an {"error": ...} line, like the other
+    streamed endpoints; CSV has no room for one, so the response is cut
+    short instead and the client sees an incomplete transfer.
+    """
+    from flask import Response
+
+    def generate():
+        try:
+            yield from export_lines(stream_rows(after), fmt)
+        except Error as e:
+            logger.error("Database error while exporting: %s", e)
+            if fmt != "ndjson":
+                raise
+            yield ndjson_line({"error": str(e)})
+
+    return Response(generate(), mimetype=MIMETYPES[fmt], headers=download_headers(fmt, after))
+
+
+def download_headers(fmt, after=0):
+    name = f"billings-after-{after}.{fmt}" if after else f"billings.{fmt}"
+    return {"Content-Disposition": f'attachment; filename="{name}"'}
+
+
+def resume_point(path, fmt):
+    """Where an interrupted export to `path` left off
+
+    Returns (offset, after): the file is truncated to `offset` and the
+    export continues with billing_ids above `after`. A partial last line or
+    record is dropped, and for CSV so are the rows of the last billing,
+    which may be incomplete.
+    """
+    if fmt == "csv":
+        return _csv_resume_point(path)
+
+    size = os.path.getsize(path)
+    start = max(0, size - RESUME_TAIL)
+    with open(path, "rb") as f:
+        f.seek(start)
+        tail = f.read()
+
+    lines = tail.split(b"\n")
+    lines.pop()  # empty after a final newline, otherwise a partial line
+    offsets = []
+    offset = start
+    for line in lines:
+        offsets.append(offset)
+        offset += len(line) + 1
+    if start:
+        # The first line of the tail may start mid-way
+        lines, offsets = lines[1:], offsets[1:]
+
+    ids = [loads(line).get('billing_id') for line in lines]
+    # Drop a trailing {"error": ...} line
+    while ids and ids[-1] is None:
+        ids.pop()
+        offset = offsets.pop()
+    return offset, ids[-1] if ids else 0
+
+
+def _csv_records(f):
+    """(start, end, first column) of each complete record of a CSV file opened in binary mode"""
+    position = {"end": 0, "terminated": True}
+
+    def lines():
+        for line in f:
+            position["end"] += len(line)
+            position["terminated"] = line.endswith(b"\n")
+            yield line.decode()
+
+    start = 0
+    try:
+        for record in csv.reader(lines(), strict=True):
+            if not position["terminated"]:
+                return
+            yield start, position["end"], record[0] if record else ""
+            start = position["end"]
+    except csv.Error:
+        # Cut inside a quoted value
+        return
+
+
+def _csv_resume_point(path):
+    """resume_point() for CSV
+
+    Names may hold quoted newlines, so lines cannot be told apart from
+    records without parsing from the header on; the whole file is read.
+    """
+    offset, after = 0, 0
+    last, last_start = None, 0
+    with open(path, "rb") as f:
+        for index, (start, end, first) in enumerate(_csv_records(f)):
+            if index == 0:
+                # The header
+                offset = end
+                continue
+            billing_id = int(first) if first.isdigit() else None
+            if billing_id != last:
+                last, last_start = billing_id, start
+    if last is not None:
+        # The last billing may be cut short; it is exported again
+        offset, after = last_start, last - 1
+    return offset, after
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--format", choices=FORMATS, default="ndjson")
+    parser.add_argument("--after", type=int, default=0, help="export billing_ids above this one")
+    parser.add_argument("--output", help="file to write; stdout by default")
+    parser.add_argument("--resume", action="store_true", help="continue an interrupted export to --output")
+    args = parser.parse_args()
+
+    if args.resume and not args.output:
+        parser.error("--resume needs --output")
+
+    logging.basicConfig(level=logging.INFO)
+    after = args.after
+    offset = 0
+    if args.resume and os.path.exists(args.output):
+        offset, after = resume_point(args.output, args.format)
+        with open(args.output, "r+b") as f:
+            f.truncate(offset)
+        logger.info("Resuming after billing %s", after)
+
+    out = open(args.output, "a" if offset else "w", newline="") if args.output else sys.stdout
+    chunks = 0
+    try:
+        for chunk in export_lines(stream_rows(after), args.format, header=not offset):
+            out.write(chunk)
+            chunks += 1
+    except Error as e:
+        logger.error("Database error: %s", e)
+        sys.exit(1)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    logger.info("Exported %s billings", chunks - (args.format == "csv" and not offset))
+
+
+if __name__ == '__main__':
+    main()
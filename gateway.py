@@ -0,0 +1,82 @@
+"""Serve all four services from one process
+
+Requests are dispatched on the first path segment, so /customers,
+/trainers, /appointments and /billings keep their existing URLs. Everything
+else (/pool/stats, /cache/stats, /metrics, /slow-queries) goes to the
+customer app; in this mode the connection pool, entity caches, metrics and
+slow-query log are shared by all four apps anyway.
+
+    gunicorn --threads 8 gateway:app                  # sync build
+    SERVICE_IMPL=async hypercorn gateway:app          # async build
+    python run.py all [--impl async]
+"""
+import importlib
+import os
+
+from run import SERVICES
+
+PATH_PREFIXES = {
+    "customers": "customer",
+    "trainers": "trainer",
+    "appointments": "appointment",
+    "billings": "billing",
+}
+DEFAULT_SERVICE = "customer"
+
+
+def _first_segment(path):
+    return path.lstrip('/').split('/', 1)[0]
+
+
+class PathDispatcher:
+    """WSGI app routing each request to the service that owns its path"""
+
+    def __init__(self, apps):
+        self.apps = {prefix: apps[service] for prefix, service in PATH_PREFIXES.items()}
+        self.default = apps[DEFAULT_SERVICE]
+
+    def __call__(self, environ, start_response):
+        app = self.apps.get(_first_segment(environ.get('PATH_INFO', '')), self.default)
+        return app(environ, start_response)
+
+
+class AsyncPathDispatcher:
+    """ASGI counterpart of PathDispatcher"""
+
+    def __init__(self, apps):
+        self.apps = {prefix: apps[service] for prefix, service in PATH_PREFIXES.items()}
+        self.default = apps[DEFAULT_SERVICE]
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            # None of the apps register startup/shutdown work, so answer here
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+
+        app = self.apps.get(_first_segment(scope.get('path', '')), self.default)
+        await app(scope, receive, send)
+
+
+def create_app(impl="sync"):
+    apps = {}
+    for service, (sync_module, async_module, _) in SERVICES.items():
+        module = importlib.import_module(async_module if impl == "async" else sync_module)
+        apps[service] = module.app
+
+    if impl == "async":
+        return AsyncPathDispatcher(apps)
+    return PathDispatcher(apps)
+
+
+def __getattr__(name):
+    # `gateway:app` for gunicorn/hypercorn is built on first access rather
+    # than on import, so create_app("async") never builds the sync apps too
+    if name == "app":
+        app = globals()["app"] = create_app(os.environ.get("SERVICE_IMPL", "sync"))
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,200 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+from mysql.connector import Error
+import metrics
+from db import get_db_connection
+from bulk import insert_rows, placeholders
+from etag import bump_versions
+
+logger = logging.getLogger(__name__)
+
+GROUP_COMMIT_ENABLED = os.environ.get("GROUP_COMMIT", "0").lower() in ("1", "true")
+GROUP_COMMIT_WINDOW_MS = float(os.environ.get("GROUP_COMMIT_WINDOW_MS", 5))
+GROUP_COMMIT_MAX_ROWS = int(os.environ.get("GROUP_COMMIT_MAX_ROWS", 100))
+
+
+class GroupCommitStats:
+    """Batch sizes and flush/wait latency of a group-commit buffer
+
+    Shared by GroupCommitBuffer and the async build's buffer in async_db.
+    """
+
+    def __init__(self, table, columns, window, max_rows, after_insert):
+        self.table = table
+        self.columns = list(columns)
+        self.after_insert = after_insert
+        self.window = window
+        self.max_rows = max_rows
+        self._pending = []
+        self._stats_lock = threading.Lock()
+        self.flushes = 0
+        self.rows = 0
+        self.fallbacks = 0
+        self.max_batch = 0
+        self.flush_time_total = 0.0
+        self.flush_time_max = 0.0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def _record_wait(self, waited):
+        with self._stats_lock:
+            self.wait_time_total += waited
+            self.wait_time_max = max(self.wait_time_max, waited)
+        metrics.observe_group_commit_wait(self.table, waited)
+
+    def _record_flush(self, elapsed, rows, fallback):
+        with self._stats_lock:
+            self.flushes += 1
+            self.rows += rows
+            self.fallbacks += fallback
+            self.max_batch = max(self.max_batch, rows)
+            self.flush_time_total += elapsed
+            self.flush_time_max = max(self.flush_time_max, elapsed)
+        metrics.observe_group_commit_flush(self.table, elapsed, rows, fallback)
+
+    def _pending_count(self):
+        return len(self._pending)
+
+    def stats(self):
+        pending = self._pending_count()
+        with self._stats_lock:
+            return {
+                "enabled": GROUP_COMMIT_ENABLED,
+                "window_ms": self.window * 1000,
+                "max_rows": self.max_rows,
+                "pending": pending,
+                "flushes": self.flushes,
+                "rows": self.rows,
+                "fallbacks": self.fallbacks,
+                "avg_batch": self.rows / self.flushes if self.flushes else 0.0,
+                "max_batch": self.max_batch,
+                "flush_time_avg": self.flush_time_total / self.flushes if self.flushes else 0.0,
+                "flush_time_max": self.flush_time_max,
+                "wait_time_avg": self.wait_time_total / self.rows if self.rows else 0.0,
+                "wait_time_max": self.wait_time_max,
+            }
+
+
+class GroupCommitBuffer(GroupCommitStats):
+    """Coalesce concurrent single-row INSERTs into one multi-row INSERT
+
+    submit() queues a row and blocks until it is written. A flusher thread
+    waits up to `window` seconds after the first queued row (or until
+    `max_rows` are queued), writes the batch with one INSERT in one
+    transaction and hands every caller its own ID. If the batch fails, e.g.
+    because one row breaks a foreign or unique key, its rows are retried one
+    transaction each, so only the offending rows get the error.
+
+    IDs are derived as in bulk.insert_rows(), which needs consecutive
+    auto-increment values for a multi-row INSERT (innodb_autoinc_lock_mode
+    0 or 1); under mode 2 the batch is still one transaction, but one
+    INSERT per row.
+
+    `after_insert(cursor, ids)`, if given, runs in the same transaction as
+    each INSERT, e.g. to maintain rollups of the new rows.
+    """
+
+    def __init__(self, table, columns, window=GROUP_COMMIT_WINDOW_MS / 1000, max_rows=GROUP_COMMIT_MAX_ROWS,
+                 after_insert=None):
+        super().__init__(table, columns, window, max_rows, after_insert)
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def submit(self, row):
+        """Write one row with the next group commit and return its ID
+
+        Raises the database error for this row if it could not be written.
+        """
+        future = Future()
+        queued_at = time.monotonic()
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"group-commit-{self.table}", daemon=True)
+                self._thread.start()
+            self._pending.append((tuple(row), future))
+            self._cond.notify()
+
+        try:
+            return future.result()
+        finally:
+            self._record_wait(time.monotonic() - queued_at)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                deadline = time.monotonic() + self.window
+                while len(self._pending) < self.max_rows:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._pending[:self.max_rows]
+                del self._pending[:self.max_rows]
+
+            try:
+                self._flush(batch)
+            except Exception as e:
+                # Never leave a caller blocked, whatever went wrong
+                logger.error("Group commit flush failed: %s", e)
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _flush(self, batch):
+        started = time.monotonic()
+        fallback = False
+        conn = None
+        cursor = None
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            try:
+                ids = insert_rows(cursor, self.table, self.columns, [row for row, _ in batch])
+                if self.after_insert:
+                    self.after_insert(cursor, ids)
+                # One list-counter bump for the whole batch
+                bump_versions(cursor, self.table)
+                conn.commit()
+            except Error as e:
+                conn.rollback()
+                if len(batch) == 1:
+                    batch[0][1].set_exception(e)
+                    return
+                logger.warning("Group commit of %s rows failed (%s), retrying row by row", len(batch), e)
+                fallback = True
+                self._flush_rows(conn, cursor, batch)
+                return
+
+            for (_, future), new_id in zip(batch, ids):
+                future.set_result(new_id)
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
+            self._record_flush(time.monotonic() - started, len(batch), fallback)
+
+    def _flush_rows(self, conn, cursor, batch):
+        query = f"INSERT INTO {self.table} ({', '.join(self.columns)}) VALUES ({placeholders(len(self.columns))})"
+        for row, future in batch:
+            try:
+                cursor.execute(query, row)
+                new_id = cursor.lastrowid
+                if self.after_insert:
+                    self.after_insert(cursor, [new_id])
+                bump_versions(cursor, self.table)
+                conn.commit()
+                future.set_result(new_id)
+            except Error as e:
+                conn.rollback()
+                future.set_exception(e)
+
+    def _pending_count(self):
+        with self._cond:
+            return len(self._pending)
@@ -0,0 +1,278 @@
+"""Bulk CSV import of customers and trainers
+
+The CSV is read as a stream and loaded in chunks into a temporary staging
+table with multi-row INSERTs, then merged into the real table with one
+INSERT ... SELECT in one transaction: either every valid row is imported
+or none is.
+
+    POST /customers/import   (text/csv body, or a multipart "file")
+    python importer.py customers members.csv
+
+The header must name every required field (CUSTOMER_FIELDS or
+TRAINER_FIELDS); other columns are ignored. A row is rejected, and the run
+goes on, when it has the wrong number of fields, leaves a required field
+empty, or is refused by the database (e.g. a value too long for its
+column). Rejected rows are reported by CSV line number.
+
+The staging table is created from the target's columns, so it enforces
+the same types and lengths. A chunk that fails is retried row by row to
+find the offending rows, as group_commit.py does.
+"""
+import argparse
+import csv
+import io
+import json
+import logging
+import os
+import sys
+import time
+from itertools import chain
+
+from mysql.connector import Error
+from db import get_db_connection
+from bulk import placeholders
+from etag import bump_versions
+from validation import CUSTOMER_FIELDS, TRAINER_FIELDS
+
+logger = logging.getLogger(__name__)
+
+IMPORT_CHUNK_SIZE = int(os.environ.get("IMPORT_CHUNK_SIZE", 2000))
+# Rejected rows beyond this are counted but not listed
+MAX_REPORTED_ERRORS = int(os.environ.get("IMPORT_MAX_REPORTED_ERRORS", 1000))
+
+# entity -> (table, required fields)
+ENTITIES = {
+    "customers": ("customer", CUSTOMER_FIELDS),
+    "trainers": ("trainer", TRAINER_FIELDS),
+}
+
+
+class ImportReport:
+    """Counts and rejected rows of one import run"""
+
+    def __init__(self):
+        self.rows = 0
+        self.staged = 0
+        self.imported = 0
+        self.rejected = 0
+        self.errors = []
+        self.first_id = None
+        self.started = time.monotonic()
+
+    def reject(self, line, error):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": error})
+
+    def as_dict(self):
+        seconds = time.monotonic() - self.started
+        return {
+            "rows": self.rows,
+            "imported": self.imported,
+            "rejected": self.rejected,
+            "errors": sorted(self.errors, key=lambda error: error["line"]),
+            "errors_truncated": self.rejected > len(self.errors),
+            "first_id": self.first_id,
+            "seconds": round(seconds, 3),
+            "rows_per_second": round(self.rows / seconds) if seconds else None,
+        }
+
+
+def read_header(reader, fields):
+    """Map each required field to its CSV column; raises ValueError if any is missing"""
+    header = next(reader, None)
+    if header is None:
+        raise ValueError("CSV is empty")
+    header = [column.strip() for column in header]
+    missing = [field for field in fields if field not in header]
+    if missing:
+        raise ValueError(f"Missing required columns: {', '.join(missing)}")
+    return len(header), [header.index(field) for field in fields]
+
+
+def parse_rows(reader, fields, report):
+    """Yield (line, values) for valid rows, rejecting the others into `report`"""
+    width, positions = read_header(reader, fields)
+    for row in reader:
+        line = reader.line_num
+        if not row:
+            continue
+        report.rows += 1
+        if len(row) != width:
+            report.reject(line, f"Expected {width} fields, got {len(row)}")
+            continue
+        values = [row[position] for position in positions]
+        missing = [field for field, value in zip(fields, values) if value == ""]
+        if missing:
+            report.reject(line, f"Missing required fields: {', '.join(missing)}")
+            continue
+        yield line, values
+
+
+def read_chunks(lines, fields, report, chunk_size=IMPORT_CHUNK_SIZE):
+    """Chunks of valid (line, values) rows from CSV text lines
+
+    The header is checked at once, so a bad one raises ValueError before any
+    table is created; unreadable CSV raises ValueError while iterating.
+    """
+    reader = csv.reader(lines)
+    rows = parse_rows(reader, fields, report)
+    first = _next_row(rows, reader)
+    return _checked_chunks(reader, rows, first, chunk_size)
+
+
+def _checked_chunks(reader, rows, first, chunk_size):
+    if first is None:
+        return
+    chunks = _chunks(chain([first], rows), chunk_size)
+    while True:
+        chunk = _next_row(chunks, reader)
+        if chunk is None:
+            return
+        yield chunk
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def staging_table(table):
+    return f"{table}_import"
+
+
+def staging_statements(table, fields):
+    """Statements creating an empty staging table with the columns of `table`"""
+    return [
+        drop_staging_statement(table),
+        f"CREATE TEMPORARY TABLE {staging_table(table)} (line_no int NOT NULL PRIMARY KEY) "
+        f"SELECT {', '.join(fields)} FROM {table} LIMIT 0",
+    ]
+
+
+def stage_statement(table, fields, count):
+    """INSERT of `count` (line, *values) rows into the staging table"""
+    row_sql = f"({placeholders(len(fields) + 1)})"
+    columns = ", ".join(["line_no", *fields])
+    return f"INSERT INTO {staging_table(table)} ({columns}) VALUES {', '.join([row_sql] * count)}"
+
+
+def stage_params(chunk):
+    return [value for line, values in chunk for value in (line, *values)]
+
+
+def merge_statement(table, fields):
+    """Copy every staged row into `table`, in CSV order"""
+    return (
+        f"INSERT INTO {table} ({', '.join(fields)}) "
+        f"SELECT {', '.join(fields)} FROM {staging_table(table)} ORDER BY line_no"
+    )
+
+
+def drop_staging_statement(table):
+    return f"DROP TEMPORARY TABLE IF EXISTS {staging_table(table)}"
+
+
+def _stage(conn, cursor, table, fields, chunk, report):
+    try:
+        cursor.execute(stage_statement(table, fields, len(chunk)), stage_params(chunk))
+        conn.commit()
+        report.staged += len(chunk)
+        return
+    except Error:
+        conn.rollback()
+
+    # Find the rows the database refuses
+    for line, values in chunk:
+        try:
+            cursor.execute(stage_statement(table, fields, 1), (line, *values))
+            conn.commit()
+            report.staged += 1
+        except Error as e:
+            conn.rollback()
+            report.reject(line, e.msg)
+
+
+def import_csv(conn, entity, lines, chunk_size=IMPORT_CHUNK_SIZE):
+    """Import CSV text lines (any iterable of str) as `entity`; returns the report
+
+    Raises ValueError for a file that cannot be imported (bad header,
+    unreadable CSV) and Error if the merge fails; either way nothing is
+    imported.
+    """
+    table, fields = ENTITIES[entity]
+    report = ImportReport()
+    chunks = read_chunks(lines, fields, report, chunk_size)
+
+    cursor = conn.cursor()
+    try:
+        for query in staging_statements(table, fields):
+            cursor.execute(query)
+        for chunk in chunks:
+            _stage(conn, cursor, table, fields, chunk, report)
+
+        if report.staged:
+            cursor.execute(merge_statement(table, fields))
+            report.imported = cursor.rowcount
+            report.first_id = cursor.lastrowid
+            bump_versions(cursor, table)
+            conn.commit()
+        logger.info("Imported %s %s, rejected %s rows", report.imported, entity, report.rejected)
+        return report
+    finally:
+        try:
+            cursor.execute(drop_staging_statement(table))
+        except Error as e:
+            logger.warning("Could not drop %s: %s", staging_table(table), e)
+        cursor.close()
+
+
+def _next_row(rows, reader):
+    try:
+        return next(rows, None)
+    except (csv.Error, UnicodeDecodeError) as e:
+        raise ValueError(f"Unreadable CSV near line {reader.line_num}: {e}")
+
+
+def request_lines(request):
+    """Text lines of a CSV upload: a multipart "file" or the raw request body, read as a stream"""
+    upload = request.files.get('file')
+    stream = upload.stream if upload else request.stream
+    return io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("entity", choices=sorted(ENTITIES))
+    parser.add_argument("path", help="CSV file with a header row; - reads stdin")
+    parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    source = sys.stdin if args.path == "-" else open(args.path, newline="", encoding="utf-8-sig")
+    conn = None
+    try:
+        conn = get_db_connection()
+        report = import_csv(conn, args.entity, source, args.chunk_size)
+        print(json.dumps(report.as_dict(), indent=2))
+    except ValueError as e:
+        logger.error("%s", e)
+        sys.exit(2)
+    except Error as e:
+        logger.error("Database error: %s", e)
+        sys.exit(1)
+    finally:
+        if conn:
+            conn.close()
+        if source is not sys.stdin:
+            source.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+"""Structured, non-blocking logging for all services
+
+Log records are put on a bounded queue by a QueueHandler and written as
+one JSON object per line by a QueueListener thread, so formatting and
+stream I/O never run on the request thread. When the queue is full new
+records are dropped and counted rather than blocking the request.
+
+Configured from the environment:
+
+    LOG_LEVEL=INFO                     root level
+    LOG_LEVELS=db=WARNING,AppointmentService=DEBUG
+    LOG_FORMAT=json                    or "text" for local development
+    LOG_SAMPLING="GET /customers/<int:id>=0.01,/appointments=0.1"
+
+LOG_SAMPLING keeps DEBUG/INFO records for that share of requests to a
+route; the decision is made once per request, so a sampled request logs
+completely. WARNING and above are always kept. Keys are either
+"METHOD rule" or just the rule, as registered with @app.route.
+
+Streamed response bodies are sent after the request hooks have run, so
+init_app() also wraps them to log with their request's route and
+sampling decision.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", 10000))
+
+
+def _parse_pairs(value):
+    pairs = {}
+    for part in value.split(","):
+        key, sep, setting = part.rpartition("=")
+        if sep and key.strip():
+            pairs[key.strip()] = setting.strip()
+    return pairs
+
+
+LOG_LEVELS = _parse_pairs(os.environ.get("LOG_LEVELS", ""))
+LOG_SAMPLING = {route: float(rate) for route, rate in _parse_pairs(os.environ.get("LOG_SAMPLING", "")).items()}
+
+# Set per request by the hooks from init_app()
+_request_service = contextvars.ContextVar("log_service", default=None)
+_request_route = contextvars.ContextVar("log_route", default=None)
+_request_sampled = contextvars.ContextVar("log_sampled", default=True)
+_CONTEXT_VARS = (_request_service, _request_route, _request_sampled)
+
+_listener = None
+_handler = None
+_configure_lock = threading.Lock()
+
+
+def current_route():
+    """"METHOD rule" of the request being served, or None outside a request"""
+    for name in ("flask", "quart"):
+        framework = sys.modules.get(name)
+        if framework is not None and framework.has_request_context():
+            request = framework.request
+            rule = request.url_rule.rule if request.url_rule is not None else request.path
+            return f"{request.method} {rule}"
+    return None
+
+
+def sample_rate(route):
+    """Share of requests to `route` ("METHOD rule") whose DEBUG/INFO logs are kept"""
+    rate = LOG_SAMPLING.get(route)
+    if rate is None and route:
+        rate = LOG_SAMPLING.get(route.split(" ", 1)[-1])
+    return 1.0 if rate is None else rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record with the request's service and route"""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in ("service", "route"):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class ContextFilter(logging.Filter):
+    """Tag records with the current request and apply per-route sampling
+
+    Runs on the calling thread before the record is queued, so it only
+    reads context variables and never formats anything.
+    """
+
+    def filter(self, record):
+        record.service = _request_service.get()
+        record.route = _request_route.get()
+        return record.levelno >= logging.WARNING or _request_sampled.get()
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that drops records when the queue is full
+
+    Records are queued as they are: the message is formatted by the
+    listener thread, so log calls should pass %-style arguments instead of
+    pre-formatted strings.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure():
+    """Install the queue handler on the root logger once per process"""
+    global _listener, _handler
+    with _configure_lock:
+        if _listener is not None:
+            return
+
+        output = logging.StreamHandler(sys.stderr)
+        if LOG_FORMAT == "json":
+            output.setFormatter(JsonFormatter())
+        else:
+            output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(route)s] %(message)s"))
+
+        _handler = NonBlockingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+        _handler.addFilter(ContextFilter())
+
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(_handler)
+        root.setLevel(LOG_LEVEL)
+        for name, level in LOG_LEVELS.items():
+            logging.getLogger(name).setLevel(level.upper())
+
+        _listener = QueueListener(_handler.queue, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop)
+
+
+def stop():
+    """Flush queued records, e.g. before the process exits"""
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def _start_request(service):
+    route = current_route()
+    rate = sample_rate(route)
+    return (
+        _request_service.set(service),
+        _request_route.set(route),
+        _request_sampled.set(rate >= 1 or random.random() < rate),
+    )
+
+
+def _end_request(tokens):
+    if tokens:
+        for var, token in zip(_CONTEXT_VARS, tokens):
+            var.reset(token)
+
+
+def _iterate_in(context, body):
+    """Iterate a WSGI response body inside `context`"""
+    iterator = iter(body)
+    try:
+        while True:
+            try:
+                chunk = context.run(next, iterator)
+            except StopIteration:
+                return
+            yield chunk
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            context.run(close)
+
+
+async def _aiterate_with(values, iterator):
+    """Iterate an ASGI response body with the request's log context set"""
+    tokens = tuple(var.set(value) for var, value in zip(_CONTEXT_VARS, values))
+    try:
+        async for chunk in iterator:
+            yield chunk
+    finally:
+        if hasattr(iterator, "aclose"):
+            await iterator.aclose()
+        _end_request(tokens)
+
+
+def init_app(app, service):
+    """Configure logging and tag/sample records per request on a Flask or Quart app"""
+    configure()
+
+    if type(app).__module__.split('.')[0] == "quart":
+        from quart import g
+        from quart.wrappers.response import IterableBody
+
+        @app.before_request
+        async def start_log_context():
+            g.log_context = _start_request(service)
+
+        @app.after_request
+        async def stream_log_context(response):
+            if isinstance(response.response, IterableBody):
+                values = tuple(var.get() for var in _CONTEXT_VARS)
+                response.response.iter = _aiterate_with(values, response.response.iter)
+            return response
+
+        @app.teardown_request
+        async def end_log_context(exc):
+            _end_request(g.pop("log_context", None))
+    else:
+        from flask import g
+
+        @app.before_request
+        def start_log_context():
+            g.log_context = _start_request(service)
+
+        @app.after_request
+        def stream_log_context(response):
+            if response.is_streamed:
+                response.response = _iterate_in(contextvars.copy_context(), response.response)
+            return response
+
+        @app.teardown_request
+        def end_log_context(exc):
+            _end_request(g.pop("log_context", None))
+
+    return app
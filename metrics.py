@@ -0,0 +1,272 @@
+"""Prometheus metrics for all services
+
+Request counts and latency per route, in-flight requests, database query
+time per query, connection acquisition time and group-commit flush latency
+and batch sizes, exposed at /metrics in the Prometheus text format. The
+registry is process-wide, so with the gateway one scrape covers all four
+apps; the `service` label tells them apart.
+
+Recording a sample is a dict lookup and a bucket bisect under a lock, so the
+instrumentation stays on in production. METRICS_ENABLED=0 turns it off.
+"""
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from functools import lru_cache
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1").lower() in ("1", "true")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; covers cache hits through slow reports
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with one value per label combination"""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            yield self.name, _labels(self.labelnames, labels), value
+
+
+class Gauge(Counter):
+    """Value that goes up and down, e.g. requests in flight"""
+
+    kind = "gauge"
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram:
+    """Bucketed distribution with _bucket, _sum and _count series"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last one is +Inf), sum]
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def samples(self):
+        with self._lock:
+            values = {labels: (list(counts), total) for labels, (counts, total) in self._values.items()}
+        for labels, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", _labels(self.labelnames, labels, [("le", _number(bound))]), cumulative
+            yield f"{self.name}_sum", _labels(self.labelnames, labels), total
+            yield f"{self.name}_count", _labels(self.labelnames, labels), cumulative
+
+
+REQUESTS = Counter(
+    "http_requests_total", "HTTP requests handled", ("service", "method", "route", "status")
+)
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Time from request start until the response is returned by the view",
+    ("service", "method", "route", "status")
+)
+IN_FLIGHT = Gauge("http_requests_in_flight", "Requests currently being handled", ("service",))
+QUERY_DURATION = Histogram(
+    "db_query_duration_seconds", "Time spent in cursor.execute() per query (statement verb and first table)",
+    ("query",)
+)
+QUERY_ERRORS = Counter("db_query_errors_total", "Statements that raised a database error", ("query",))
+ACQUIRE_DURATION = Histogram(
+    "db_connection_acquire_seconds", "Time to check a connection out of the pool", ("pool",)
+)
+COALESCED = Counter(
+    "coalesced_requests_total",
+    "Coalesced reads by outcome: query (ran it), shared (waited for another request's query) or cached",
+    ("group", "outcome")
+)
+GROUP_COMMIT_FLUSH = Histogram(
+    "group_commit_flush_seconds", "Time to write one group-commit batch, including any row-by-row retry", ("table",)
+)
+GROUP_COMMIT_BATCH = Histogram(
+    "group_commit_batch_rows", "Rows written per group-commit batch", ("table",),
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+)
+GROUP_COMMIT_WAIT = Histogram(
+    "group_commit_wait_seconds", "Time a row waits in submit() from queueing until it is written", ("table",)
+)
+GROUP_COMMIT_FALLBACKS = Counter(
+    "group_commit_fallbacks_total", "Group-commit batches that failed and were retried row by row", ("table",)
+)
+
+_TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE)\s+`?(\w+)", re.IGNORECASE)
+
+
+@lru_cache(maxsize=1024)
+def query_name(sql):
+    """Low-cardinality label for a statement, e.g. "select customer"
+
+    Statements that only differ in their IN lists share a name.
+    """
+    words = sql.split(None, 1)
+    verb = words[0].lower() if words else ""
+    match = _TABLE.search(sql)
+    return f"{verb} {match.group(1).lower()}" if match else verb
+
+
+def observe_query(sql, seconds, failed=False):
+    if not METRICS_ENABLED:
+        return
+    name = query_name(sql)
+    QUERY_DURATION.observe(seconds, name)
+    if failed:
+        QUERY_ERRORS.inc(name)
+
+
+def observe_acquire(pool, seconds):
+    if METRICS_ENABLED:
+        ACQUIRE_DURATION.observe(seconds, pool)
+
+
+def observe_coalesce(group, outcome):
+    if METRICS_ENABLED:
+        COALESCED.inc(group, outcome)
+
+
+def observe_group_commit_flush(table, seconds, rows, fallback=False):
+    if not METRICS_ENABLED:
+        return
+    GROUP_COMMIT_FLUSH.observe(seconds, table)
+    GROUP_COMMIT_BATCH.observe(rows, table)
+    if fallback:
+        GROUP_COMMIT_FALLBACKS.inc(table)
+
+
+def observe_group_commit_wait(table, seconds):
+    if METRICS_ENABLED:
+        GROUP_COMMIT_WAIT.observe(seconds, table)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{labels} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def _route(request):
+    # The rule template keeps label cardinality bounded; 404s share one label
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+
+def _start(g, service):
+    g.metrics_started = time.perf_counter()
+    IN_FLIGHT.inc(service)
+
+
+def _finish(g, request, response, service):
+    started = g.get("metrics_started")
+    if started is not None:
+        labels = (service, request.method, _route(request), str(response.status_code))
+        REQUESTS.inc(*labels)
+        REQUEST_DURATION.observe(time.perf_counter() - started, *labels)
+    return response
+
+
+def _teardown(g, service):
+    if g.pop("metrics_started", None) is not None:
+        IN_FLIGHT.dec(service)
+
+
+def init_app(app, service):
+    """Instrument a Flask or Quart app and add its /metrics route"""
+    if type(app).__module__.split('.')[0] == "quart":
+        from quart import Response, g, request
+
+        async def metrics_view():
+            return Response(render(), content_type=CONTENT_TYPE)
+
+        if METRICS_ENABLED:
+            @app.before_request
+            async def start_timer():
+                _start(g, service)
+
+            @app.after_request
+            async def record_request(response):
+                return _finish(g, request, response, service)
+
+            @app.teardown_request
+            async def end_request(exc):
+                _teardown(g, service)
+    else:
+        from flask import Response, g, request
+
+        def metrics_view():
+            return Response(render(), content_type=CONTENT_TYPE)
+
+        if METRICS_ENABLED:
+            @app.before_request
+            def start_timer():
+                _start(g, service)
+
+            @app.after_request
+            def record_request(response):
+                return _finish(g, request, response, service)
+
+            @app.teardown_request
+            def end_request(exc):
+                _teardown(g, service)
+
+    app.add_url_rule('/metrics', 'metrics', metrics_view, methods=['GET'])
+    return app
@@ -0,0 +1,36 @@
+--
+-- Incrementally maintained billing aggregates for GET /billings/stats
+--
+-- billing_totals holds a single row with the overall count and amount;
+-- billing_customer_stats holds one row per customer. Both are updated by
+-- BillingService in the same transaction as the billing write, and by
+-- CustomerService before a customer delete cascades to billings.
+-- Run `python billing_stats.py rebuild` to reconcile them with billings.
+--
+
+CREATE TABLE IF NOT EXISTS `billing_totals` (
+  `id` tinyint(4) NOT NULL,
+  `total_count` bigint(20) NOT NULL DEFAULT 0,
+  `total_amount` decimal(16,2) NOT NULL DEFAULT 0.00,
+  PRIMARY KEY (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+CREATE TABLE IF NOT EXISTS `billing_customer_stats` (
+  `customer_id` int(11) NOT NULL,
+  `billing_count` int(11) NOT NULL DEFAULT 0,
+  `total_amount` decimal(16,2) NOT NULL DEFAULT 0.00,
+  PRIMARY KEY (`customer_id`),
+  KEY `idx_billing_customer_stats_total` (`total_amount`),
+  CONSTRAINT `fk_billing_customer_stats_customer` FOREIGN KEY (`customer_id`) REFERENCES `customer` (`customer_id`) ON DELETE CASCADE ON UPDATE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+START TRANSACTION;
+
+DELETE FROM `billing_customer_stats`;
+INSERT INTO `billing_customer_stats` (`customer_id`, `billing_count`, `total_amount`)
+SELECT `customer_id`, COUNT(*), SUM(`amount`) FROM `billings` GROUP BY `customer_id`;
+
+REPLACE INTO `billing_totals` (`id`, `total_count`, `total_amount`)
+SELECT 1, COUNT(*), COALESCE(SUM(`amount`), 0) FROM `billings`;
+
+COMMIT;
@@ -0,0 +1,22 @@
+--
+-- One active appointment per trainer per booking date
+--
+-- `active_trainer_id` mirrors trainer_id for appointments that hold a slot
+-- and is NULL for cancelled ones, so cancelled bookings never collide. It is
+-- INVISIBLE, so `SELECT a.*` responses are unchanged. The
+-- unique key makes concurrent POST /appointments for the same slot fail with
+-- a duplicate key error, which AppointmentService returns as 409.
+--
+-- Existing clashes must be resolved before the key can be added; this lists
+-- them:
+--
+--   SELECT trainer_id, booking_date, GROUP_CONCAT(appointment_id)
+--   FROM appointments
+--   WHERE trainer_id IS NOT NULL AND (status IS NULL OR status <> 'cancelled')
+--   GROUP BY trainer_id, booking_date
+--   HAVING COUNT(*) > 1;
+--
+
+ALTER TABLE `appointments`
+  ADD COLUMN `active_trainer_id` int(11) GENERATED ALWAYS AS (IF(`status` <=> 'cancelled', NULL, `trainer_id`)) STORED,
+  ADD UNIQUE KEY `uq_appointments_trainer_slot` (`active_trainer_id`, `booking_date`);
@@ -0,0 +1,15 @@
+--
+-- Composite indexes for date-range appointment queries
+--
+-- GET /appointments/trainer/<id> and /appointments/customer/<id> filter on
+-- the person and a booking_date range (`from`/`to`) and order by
+-- booking_date, which these keys serve as an index range scan. They also
+-- back the trainer and customer foreign keys, so the single-column keys
+-- from gym.sql are dropped instead of being maintained twice.
+--
+
+ALTER TABLE `appointments`
+  ADD KEY `idx_appointments_trainer_date` (`trainer_id`, `booking_date`),
+  ADD KEY `idx_appointments_customer_date` (`customer_id`, `booking_date`),
+  DROP KEY `fk_appointments_trainer`,
+  DROP KEY `fk_appointments_customer`;
@@ -0,0 +1,76 @@
+--
+-- Row versions and per-table change counters for ETags (see etag.py)
+--
+-- Every entity row gets an INVISIBLE row_version, so `SELECT *` responses
+-- are unchanged. A BEFORE UPDATE trigger increments it. table_versions
+-- holds one counter per table; AFTER triggers bump it on every insert,
+-- update and delete.
+--
+-- Foreign key actions (ON DELETE CASCADE / SET NULL) do not fire triggers.
+-- The parent's delete trigger therefore also bumps the tables its delete
+-- cascades into:
+--   customer -> billings, appointments
+--   trainer  -> appointments
+--   billings -> appointments
+--
+-- A write holds the lock on its table's counter row until commit, so
+-- writes to the same table serialize on that row. 006_version_counters.sql
+-- replaces the AFTER triggers with one bump per transaction.
+--
+
+CREATE TABLE IF NOT EXISTS `table_versions` (
+  `table_name` varchar(64) NOT NULL,
+  `version` bigint(20) unsigned NOT NULL DEFAULT 1,
+  PRIMARY KEY (`table_name`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+INSERT IGNORE INTO `table_versions` (`table_name`) VALUES
+('customer'), ('trainer'), ('appointments'), ('billings');
+
+ALTER TABLE `customer` ADD COLUMN `row_version` int(10) unsigned NOT NULL DEFAULT 1 INVISIBLE;
+ALTER TABLE `trainer` ADD COLUMN `row_version` int(10) unsigned NOT NULL DEFAULT 1 INVISIBLE;
+ALTER TABLE `appointments` ADD COLUMN `row_version` int(10) unsigned NOT NULL DEFAULT 1 INVISIBLE;
+ALTER TABLE `billings` ADD COLUMN `row_version` int(10) unsigned NOT NULL DEFAULT 1 INVISIBLE;
+
+-- customer
+CREATE TRIGGER `customer_row_version` BEFORE UPDATE ON `customer`
+  FOR EACH ROW SET NEW.row_version = OLD.row_version + 1;
+CREATE TRIGGER `customer_version_insert` AFTER INSERT ON `customer`
+  FOR EACH ROW UPDATE `table_versions` SET `version` = `version` + 1 WHERE `table_name` = 'customer';
+CREATE TRIGGER `customer_version_update` AFTER UPDATE ON `customer`
+  FOR EACH ROW UPDATE `table_versions` SET `version` = `version` + 1 WHERE `table_name` = 'customer';
+CREATE TRIGGER `customer_version_delete` AFTER DELETE ON `customer`
+  FOR EACH ROW UPDATE `table_versions` SET `version` = `version` + 1
+  WHERE `table_name` IN ('customer', 'billings', 'appointments');
+
+-- trainer
+CREATE TRIGGER `trainer_row_version` BEFORE UPDATE ON `trainer`
+  FOR EACH ROW SET NEW.row_version = OLD.row_version + 1;
+CREATE TRIGGER `trainer_version_insert` AFTER INSERT ON `trainer`
+  FOR EACH ROW UPDATE `table_versions` SET `version` = `version` + 1 WHERE `table_name` = 'trainer';
+CREATE TRIGGER `trainer_version_update` AFTER UPDATE ON `trainer`
+  FOR EACH ROW UPDATE `table_versions` SET `version` = `version` + 1 WHERE `table_name` = 'trainer';
+CREATE TRIGGER `trainer_version_delete` AFTER DELETE ON `trainer`
+  FOR EACH ROW UPDATE `table_versions` SET `version` = `version` + 1
+  WHERE `table_name` IN ('trainer', 'appointments');
+
+-- appointments
+CREATE TRIGGER `appointments_row_version` BEFORE UPDATE ON `appointments`
+  FOR EACH ROW SET NEW.row_version = OLD.row_version + 1;
+CREATE TRIGGER `appointments_version_insert` AFTER INSERT ON `appointments`
+  FOR EACH ROW UPDATE `table_versions` SET `version` = `version` + 1 WHERE `table_name` = 'appointments';
+CREATE TRIGGER `appointments_version_update` AFTER UPDATE ON `appointments`
+  FOR EACH ROW UPDATE `table_versions` SET `version` = `version` + 1 WHERE `table_name` = 'appointments';
+CREATE TRIGGER `appointments_version_delete` AFTER DELETE ON `appointments`
+  FOR EACH ROW UPDATE `table_versions` SET `version` = `version` + 1 WHERE `table_name` = 'appointments';
+
+-- billings
+CREATE TRIGGER `billings_row_version` BEFORE UPDATE ON `billings`
+  FOR EACH ROW SET NEW.row_version = OLD.row_version + 1;
+CREATE TRIGGER `billings_version_insert` AFTER INSERT ON `billings`
+  FOR EACH ROW UPDATE `table_versions` SET `version` = `version` + 1 WHERE `table_name` = 'billings';
+CREATE TRIGGER `billings_version_update` AFTER UPDATE ON `billings`
+  FOR EACH ROW UPDATE `table_versions` SET `version` = `version` + 1 WHERE `table_name` = 'billings';
+CREATE TRIGGER `billings_version_delete` AFTER DELETE ON `billings`
+  FOR EACH ROW UPDATE `table_versions` SET `version` = `version` + 1
+  WHERE `table_name` IN ('billings', 'appointments');
@@ -0,0 +1,73 @@
+--
+-- Daily and monthly revenue rollups for GET /billings/reports
+--
+-- billings and appointments get an INVISIBLE created_at, so `SELECT *`
+-- responses are unchanged. Existing appointments are dated by their
+-- booking_date and existing billings by their latest linked appointment.
+--
+-- revenue_rollups holds one row per (granularity, bucket, membership_type,
+-- spesialisasi); granularity is 'day' or 'month' and bucket is the first
+-- day of the period. Billings carry no trainer and are reported under an
+-- empty spesialisasi; rows of deleted customers or trainers fall under an
+-- empty membership_type or spesialisasi. The services update the rollups
+-- in the same transaction as the billing, appointment, customer or trainer
+-- write (see revenue_rollups.py).
+-- Run `python revenue_rollups.py rebuild` to reconcile them.
+--
+
+ALTER TABLE `billings` ADD COLUMN `created_at` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP INVISIBLE;
+ALTER TABLE `appointments` ADD COLUMN `created_at` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP INVISIBLE;
+
+UPDATE `appointments` SET `created_at` = `booking_date`;
+UPDATE `billings` b
+JOIN (
+  SELECT `billing_id`, MAX(`booking_date`) AS `booked`
+  FROM `appointments` WHERE `billing_id` IS NOT NULL GROUP BY `billing_id`
+) a ON a.`billing_id` = b.`billing_id`
+SET b.`created_at` = a.`booked`;
+
+CREATE TABLE IF NOT EXISTS `revenue_rollups` (
+  `granularity` enum('day','month') NOT NULL,
+  `bucket` date NOT NULL,
+  `membership_type` varchar(50) NOT NULL DEFAULT '',
+  `spesialisasi` varchar(100) NOT NULL DEFAULT '',
+  `revenue` decimal(16,2) NOT NULL DEFAULT 0.00,
+  `billing_count` int(11) NOT NULL DEFAULT 0,
+  `session_count` int(11) NOT NULL DEFAULT 0,
+  PRIMARY KEY (`granularity`, `bucket`, `membership_type`, `spesialisasi`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+-- Rebuilds bump this counter so report ETags change (see etag.py)
+INSERT IGNORE INTO `table_versions` (`table_name`) VALUES ('revenue_rollups');
+
+START TRANSACTION;
+
+DELETE FROM `revenue_rollups`;
+
+INSERT INTO `revenue_rollups`
+  (`granularity`, `bucket`, `membership_type`, `spesialisasi`, `revenue`, `billing_count`, `session_count`)
+SELECT g, d, m, s, SUM(r), SUM(bc), SUM(sc) FROM (
+  SELECT 'day' AS g, DATE(b.`created_at`) AS d, COALESCE(c.`membership_type`, '') AS m, '' AS s,
+         b.`amount` AS r, 1 AS bc, 0 AS sc
+  FROM `billings` b LEFT JOIN `customer` c ON b.`customer_id` = c.`customer_id`
+  UNION ALL
+  SELECT 'month', DATE(b.`created_at`) - INTERVAL DAYOFMONTH(b.`created_at`) - 1 DAY,
+         COALESCE(c.`membership_type`, ''), '', b.`amount`, 1, 0
+  FROM `billings` b LEFT JOIN `customer` c ON b.`customer_id` = c.`customer_id`
+  UNION ALL
+  SELECT 'day', DATE(a.`created_at`), COALESCE(c.`membership_type`, ''), COALESCE(t.`spesialisasi`, ''), 0, 0, 1
+  FROM `appointments` a
+  LEFT JOIN `customer` c ON a.`customer_id` = c.`customer_id`
+  LEFT JOIN `trainer` t ON a.`trainer_id` = t.`trainer_id`
+  WHERE NOT (a.`status` <=> 'cancelled')
+  UNION ALL
+  SELECT 'month', DATE(a.`created_at`) - INTERVAL DAYOFMONTH(a.`created_at`) - 1 DAY,
+         COALESCE(c.`membership_type`, ''), COALESCE(t.`spesialisasi`, ''), 0, 0, 1
+  FROM `appointments` a
+  LEFT JOIN `customer` c ON a.`customer_id` = c.`customer_id`
+  LEFT JOIN `trainer` t ON a.`trainer_id` = t.`trainer_id`
+  WHERE NOT (a.`status` <=> 'cancelled')
+) AS contribution
+GROUP BY g, d, m, s;
+
+COMMIT;
@@ -0,0 +1,35 @@
+--
+-- Bump the table_versions counters once per transaction, not once per row
+--
+-- The AFTER triggers from 004_etags.sql updated a table's counter row for
+-- every row written, inside the writer's transaction: every write to a
+-- table waited on that one row lock until commit, a bulk insert or
+-- group-commit flush updated it once per row, and writes that touch two
+-- tables (a billing created with appointment_ids, a customer delete)
+-- locked the counters in different orders and could deadlock.
+--
+-- The services now bump the counters of every table a transaction changed
+-- with one UPDATE as its last statement (etag.bump_versions()), which
+-- locks them in primary key order and only for the commit. The BEFORE
+-- UPDATE row_version triggers stay; they only touch the row being written.
+--
+-- Writes made outside the services (manual SQL, LOAD DATA) must bump the
+-- counters themselves, or list ETags stay unchanged until the next write:
+--   UPDATE table_versions SET version = version + 1 WHERE table_name IN (...);
+--
+
+DROP TRIGGER IF EXISTS `customer_version_insert`;
+DROP TRIGGER IF EXISTS `customer_version_update`;
+DROP TRIGGER IF EXISTS `customer_version_delete`;
+DROP TRIGGER IF EXISTS `trainer_version_insert`;
+DROP TRIGGER IF EXISTS `trainer_version_update`;
+DROP TRIGGER IF EXISTS `trainer_version_delete`;
+DROP TRIGGER IF EXISTS `appointments_version_insert`;
+DROP TRIGGER IF EXISTS `appointments_version_update`;
+DROP TRIGGER IF EXISTS `appointments_version_delete`;
+DROP TRIGGER IF EXISTS `billings_version_insert`;
+DROP TRIGGER IF EXISTS `billings_version_update`;
+DROP TRIGGER IF EXISTS `billings_version_delete`;
+
+-- Any cached list ETag may predate this migration
+UPDATE `table_versions` SET `version` = `version` + 1;
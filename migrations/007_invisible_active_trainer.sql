@@ -0,0 +1,11 @@
+--
+-- Hide appointments.active_trainer_id from `SELECT *`
+--
+-- 002_trainer_availability.sql meant the generated slot column to be
+-- INVISIBLE but created it visible, so it showed up in appointment
+-- responses. MariaDB 10.4 has no ALTER COLUMN ... SET INVISIBLE, so the
+-- column is redefined with the same expression as in 002.
+--
+
+ALTER TABLE `appointments`
+  MODIFY COLUMN `active_trainer_id` int(11) GENERATED ALWAYS AS (IF(`status` <=> 'cancelled', NULL, `trainer_id`)) STORED INVISIBLE;
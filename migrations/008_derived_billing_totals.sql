@@ -0,0 +1,10 @@
+--
+-- Derive the /billings/stats totals from billing_customer_stats
+--
+-- The single billing_totals row from 001_billing_stats.sql was updated by
+-- every billing write, so its row lock serialized all of them across
+-- processes until commit. The totals are now summed over the per-customer
+-- rows, which GET /billings/stats reads in full anyway.
+--
+
+DROP TABLE IF EXISTS `billing_totals`;
@@ -0,0 +1,116 @@
+import logging
+
+from flask import Response
+from mysql.connector import Error
+from db import get_db_connection
+from serialization import ndjson_line
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 1000
+
+
+def parse_page_args(args):
+    """Read `limit` and `after` from the query string
+
+    Returns (None, None) when neither is given so list endpoints keep
+    returning the plain array. Raises ValueError on invalid values.
+    """
+    if 'limit' not in args and 'after' not in args:
+        return None, None
+
+    try:
+        limit = int(args.get('limit', DEFAULT_LIMIT))
+        after = int(args['after']) if args.get('after') else None
+    except ValueError:
+        raise ValueError("limit and after must be integers")
+
+    if limit < 1 or limit > MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+
+    return limit, after
+
+
+def wants_stream(args):
+    """True when the client asked for an NDJSON export"""
+    return args.get('stream') in ('1', 'true') or args.get('format') == 'ndjson'
+
+
+def keyset_query(query, key_column, after=None, limit=None, conditions=(), params=()):
+    """Append keyset conditions, ordering and limit to a base SELECT"""
+    conditions = list(conditions)
+    params = list(params)
+
+    if after is not None:
+        conditions.append(f"{key_column} > %s")
+        params.append(after)
+
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+
+    query += f" ORDER BY {key_column}"
+
+    if limit is not None:
+        query += " LIMIT %s"
+        params.append(limit)
+
+    return query, tuple(params)
+
+
+def keyset_page(cursor, query, key_column, key_field, limit, after=None, conditions=(), params=()):
+    """Fetch one page ordered by primary key
+
+    One extra row is read to tell whether another page exists; the cursor for
+    the next page is the key of the last row returned.
+    """
+    page_query, page_params = keyset_query(query, key_column, after, limit + 1, conditions, params)
+    cursor.execute(page_query, page_params)
+    return build_page(cursor.fetchall(), key_field, limit)
+
+
+def build_page(rows, key_field, limit):
+    """Trim the look-ahead row and work out the next cursor"""
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1][key_field]
+
+    return {
+        "data": rows,
+        "limit": limit,
+        "next_cursor": next_cursor
+    }
+
+
+def stream_ndjson(query, params=()):
+    """Stream query results as NDJSON from an unbuffered server-side cursor
+
+    Rows are written as they arrive from MySQL, so memory stays constant
+    regardless of the result size.
+    """
+    def generate():
+        conn = None
+        cursor = None
+        finished = False
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(query, params)
+            for row in cursor:
+                yield ndjson_line(row)
+            finished = True
+        except Error as e:
+            logger.error("Database error while streaming: %s", e)
+            yield ndjson_line({"error": str(e)})
+        finally:
+            if conn and not finished:
+                # Unread rows would otherwise be drained before reuse
+                conn.invalidate()
+            else:
+                if cursor:
+                    cursor.close()
+                if conn:
+                    conn.close()
+
+    return Response(generate(), mimetype='application/x-ndjson')
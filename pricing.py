@@ -0,0 +1,235 @@
+"""Session fee rules shared by every billing endpoint
+
+The rules live in pricing.json (or the file named by PRICING_RULES):
+
+    base_fee       fee by the customer's membership_type, with a default
+    specialty_fee  fee by the trainer's spesialisasi, with a default
+    overrides      optional {"membership_type", "spesialisasi", "base_fee",
+                   "specialty_fee"} entries for particular pairs
+
+They are compiled into one table keyed by (membership_type, spesialisasi),
+so pricing a session is a dict lookup. The file is checked for changes at
+most every PRICING_CHECK_INTERVAL seconds; a changed file is compiled in
+full and swapped in with one assignment, so an evaluation sees either the
+old rules or the new ones. A file that fails to load or validate is logged
+and the current rules stay in effect. POST /billings/pricing/reload
+reloads at once.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PRICING_RULES = os.environ.get("PRICING_RULES", os.path.join(os.path.dirname(os.path.abspath(__file__)), "pricing.json"))
+PRICING_CHECK_INTERVAL = float(os.environ.get("PRICING_CHECK_INTERVAL", 5))
+
+# Category values the benchmark seed generates
+PREMIUM_MEMBERSHIP = "Premium"
+STRENGTH_SPECIALTY = "Strength Training"
+
+# Used when the rules file does not exist
+DEFAULT_RULES = {
+    "base_fee": {"default": 150000, "membership_type": {PREMIUM_MEMBERSHIP: 200000}},
+    "specialty_fee": {"default": 30000, "spesialisasi": {STRENGTH_SPECIALTY: 50000}},
+    "overrides": [],
+}
+
+
+def _fee(value, where):
+    if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+        raise ValueError(f"{where} must be a non-negative integer")
+    return value
+
+
+def _fee_map(rules, section, column):
+    part = rules.get(section)
+    if not isinstance(part, dict) or 'default' not in part:
+        raise ValueError(f"{section} must be an object with a default")
+    by_value = part.get(column, {})
+    if not isinstance(by_value, dict):
+        raise ValueError(f"{section}.{column} must be an object")
+    return (
+        _fee(part['default'], f"{section}.default"),
+        {key: _fee(value, f"{section}.{column}.{key}") for key, value in by_value.items()},
+    )
+
+
+class PricingTable:
+    """Compiled fee rules: (membership_type, spesialisasi) -> fees
+
+    Every pair of listed membership types and specialties, including
+    unlisted (default) ones as None, is precomputed; other values fall back
+    to the per-column fees, still in constant time.
+    """
+
+    def __init__(self, rules, source=None, mtime=None):
+        if not isinstance(rules, dict):
+            raise ValueError("pricing rules must be a JSON object")
+        self.rules = rules
+        self.source = source
+        self.mtime = mtime
+        self.loaded_at = time.time()
+        self._base_default, self._base = _fee_map(rules, "base_fee", "membership_type")
+        self._specialty_default, self._specialty = _fee_map(rules, "specialty_fee", "spesialisasi")
+
+        self._fees = {}
+        for membership_type in [None, *self._base]:
+            for spesialisasi in [None, *self._specialty]:
+                self._fees[(membership_type, spesialisasi)] = self._compose(membership_type, spesialisasi)
+
+        overrides = rules.get('overrides', [])
+        if not isinstance(overrides, list):
+            raise ValueError("overrides must be a list")
+        for index, override in enumerate(overrides):
+            if not isinstance(override, dict) or 'membership_type' not in override or 'spesialisasi' not in override:
+                raise ValueError(f"overrides[{index}] must name membership_type and spesialisasi")
+            key = (override['membership_type'], override['spesialisasi'])
+            base_fee, specialty_fee, _ = self._fees.get(key) or self._compose(*key)
+            base_fee = _fee(override.get('base_fee', base_fee), f"overrides[{index}].base_fee")
+            specialty_fee = _fee(override.get('specialty_fee', specialty_fee), f"overrides[{index}].specialty_fee")
+            self._fees[key] = (base_fee, specialty_fee, base_fee + specialty_fee)
+
+    def _compose(self, membership_type, spesialisasi):
+        base_fee = self._base.get(membership_type, self._base_default)
+        specialty_fee = self._specialty.get(spesialisasi, self._specialty_default)
+        return base_fee, specialty_fee, base_fee + specialty_fee
+
+    def fees(self, membership_type, spesialisasi):
+        """Return (base_fee, specialty_fee, total_amount) for one session"""
+        fees = self._fees.get((membership_type, spesialisasi))
+        return fees if fees is not None else self._compose(membership_type, spesialisasi)
+
+    def describe(self):
+        return {
+            "source": self.source,
+            "loaded_at": self.loaded_at,
+            "rules": self.rules,
+            "compiled_pairs": len(self._fees),
+        }
+
+
+def load_table(path=PRICING_RULES):
+    """Compile the rules in `path`, or DEFAULT_RULES if it does not exist
+
+    Raises ValueError if the file is not valid JSON or not valid rules.
+    """
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return PricingTable(DEFAULT_RULES)
+    with open(path, encoding="utf-8") as f:
+        try:
+            rules = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"{path} is not valid JSON: {e}")
+    return PricingTable(rules, path, mtime)
+
+
+class PricingRules:
+    """The current PricingTable, reloaded when its file changes"""
+
+    def __init__(self, path=PRICING_RULES, check_interval=PRICING_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._table = None
+        self._checked_at = 0.0
+        self.reloads = 0
+        self.failures = 0
+
+    def table(self):
+        table = self._table
+        if table is None or time.monotonic() - self._checked_at > self.check_interval:
+            table = self._refresh(table)
+        return table
+
+    def _refresh(self, current):
+        with self._lock:
+            if self._table is not current:
+                # Another thread reloaded meanwhile
+                return self._table
+            self._checked_at = time.monotonic()
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except FileNotFoundError:
+                mtime = None
+            if current is not None and mtime == current.mtime:
+                return current
+            try:
+                self._swap(load_table(self.path))
+            except (OSError, ValueError) as e:
+                if current is None:
+                    raise
+                self.failures += 1
+                logger.error("Keeping the current pricing rules, %s failed to load: %s", self.path, e)
+            return self._table
+
+    def reload(self):
+        """Compile the file now; raises ValueError and keeps the current rules if it is invalid"""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                self._swap(load_table(self.path))
+            except (OSError, ValueError):
+                self.failures += 1
+                raise
+            return self._table
+
+    def _swap(self, table):
+        self._table = table
+        self.reloads += 1
+        logger.info("Loaded pricing rules from %s", table.source or "defaults")
+
+    def stats(self):
+        table = self._table
+        return {
+            **(table.describe() if table else {}),
+            "check_interval": self.check_interval,
+            "reloads": self.reloads,
+            "failures": self.failures,
+        }
+
+
+rules = PricingRules()
+
+
+def calculate_fees(membership_type, spesialisasi):
+    """Return (base_fee, specialty_fee, total_amount) for one session"""
+    return rules.table().fees(membership_type, spesialisasi)
+
+
+def quote_pairs(pairs, customers, trainers):
+    """Price many customer/trainer pairs in a single pass, yielding one quote per pair
+
+    `customers` and `trainers` map IDs to rows already loaded in bulk. Pairs
+    that reference an unknown customer or trainer get an error entry instead.
+    """
+    # One table for the whole batch, even if the rules are reloaded meanwhile
+    table = rules.table()
+    for index, pair in enumerate(pairs):
+        customer = customers.get(pair['customer_id'])
+        trainer = trainers.get(pair['trainer_id'])
+        if not customer:
+            yield {"index": index, "error": f"Customer with ID {pair['customer_id']} not found"}
+            continue
+        if not trainer:
+            yield {"index": index, "error": f"Trainer with ID {pair['trainer_id']} not found"}
+            continue
+
+        base_fee, specialty_fee, total_amount = table.fees(customer['membership_type'], trainer['spesialisasi'])
+
+        yield {
+            "index": index,
+            "customer_id": customer['customer_id'],
+            "customer_name": customer['name'],
+            "membership_type": customer['membership_type'],
+            "trainer_id": trainer['trainer_id'],
+            "trainer_name": trainer['name'],
+            "trainer_specialty": trainer['spesialisasi'],
+            "base_fee": base_fee,
+            "specialty_fee": specialty_fee,
+            "total_amount": total_amount
+        }
@@ -0,0 +1,289 @@
+import sys
+import logging
+from datetime import date
+
+from mysql.connector import Error
+from db import get_db_connection
+from bulk import placeholders
+from etag import bump_versions
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = ("day", "month")
+
+# Bucket start for a DATETIME column; month buckets are the 1st of the month
+BUCKET_EXPRESSIONS = {
+    "day": "DATE({column})",
+    "month": "DATE({column}) - INTERVAL DAYOFMONTH({column}) - 1 DAY",
+}
+
+# Rows of the revenue_rollups table from migrations/005_revenue_rollups.sql.
+# Every statement adds the signed contribution of some billings or
+# appointments, read from the rows themselves so buckets always match their
+# created_at. Callers subtract a row's contribution before changing it and
+# add it back afterwards, in the write's transaction. The derived table's
+# columns get short aliases so the UPDATE clause never sees two columns
+# with the same name.
+UPSERT_QUERY = """
+    INSERT INTO revenue_rollups
+        (granularity, bucket, membership_type, spesialisasi, revenue, billing_count, session_count)
+    SELECT * FROM ({selects}) AS contribution
+    ON DUPLICATE KEY UPDATE
+        revenue = revenue_rollups.revenue + VALUES(revenue),
+        billing_count = revenue_rollups.billing_count + VALUES(billing_count),
+        session_count = revenue_rollups.session_count + VALUES(session_count)
+"""
+
+# Billings carry no trainer, so revenue is reported with an empty specialty
+BILLING_SELECT = """
+    SELECT '{granularity}' AS g, {bucket} AS d, COALESCE(c.membership_type, '') AS m, '' AS s,
+           %s * SUM(b.amount) AS r, %s * COUNT(*) AS bc, 0 AS sc
+    FROM billings b
+    LEFT JOIN customer c ON b.customer_id = c.customer_id
+    WHERE {condition}
+    GROUP BY 2, 3
+"""
+
+# Cancelled appointments are not sessions
+SESSION_SELECT = """
+    SELECT '{granularity}' AS g, {bucket} AS d, {membership} AS m, {spesialisasi} AS s,
+           0 AS r, 0 AS bc, %s * COUNT(*) AS sc
+    FROM appointments a
+    LEFT JOIN customer c ON a.customer_id = c.customer_id
+    LEFT JOIN trainer t ON a.trainer_id = t.trainer_id
+    WHERE NOT (a.status <=> 'cancelled') AND {condition}
+    GROUP BY 2, 3, 4
+"""
+
+# Appointment columns whose change moves or drops a session
+SESSION_FIELDS = ("customer_id", "trainer_id", "status")
+
+MEMBERSHIP = "COALESCE(c.membership_type, '')"
+SPESIALISASI = "COALESCE(t.spesialisasi, '')"
+
+REPORT_QUERY = """
+    SELECT bucket, membership_type, spesialisasi,
+           revenue, billing_count, session_count
+    FROM revenue_rollups
+    WHERE granularity = %s AND bucket BETWEEN %s AND %s
+      AND (billing_count <> 0 OR session_count <> 0)
+    ORDER BY bucket, membership_type, spesialisasi
+"""
+
+# Widest ranges served; a month report over 10 years is 120 buckets
+MAX_DAYS = 366 * 2
+MAX_MONTHS = 12 * 10
+
+
+def _billing_selects(condition, sign):
+    return [
+        (BILLING_SELECT.format(
+            granularity=granularity,
+            bucket=BUCKET_EXPRESSIONS[granularity].format(column="b.created_at"),
+            condition=condition
+        ), (sign, sign))
+        for granularity in GRANULARITIES
+    ]
+
+
+def _session_selects(condition, sign, customer_gone=False, trainer_gone=False):
+    return [
+        (SESSION_SELECT.format(
+            granularity=granularity,
+            bucket=BUCKET_EXPRESSIONS[granularity].format(column="a.created_at"),
+            membership="''" if customer_gone else MEMBERSHIP,
+            spesialisasi="''" if trainer_gone else SPESIALISASI,
+            condition=condition
+        ), (sign,))
+        for granularity in GRANULARITIES
+    ]
+
+
+def _statement(parts, params):
+    """One upsert for a list of (select, sign params), each filtered by `params`"""
+    selects = " UNION ALL ".join(select for select, _ in parts)
+    values = []
+    for _, signs in parts:
+        values.extend(signs)
+        values.extend(params)
+    return UPSERT_QUERY.format(selects=selects), tuple(values)
+
+
+def billing_statement(billing_id, sign):
+    """Add (sign=1) or subtract (sign=-1) one billing's revenue"""
+    return _statement(_billing_selects("b.billing_id = %s", sign), (billing_id,))
+
+
+def session_statement(appointment_ids, sign):
+    """Add or subtract the sessions of the given appointments"""
+    condition = f"a.appointment_id IN ({placeholders(len(appointment_ids))})"
+    return _statement(_session_selects(condition, sign), tuple(appointment_ids))
+
+
+def customer_statement(customer_id, sign):
+    """Add or subtract everything attributed to a customer, e.g. around a membership change"""
+    parts = _billing_selects("b.customer_id = %s", sign) + _session_selects("a.customer_id = %s", sign)
+    return _statement(parts, (customer_id,))
+
+
+def trainer_statement(trainer_id, sign):
+    """Add or subtract a trainer's sessions, e.g. around a specialty change"""
+    return _statement(_session_selects("a.trainer_id = %s", sign), (trainer_id,))
+
+
+def remove_customer_statement(customer_id):
+    """Run before a customer delete: drop their revenue and move their sessions to no membership
+
+    The delete cascades to billings and sets customer_id to NULL on
+    appointments; neither fires any application code.
+    """
+    parts = (
+        _billing_selects("b.customer_id = %s", -1)
+        + _session_selects("a.customer_id = %s", -1)
+        + _session_selects("a.customer_id = %s", 1, customer_gone=True)
+    )
+    return _statement(parts, (customer_id,))
+
+
+def remove_trainer_statement(trainer_id):
+    """Run before a trainer delete: move their sessions to no specialty"""
+    parts = _session_selects("a.trainer_id = %s", -1) + _session_selects("a.trainer_id = %s", 1, trainer_gone=True)
+    return _statement(parts, (trainer_id,))
+
+
+def apply(cursor, statement):
+    """Run one rollup statement inside the caller's transaction"""
+    cursor.execute(*statement)
+
+
+def add_sessions(cursor, appointment_ids):
+    """Count newly inserted appointments, e.g. as a group commit's after_insert"""
+    apply(cursor, session_statement(appointment_ids, 1))
+
+
+def parse_bucket(value, granularity):
+    """Read YYYY-MM-DD (or YYYY-MM for months) as the start of its bucket"""
+    if granularity == "month" and len(value) == 7:
+        value += "-01"
+    parsed = date.fromisoformat(value)
+    return parsed.replace(day=1) if granularity == "month" else parsed
+
+
+def report_args(args, today=None):
+    """Validate `granularity`, `from` and `to` of GET /billings/reports
+
+    Returns (granularity, start, end); the range defaults to the last 30
+    days or 12 months. Raises ValueError on invalid input.
+    """
+    granularity = args.get('granularity', 'day')
+    if granularity not in GRANULARITIES:
+        raise ValueError("granularity must be 'day' or 'month'")
+
+    today = today or date.today()
+    try:
+        end = parse_bucket(args['to'], granularity) if args.get('to') else parse_bucket(today.isoformat(), granularity)
+        if args.get('from'):
+            start = parse_bucket(args['from'], granularity)
+        elif granularity == "day":
+            start = date.fromordinal(end.toordinal() - 29)
+        else:
+            months = end.year * 12 + end.month - 1 - 11
+            start = date(months // 12, months % 12 + 1, 1)
+    except ValueError:
+        raise ValueError("from and to must be dates as YYYY-MM-DD (or YYYY-MM for months)")
+
+    if start > end:
+        raise ValueError("from must not be after to")
+    if granularity == "day" and (end - start).days >= MAX_DAYS:
+        raise ValueError(f"A daily report may span at most {MAX_DAYS} days")
+    if granularity == "month" and (end.year - start.year) * 12 + end.month - start.month >= MAX_MONTHS:
+        raise ValueError(f"A monthly report may span at most {MAX_MONTHS} months")
+
+    return granularity, start, end
+
+
+def report_statement(granularity, start, end):
+    return REPORT_QUERY, (granularity, start, end)
+
+
+def format_report(granularity, start, end, rows):
+    """Shape rollup rows (dictionaries) for the response, with totals"""
+    data = []
+    totals = {"revenue": 0, "billing_count": 0, "session_count": 0}
+    for row in rows:
+        data.append({
+            "bucket": row['bucket'],
+            "membership_type": row['membership_type'] or None,
+            "spesialisasi": row['spesialisasi'] or None,
+            "revenue": row['revenue'],
+            "billing_count": row['billing_count'],
+            "session_count": row['session_count'],
+        })
+        for field in totals:
+            totals[field] += row[field]
+
+    return {
+        "granularity": granularity,
+        "from": start,
+        "to": end,
+        "data": data,
+        "totals": totals
+    }
+
+
+def read_report(cursor, granularity, start, end):
+    """Read one report from the rollups (a dictionary cursor is expected)"""
+    cursor.execute(*report_statement(granularity, start, end))
+    return format_report(granularity, start, end, cursor.fetchall())
+
+
+def rebuild_statements():
+    """Statements recomputing the rollups, run in order in one transaction
+
+    The row count of the last one is the number of rollup rows. The caller
+    then bumps the revenue_rollups counter, since report ETags otherwise
+    only follow the source tables.
+    """
+    return [
+        # Lock both sources against concurrent writers while recounting
+        ("SELECT COUNT(*) FROM billings LOCK IN SHARE MODE", ()),
+        ("SELECT COUNT(*) FROM appointments LOCK IN SHARE MODE", ()),
+        ("DELETE FROM revenue_rollups", ()),
+        _statement(_billing_selects("TRUE", 1) + _session_selects("TRUE", 1), ()),
+    ]
+
+
+def rebuild(conn):
+    """Recompute the rollups from billings and appointments in one transaction"""
+    cursor = conn.cursor()
+    try:
+        conn.start_transaction()
+        for query, params in rebuild_statements():
+            cursor.execute(query, params)
+            if cursor.with_rows:
+                cursor.fetchall()
+        rows = cursor.rowcount
+        bump_versions(cursor, "revenue_rollups")
+        conn.commit()
+        return rows
+    finally:
+        cursor.close()
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] != ['rebuild']:
+        print("Usage: python revenue_rollups.py rebuild")
+        sys.exit(2)
+
+    logging.basicConfig(level=logging.INFO)
+    conn = None
+    try:
+        conn = get_db_connection()
+        rows = rebuild(conn)
+        logger.info("Rebuilt revenue rollups with %s rows", rows)
+    except Error as e:
+        logger.error("Database error: %s", e)
+        sys.exit(1)
+    finally:
+        if conn:
+            conn.close()
@@ -0,0 +1,68 @@
+"""Start one of the gym services with either the sync or the async build
+
+    python run.py customer                 # Flask + mysql-connector (default)
+    python run.py billing --impl async     # Quart + aiomysql under Hypercorn
+    python run.py all                      # all four services in one process
+
+SERVICE_IMPL=async in the environment selects the async build as well.
+Install the pinned dependencies of both builds with
+`pip install -r requirements.txt`.
+"""
+import argparse
+import importlib
+import os
+
+SERVICES = {
+    "customer": ("CustomerService", "AsyncCustomerService", 5000),
+    "trainer": ("TrainerService", "AsyncTrainerService", 5001),
+    "appointment": ("AppointmentService", "AsyncAppointmentService", 5002),
+    "billing": ("BillingService", "AsyncBillingService", 5003),
+}
+
+
+# Port used when every service is served from one process
+CONSOLIDATED_PORT = 5000
+
+
+def load_app(service, impl):
+    if service == "all":
+        from gateway import create_app
+        return create_app(impl)
+
+    sync_module, async_module, _ = SERVICES[service]
+    module = importlib.import_module(async_module if impl == "async" else sync_module)
+    return module.app
+
+
+def serve_async(app, host, port):
+    import asyncio
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    config = Config()
+    config.bind = [f"{host}:{port}"]
+    asyncio.run(serve(app, config))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a gym service")
+    parser.add_argument("service", choices=sorted(SERVICES) + ["all"])
+    parser.add_argument("--impl", choices=["sync", "async"], default=os.environ.get("SERVICE_IMPL", "sync"))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int)
+    args = parser.parse_args()
+
+    port = args.port or (CONSOLIDATED_PORT if args.service == "all" else SERVICES[args.service][2])
+    app = load_app(args.service, args.impl)
+
+    if args.impl == "async":
+        serve_async(app, args.host, port)
+    elif args.service == "all":
+        from werkzeug.serving import run_simple
+        run_simple(args.host, port, app, threaded=True)
+    else:
+        app.run(host=args.host, port=port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Shared JSON encoding for all services
+
+Dates and datetimes are written as ISO 8601 strings and Decimals as
+strings, exact and as Flask's default provider writes them, so handlers
+can return database rows as they are. orjson is used
+when installed; otherwise the standard library encoder is used with the
+same output types.
+"""
+import json
+from datetime import date
+from decimal import Decimal
+
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def default(value):
+    """Encode the types the JSON encoders do not handle themselves"""
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    # Keys stay sorted like Flask's default provider, so responses are unchanged
+    _OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj):
+        """Serialize `obj` to UTF-8 JSON bytes"""
+        return orjson.dumps(obj, default=default, option=_OPTIONS)
+
+    loads = orjson.loads
+else:
+    def dumps(obj):
+        """Serialize `obj` to UTF-8 JSON bytes"""
+        return json.dumps(obj, default=default, sort_keys=True, separators=(",", ":")).encode()
+
+    loads = json.loads
+
+
+def ndjson_line(obj):
+    """One NDJSON record as text"""
+    return dumps(obj).decode() + "\n"
+
+
+class FastJSONProvider(JSONProvider):
+    """Flask/Quart JSON provider backed by dumps()/loads()"""
+
+    mimetype = "application/json"
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj), mimetype=self.mimetype)
+
+
+def init_app(app):
+    """Use the shared encoder for jsonify() and request.json on `app`"""
+    app.json = FastJSONProvider(app)
+    return app
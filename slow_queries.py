@@ -0,0 +1,182 @@
+"""Slow-query log with sampled EXPLAIN plans
+
+The cursors from db.py and async_db.py report every statement that takes at
+least SLOW_QUERY_MS milliseconds. Each one is kept in a ring buffer (served
+at /slow-queries by every service) and, when SLOW_QUERY_LOG_FILE is set,
+appended to a size-rotated NDJSON file. Parameters are redacted: numbers,
+dates and NULLs are kept so the query can be reproduced, strings are
+replaced by their type and length.
+
+A SLOW_QUERY_EXPLAIN_RATE share of slow SELECTs is EXPLAINed on a
+background thread with its own connection, so neither the request nor its
+pooled connection waits for the plan.
+"""
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+from datetime import date, datetime
+from decimal import Decimal
+from logging.handlers import RotatingFileHandler
+
+import mysql.connector
+from mysql.connector import Error
+
+import metrics
+from logging_setup import current_route
+from serialization import ndjson_line
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 200))
+# Seconds; SLOW_QUERY_MS=0 turns the log off
+SLOW_QUERY_THRESHOLD = SLOW_QUERY_MS / 1000 if SLOW_QUERY_MS > 0 else float("inf")
+SLOW_QUERY_EXPLAIN_RATE = float(os.environ.get("SLOW_QUERY_EXPLAIN_RATE", 0.1))
+SLOW_QUERY_LOG_SIZE = int(os.environ.get("SLOW_QUERY_LOG_SIZE", 200))
+SLOW_QUERY_LOG_FILE = os.environ.get("SLOW_QUERY_LOG_FILE")
+SLOW_QUERY_LOG_MAX_BYTES = int(os.environ.get("SLOW_QUERY_LOG_MAX_BYTES", 10 * 1024 * 1024))
+SLOW_QUERY_LOG_BACKUPS = int(os.environ.get("SLOW_QUERY_LOG_BACKUPS", 5))
+
+# Longer parameter lists (bulk IN queries) are cut to this many values
+MAX_PARAMS = 20
+MAX_SQL_LENGTH = 4000
+
+_entries = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+_lock = threading.Lock()
+_recorded = 0
+_explained = 0
+
+# Plans waiting for the EXPLAIN thread; full means the sample is skipped
+_explain_queue = queue.Queue(maxsize=100)
+_explain_thread = None
+
+_file_logger = None
+if SLOW_QUERY_LOG_FILE:
+    _file_logger = logging.getLogger("slow_queries.file")
+    _file_logger.propagate = False
+    _file_logger.setLevel(logging.INFO)
+    _handler = RotatingFileHandler(
+        SLOW_QUERY_LOG_FILE, maxBytes=SLOW_QUERY_LOG_MAX_BYTES, backupCount=SLOW_QUERY_LOG_BACKUPS
+    )
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    _file_logger.addHandler(_handler)
+
+
+def _redact_value(value):
+    if value is None or isinstance(value, (bool, int, float, Decimal, date)):
+        return value
+    return f"<{type(value).__name__}:{len(str(value))}>"
+
+
+def redact(params):
+    """Parameters safe to log: numbers and dates as they are, strings masked"""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: _redact_value(value) for key, value in params.items()}
+    values = list(params)
+    redacted = [_redact_value(value) for value in values[:MAX_PARAMS]]
+    if len(values) > MAX_PARAMS:
+        redacted.append(f"... {len(values) - MAX_PARAMS} more")
+    return redacted
+
+
+def _explainable(sql):
+    statement = sql.lstrip()[:6].upper()
+    upper = sql.upper()
+    return statement == "SELECT" and "FOR UPDATE" not in upper and "LOCK IN SHARE MODE" not in upper
+
+
+def record(sql, params, seconds, rowcount=None, failed=False):
+    """Log one statement that ran for at least SLOW_QUERY_THRESHOLD seconds"""
+    global _recorded
+    entry = {
+        "time": datetime.now().isoformat(timespec="milliseconds"),
+        "query": metrics.query_name(sql),
+        "sql": " ".join(sql.split())[:MAX_SQL_LENGTH],
+        "params": redact(params),
+        "duration_ms": round(seconds * 1000, 3),
+        "rows": rowcount if rowcount is not None and rowcount >= 0 else None,
+        "route": current_route(),
+        "failed": failed,
+    }
+    with _lock:
+        _entries.append(entry)
+        _recorded += 1
+
+    logger.warning("Slow query (%s ms, %s): %s", entry['duration_ms'], entry['route'], entry['query'])
+
+    if not failed and random.random() < SLOW_QUERY_EXPLAIN_RATE and _explainable(sql):
+        _start_explain_thread()
+        try:
+            _explain_queue.put_nowait((entry, sql, params))
+            return
+        except queue.Full:
+            pass
+    _write(entry)
+
+
+def _write(entry):
+    if _file_logger is not None:
+        _file_logger.info(ndjson_line(entry).rstrip("\n"))
+
+
+def _start_explain_thread():
+    global _explain_thread
+    if _explain_thread is None:
+        with _lock:
+            if _explain_thread is None:
+                _explain_thread = threading.Thread(target=_explain_worker, name="slow-query-explain", daemon=True)
+                _explain_thread.start()
+
+
+def _explain_worker():
+    global _explained
+    from db import DB_CONFIG
+
+    conn = None
+    while True:
+        entry, sql, params = _explain_queue.get()
+        started = time.monotonic()
+        try:
+            if conn is None:
+                conn = mysql.connector.connect(**DB_CONFIG)
+            cursor = conn.cursor(dictionary=True)
+            try:
+                cursor.execute("EXPLAIN " + sql, params)
+                plan = cursor.fetchall()
+            finally:
+                cursor.close()
+            conn.rollback()
+        except Error as e:
+            logger.warning("EXPLAIN of slow query failed: %s", e)
+            plan = {"error": str(e)}
+            if conn is not None:
+                try:
+                    conn.close()
+                except Error:
+                    pass
+                conn = None
+
+        with _lock:
+            entry["explain"] = plan
+            entry["explain_ms"] = round((time.monotonic() - started) * 1000, 3)
+            _explained += 1
+        _write(entry)
+
+
+def recent(limit=None):
+    """Most recent slow queries, newest first"""
+    with _lock:
+        entries = [dict(entry) for entry in reversed(_entries)]
+        recorded, explained = _recorded, _explained
+    return {
+        "threshold_ms": SLOW_QUERY_MS if SLOW_QUERY_MS > 0 else None,
+        "explain_rate": SLOW_QUERY_EXPLAIN_RATE,
+        "recorded": recorded,
+        "explained": explained,
+        "queries": entries[:limit] if limit else entries,
+    }
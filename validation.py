@@ -0,0 +1,96 @@
+from datetime import date
+
+# Required fields per entity, shared by the single-row, bulk and import paths
+CUSTOMER_FIELDS = ['name', 'email', 'no_telp', 'alamat', 'membership_type']
+TRAINER_FIELDS = ['name', 'email', 'no_telp', 'spesialisasi']
+APPOINTMENT_FIELDS = ['customer_id', 'trainer_id', 'booking_date', 'status']
+
+# Entity and request field behind each foreign key, for "not found" errors
+APPOINTMENT_FOREIGN_KEYS = {
+    'fk_appointments_customer': ("Customer", 'customer_id'),
+    'fk_appointments_trainer': ("Trainer", 'trainer_id'),
+    'fk_appointments_billing': ("Billing record", 'billing_id'),
+}
+BILLING_FOREIGN_KEYS = {
+    'fk_billings_customer': ("Customer", 'customer_id'),
+}
+
+
+def missing_fields(data, required_fields):
+    return [field for field in required_fields if field not in data]
+
+
+def validate_batch(items, required_fields):
+    """Check every item of a bulk payload, returning a list of per-item errors"""
+    errors = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append({"index": index, "error": "Item must be an object"})
+            continue
+        missing = missing_fields(item, required_fields)
+        if missing:
+            errors.append({"index": index, "error": f"Missing required fields: {', '.join(missing)}"})
+    return errors
+
+
+def to_id(value):
+    """`value` as an integer ID, or None if it is not one
+
+    Numeric strings are accepted, as the single-row routes (where MySQL
+    converts them) do.
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    return None
+
+
+def coerce_ids(items, id_fields):
+    """Convert the ID fields of every item to int in place, returning a list of per-item errors"""
+    errors = []
+    for index, item in enumerate(items):
+        bad = []
+        for field in id_fields:
+            value = to_id(item[field])
+            if value is None:
+                bad.append(field)
+            else:
+                item[field] = value
+        if bad:
+            noun = "an integer ID" if len(bad) == 1 else "integer IDs"
+            errors.append({"index": index, "error": f"{' and '.join(bad)} must be {noun}"})
+    return errors
+
+
+def appointment_filters(args):
+    """Turn the `from`, `to` and `status` query parameters into SQL conditions
+
+    `from`/`to` are inclusive YYYY-MM-DD bounds on booking_date and `status`
+    may list several values separated by commas. Returns (conditions,
+    params) for the `a` appointments alias; raises ValueError on bad input.
+    """
+    conditions = []
+    params = []
+    bounds = {}
+
+    for arg, operator in (('from', '>='), ('to', '<=')):
+        if args.get(arg):
+            try:
+                bounds[arg] = date.fromisoformat(args[arg])
+            except ValueError:
+                raise ValueError(f"{arg} must be a date in YYYY-MM-DD format")
+            conditions.append(f"a.booking_date {operator} %s")
+            params.append(bounds[arg])
+
+    if 'from' in bounds and 'to' in bounds and bounds['from'] > bounds['to']:
+        raise ValueError("from must not be after to")
+
+    statuses = [status.strip() for status in args.get('status', '').split(',') if status.strip()]
+    if statuses:
+        conditions.append(f"a.status IN ({', '.join(['%s'] * len(statuses))})")
+        params.extend(statuses)
+
+    return conditions, params